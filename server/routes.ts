@@ -7,6 +7,7 @@ import { manualCleanup } from "./file-cleanup";
 import multer from "multer";
 import path from "path";
 import fs from "fs-extra";
+import { randomUUID } from "crypto";
 
 // Configure multer for file uploads - 直接上傳到對應目錄
 const upload = multer({
@@ -760,10 +761,26 @@ export async function registerRoutes(app: Express): Promise<Server> {
               break;
               
             case "fishtts":
-              serviceId = "service4";
+              serviceId = "service5";
               voiceConfig = {
                 voice: contentData.ttsModel || "default"
               };
+
+              // Fish Speech 以參考音頻克隆聲音：ttsModel 為聲音模型 ID 時傳入其訓練音頻
+              try {
+                const fishVoiceModel = /^\d+$/.test(contentData.ttsModel || "") ? await storage.getModel(parseInt(contentData.ttsModel!, 10)) : undefined;
+                if (fishVoiceModel && fishVoiceModel.type === "voice" && fishVoiceModel.trainingFiles && fishVoiceModel.trainingFiles.length > 0) {
+                  voiceConfig = {
+                    reference_audio: `/data/models/${fishVoiceModel.trainingFiles[0]}`,
+                    trainingFiles: fishVoiceModel.trainingFiles
+                  };
+                  console.log(`🐟 Fish Speech 參考音頻: ${fishVoiceModel.name} (${fishVoiceModel.trainingFiles[0]})`);
+                } else {
+                  console.warn(`⚠️ Fish Speech 找不到聲音模型 ${contentData.ttsModel} 的參考音頻，使用預設聲音`);
+                }
+              } catch (error) {
+                console.error(`❌ 獲取 Fish Speech 聲音模型失敗: ${error}`);
+              }
               break;
               
             case "voai":
@@ -1826,15 +1843,33 @@ export async function registerRoutes(app: Express): Promise<Server> {
     try {
       console.log('🎤 收到 TTS 生成請求:', req.body);
       
-      // 代理請求到 TTS 服務
+      // 代理請求到 TTS 服務 (轉發截止時間、租戶與 Idempotency-Key 標頭)
+      const proxyHeaders: Record<string, string> = {
+        'Content-Type': 'application/json',
+      };
+      for (const header of ['x-request-deadline', 'x-request-timeout', 'x-api-key', 'x-tenant-id', 'idempotency-key']) {
+        const value = req.get(header);
+        if (value) {
+          proxyHeaders[header] = value;
+        }
+      }
+      // 請求 ID 貫穿 Node 與 TTS Gateway 的日誌
+      const requestId = req.get('x-request-id') || randomUUID();
+      proxyHeaders['x-request-id'] = requestId;
+      
       const ttsResponse = await fetch('http://heygem-tts-services:8080/api/tts/generate', {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
+        headers: proxyHeaders,
         body: JSON.stringify(req.body)
       });
       
+      const serverTiming = ttsResponse.headers.get('Server-Timing');
+      console.log(`⏱️ TTS 請求 ${requestId}: ${serverTiming || '無 Server-Timing'}`);
+      res.setHeader('X-Request-ID', requestId);
+      if (serverTiming) {
+        res.setHeader('Server-Timing', serverTiming);
+      }
+      
       if (!ttsResponse.ok) {
         const errorText = await ttsResponse.text();
         console.error(`TTS 服務錯誤: ${ttsResponse.status} - ${errorText}`);
@@ -1881,7 +1916,7 @@ export async function registerRoutes(app: Express): Promise<Server> {
         
         // 設置 CORS 頭
         res.setHeader('Access-Control-Allow-Origin', '*');
-        res.setHeader('Access-Control-Expose-Headers', 'X-Filename,X-Service,X-Duration,X-Audio-Format,X-Audio-Path');
+        res.setHeader('Access-Control-Expose-Headers', 'X-Filename,X-Service,X-Duration,X-Audio-Format,X-Audio-Path,X-Request-ID,Server-Timing');
         
         res.send(audioData);
       } else {
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+固定 RPS 負載產生器
+
+以開放迴圈 (open-loop) 方式送出請求：每個請求依排程時間送出，不等待前一個請求完成，
+Gateway 變慢時延遲會如實累積，而不是被客戶端降速掩蓋。
+同時取樣 Gateway 行程的 CPU 與 RSS (讀取 /proc，僅限 Linux)。
+
+用法:
+    python -m benchmarks.loadgen --url http://127.0.0.1:18080 --service service2 --rps 20 --duration 30 --pid <gateway pid>
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+SAMPLE_TEXT = "歡迎使用語音合成服務，今天的天氣晴朗，適合外出走走。"
+
+
+def make_text(chars: int) -> str:
+    return (SAMPLE_TEXT * (chars // len(SAMPLE_TEXT) + 1))[:chars]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ProcessSampler:
+    """定期讀取 /proc/<pid> 的 CPU 時間 (含已結束的子行程，例如 ffmpeg) 與 RSS"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._task: Optional[asyncio.Task] = None
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime, stime, cutime, cstime
+        return sum(int(value) for value in fields[11:15]) / self._ticks
+
+    def _rss_mb(self) -> float:
+        with open(f"/proc/{self.pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    async def _run(self):
+        last_cpu, last_at = self._cpu_seconds(), time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu, now = self._cpu_seconds(), time.monotonic()
+            self.cpu_percent.append((cpu - last_cpu) / (now - last_at) * 100)
+            self.rss_mb.append(self._rss_mb())
+            last_cpu, last_at = cpu, now
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, OSError):
+                pass
+
+    def summary(self) -> Dict[str, Any]:
+        def _stats(values: List[float]) -> Dict[str, Optional[float]]:
+            if not values:
+                return {"avg": None, "max": None}
+            return {"avg": round(sum(values) / len(values), 1), "max": round(max(values), 1)}
+        return {"cpu_percent": _stats(self.cpu_percent), "rss_mb": _stats(self.rss_mb)}
+
+
+async def run_load(
+    url: str,
+    payload: Dict[str, Any],
+    rps: float,
+    duration: float,
+    endpoint: str = "/api/tts/generate",
+    timeout: float = 60,
+    max_in_flight: int = 1000,
+    pid: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    以固定 RPS 送出 duration 秒的請求，返回延遲、吞吐量與資源使用報告
+
+    Args:
+        max_in_flight: 同時進行中的請求上限，超過時該次排程記為 skipped (避免壓測端本身失控)
+    """
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    total_bytes = 0
+    skipped = 0
+    in_flight: set = set()
+
+    sampler = ProcessSampler(pid) if pid else None
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+
+        async def one_request():
+            nonlocal total_bytes
+            started = time.monotonic()
+            try:
+                async with session.post(f"{url}{endpoint}", json=payload) as response:
+                    body = await response.read()
+                    statuses[response.status] += 1
+                    if response.status == 200:
+                        latencies.append(time.monotonic() - started)
+                        total_bytes += len(body)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+
+        if sampler:
+            sampler.start()
+        started = time.monotonic()
+        total = int(rps * duration)
+        for index in range(total):
+            delay = started + index / rps - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                skipped += 1
+                continue
+            task = asyncio.create_task(one_request())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(list(in_flight))
+        elapsed = time.monotonic() - started
+        if sampler:
+            await sampler.stop()
+
+    ok = statuses.get(200, 0)
+    report = {
+        "endpoint": endpoint,
+        "target_rps": rps,
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "ok": ok,
+        "skipped": skipped,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "client_errors": dict(errors),
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 50)),
+            "p95": _ms(percentile(latencies, 95)),
+            "p99": _ms(percentile(latencies, 99)),
+            "max": _ms(max(latencies) if latencies else None),
+            "mean": _ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+        "audio_mb": round(total_bytes / 1024 / 1024, 2),
+    }
+    if sampler:
+        report.update(sampler.summary())
+    return report
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS Gateway 固定 RPS 負載產生器")
+    parser.add_argument("--url", default="http://127.0.0.1:18080")
+    parser.add_argument("--endpoint", default="/api/tts/generate")
+    parser.add_argument("--service", default="service2")
+    parser.add_argument("--chars", type=int, default=50, help="每個請求的文字長度")
+    parser.add_argument("--voice-config", default="{}", help="voice_config (JSON)")
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--pid", type=int, help="Gateway 行程 PID，提供時回報 CPU 與 RSS")
+    args = parser.parse_args()
+
+    payload = {"text": make_text(args.chars), "service": args.service, "voice_config": json.loads(args.voice_config)}
+    report = asyncio.run(run_load(
+        args.url, payload, args.rps, args.duration,
+        endpoint=args.endpoint, timeout=args.timeout, pid=args.pid
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+音頻熱點函式的微基準測試
+
+每個案例以 10 / 100 / 1,000 / 10,000 字的輸入量測：
+- 時間: 自動決定每輪呼叫次數 (每輪至少 min_time 秒)，重複數輪取中位數與最小值
+- 記憶體: 以 tracemalloc 量測單次呼叫的峰值配置與呼叫後仍保留的配置 (numpy 陣列同樣會被追蹤)
+
+模擬音頻中的 asyncio.sleep (模擬處理時間) 在量測時略過，只量測計算本身。
+
+用法:
+    python -m benchmarks.micro run                                        # 全部案例，結果寫入 benchmarks/results/
+    python -m benchmarks.micro run --only ssml pcm_to_wav --sizes 10 1000
+    python -m benchmarks.micro run --save-baseline benchmarks/baselines/micro.json
+    python -m benchmarks.micro compare benchmarks/baselines/micro.json benchmarks/results/micro-xxx.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+SAMPLE_TEXT = "歡迎使用語音合成服務，今天的天氣晴朗，適合外出走走。Hello & <welcome>!"
+
+
+def make_text(chars: int) -> str:
+    return (SAMPLE_TEXT * (chars // len(SAMPLE_TEXT) + 1))[:chars]
+
+
+class Case:
+    """
+    Args:
+        name: 案例名稱
+        setup: setup(chars) 返回無參數的呼叫 (同步函式或返回協程的函式)
+        requires: 需要的外部程式 (例如 ffmpeg)，不存在時略過
+    """
+
+    def __init__(self, name: str, setup: Callable[[int], Callable[[], Any]], description: str, requires: Optional[str] = None):
+        self.name = name
+        self.setup = setup
+        self.description = description
+        self.requires = requires
+
+
+CASES: List[Case] = []
+
+
+def case(name: str, description: str, requires: Optional[str] = None):
+    def register(setup):
+        CASES.append(Case(name, setup, description, requires))
+        return setup
+    return register
+
+
+@contextlib.contextmanager
+def _skip_sleep():
+    """量測時略過模擬處理時間"""
+    original = asyncio.sleep
+
+    async def no_sleep(delay, result=None):
+        return result
+
+    asyncio.sleep = no_sleep
+    try:
+        yield
+    finally:
+        asyncio.sleep = original
+
+
+# ---- 案例 ----
+
+@case("minimax_simulation", "TTSService2._generate_simulation_audio")
+def _minimax_simulation(chars: int):
+    from services.minimax_service import TTSService2
+    service = TTSService2()
+    text = make_text(chars)
+    return lambda: service._generate_simulation_audio(text, "zh", "happy", 1.0)
+
+
+@case("openai_simulation", "TTSService4._generate_simulation_audio")
+def _openai_simulation(chars: int):
+    from services.openai_service import TTSService4
+    service = TTSService4()
+    text = make_text(chars)
+    return lambda: service._generate_simulation_audio(text, "nova", "zh")
+
+
+@case("minimax_simulation_stream", "TTSService2._stream_simulation_audio (逐塊消費，不保留)")
+def _minimax_simulation_stream(chars: int):
+    from services.minimax_service import TTSService2
+    service = TTSService2()
+    text = make_text(chars)
+    return lambda: _drain(service._stream_simulation_audio(text, "zh", "happy", 1.0))
+
+
+@case("openai_simulation_stream", "TTSService4._stream_simulation_audio (逐塊消費，不保留)")
+def _openai_simulation_stream(chars: int):
+    from services.openai_service import TTSService4
+    service = TTSService4()
+    text = make_text(chars)
+    return lambda: _drain(service._stream_simulation_audio(text, "nova"))
+
+
+async def _drain(chunks) -> int:
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+    return total
+
+
+@case("edge_mp3_to_wav", "TTSService1._convert_mp3_to_wav (ffmpeg)", requires="ffmpeg")
+def _edge_mp3_to_wav(chars: int):
+    from benchmarks.stubs import make_mp3
+    from services.edgetts_service import TTSService1
+    service = TTSService1()
+    mp3_data = make_mp3(chars * 0.2)
+    return lambda: service._convert_mp3_to_wav(mp3_data)
+
+
+@case("ssml", "TTSService3._escape_ssml_text + _build_ssml")
+def _ssml(chars: int):
+    from services.aten_service import TTSService3
+    service = TTSService3()
+    text = make_text(chars)
+    voice_config = {"pitch": 1, "rate": 1.1, "volume": 2}
+    return lambda: service._build_ssml(text, "Aurora", voice_config, "zh-TW")
+
+
+@case("parse_body_utf8", "main._parse_request_body (UTF-8)")
+def _parse_body_utf8(chars: int):
+    return _parse_body_case(json.dumps({"text": make_text(chars), "service": "service1"}, ensure_ascii=False).encode("utf-8"))
+
+
+@case("parse_body_big5", "main._parse_request_body (Big5 回退)")
+def _parse_body_big5(chars: int):
+    # Big5 無法編碼的字元以 ? 取代，只量測解碼鏈
+    body = json.dumps({"text": make_text(chars), "service": "service1"}, ensure_ascii=False)
+    return _parse_body_case(body.encode("big5", errors="replace"))
+
+
+def _parse_body_case(body: bytes):
+    from starlette.requests import Request
+    import main
+
+    async def call():
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await main._parse_request_body(Request({"type": "http", "method": "POST", "headers": []}, receive))
+    return call
+
+
+@case("pcm_to_wav", "audio_decoder.pcm_to_wav (24kHz)")
+def _pcm_to_wav(chars: int):
+    from services.audio_decoder import pcm_to_wav
+    pcm = b"\x01\x02" * int(chars * 0.2 * 24000)
+    return lambda: pcm_to_wav(pcm, 24000)
+
+
+# ---- 量測 ----
+
+def _runner(loop: asyncio.AbstractEventLoop, fn: Callable[[], Any]) -> Callable[[], Any]:
+    def run():
+        result = fn()
+        if asyncio.iscoroutine(result):
+            result = loop.run_until_complete(result)
+        return result
+    return run
+
+
+def measure(run: Callable[[], Any], min_time: float, repeats: int) -> Dict[str, Any]:
+    # 暖機並估計單次耗時
+    started = time.perf_counter()
+    run()
+    single = time.perf_counter() - started
+    loops = max(1, int(min_time / single)) if single > 0 else 1000
+
+    samples = []
+    for _ in range(repeats if single < 1 else min(repeats, 3)):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        samples.append((time.perf_counter() - started) / loops)
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = run()
+    current, peak = tracemalloc.get_traced_memory()
+    del result
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "min_us": round(min(samples) * 1e6, 2),
+        "loops": loops,
+        "repeats": len(samples),
+        "peak_kb": round((peak - before) / 1024, 1),
+        "result_kb": round((current - before) / 1024, 1),
+        "retained_kb": round((retained - before) / 1024, 1),
+    }
+
+
+def run_cases(only: Optional[List[str]], sizes: List[int], min_time: float, repeats: int) -> Dict[str, Any]:
+    loop = asyncio.new_event_loop()
+    results: Dict[str, Any] = {}
+    try:
+        with _skip_sleep():
+            for bench in CASES:
+                if only and bench.name not in only:
+                    continue
+                if bench.requires and shutil.which(bench.requires) is None:
+                    print(f"⏭️  {bench.name}: 需要 {bench.requires}，略過")
+                    continue
+                for chars in sizes:
+                    run = _runner(loop, bench.setup(chars))
+                    stats = measure(run, min_time, repeats)
+                    results[f"{bench.name}@{chars}"] = stats
+                    print(
+                        f"   {bench.name:<20} {chars:>6} 字  {_format_us(stats['median_us']):>10}  "
+                        f"峰值 {stats['peak_kb']:>10.1f} KB  保留 {stats['retained_kb']:>8.1f} KB"
+                    )
+    finally:
+        loop.close()
+    return results
+
+
+def _format_us(value: float) -> str:
+    if value >= 1e6:
+        return f"{value / 1e6:.2f} s"
+    if value >= 1e3:
+        return f"{value / 1e3:.2f} ms"
+    return f"{value:.1f} µs"
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    memory_threshold: float,
+    noise_us: float = 5.0
+) -> List[str]:
+    """
+    比較兩次結果，返回退步項目
+    時間以各輪最小值比較 (受背景負載影響最小，差距小於 noise_us 視為雜訊)；
+    峰值記憶體幾乎不受環境影響，使用較嚴格的門檻
+    """
+    regressions = []
+    for key, now in current.get("results", {}).items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        time_change = (now["min_us"] - base["min_us"]) / base["min_us"] if base["min_us"] else 0.0
+        slower = time_change > threshold and now["min_us"] - base["min_us"] > noise_us
+        peak_change = (now["peak_kb"] - base["peak_kb"]) / base["peak_kb"] if base["peak_kb"] > 1 else 0.0
+        bigger = peak_change > memory_threshold and now["peak_kb"] - base["peak_kb"] > 4
+        marker = "❌" if slower or bigger else "  "
+        print(
+            f"{marker} {key:<28} 時間 {_format_us(base['min_us']):>10} → {_format_us(now['min_us']):>10} ({time_change:+.1%})  "
+            f"峰值 {base['peak_kb']:>10.1f} → {now['peak_kb']:>10.1f} KB ({peak_change:+.1%})"
+        )
+        if slower:
+            regressions.append(f"{key} 時間 {time_change:+.1%}")
+        if bigger:
+            regressions.append(f"{key} 峰值記憶體 {peak_change:+.1%}")
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音頻熱點函式微基準測試")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="執行微基準測試")
+    run_parser.add_argument("--only", nargs="*", help=f"只執行指定案例 ({', '.join(c.name for c in CASES)})")
+    run_parser.add_argument("--sizes", nargs="*", type=int, default=DEFAULT_SIZES, help="輸入字數")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="每輪最短量測時間 (秒)")
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--baseline", help="與此基準比較")
+    run_parser.add_argument("--threshold", type=float, default=0.3, help="時間退步門檻 (比例)")
+    run_parser.add_argument("--memory-threshold", type=float, default=0.1, help="峰值記憶體退步門檻 (比例)")
+    run_parser.add_argument("--save-baseline", help="將本次結果寫為基準 (保留未執行案例的原基準)")
+
+    compare_parser = commands.add_parser("compare", help="比較兩份結果")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.3)
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    # 只輸出警告以上，避免請求體解析的 INFO 日誌淹沒結果
+    logging.disable(logging.INFO)
+
+    if args.command == "compare":
+        regressions = compare(_load(args.baseline), _load(args.current), args.threshold, args.memory_threshold)
+    else:
+        results = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "ffmpeg": shutil.which("ffmpeg") is not None,
+            },
+            "results": run_cases(args.only, args.sizes, args.min_time, args.repeats),
+        }
+        os.makedirs(os.path.join(BENCH_DIR, "results"), exist_ok=True)
+        result_path = os.path.join(BENCH_DIR, "results", f"micro-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📄 結果: {result_path}")
+
+        if args.save_baseline:
+            saved = results
+            if os.path.exists(args.save_baseline):
+                saved = _load(args.save_baseline)
+                saved["created_at"] = results["created_at"]
+                saved["environment"] = results["environment"]
+                saved["results"].update(results["results"])
+            with open(args.save_baseline, "w", encoding="utf-8") as f:
+                json.dump(saved, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            print(f"📌 已更新基準: {args.save_baseline}")
+
+        regressions = compare(_load(args.baseline), results, args.threshold, args.memory_threshold) if args.baseline else []
+
+    if regressions:
+        print(f"❌ {len(regressions)} 項退步超過門檻 (時間 {args.threshold:.0%}，記憶體 {args.memory_threshold:.0%}):")
+        for item in regressions:
+            print(f"   {item}")
+        sys.exit(1)
+    if args.command == "compare" or args.baseline:
+        print("✅ 未發現退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Gateway 基準測試
+
+依 scenarios.json 逐一執行情境：啟動上游模擬服務，以情境的環境變數啟動 Gateway，
+用固定 RPS 負載量測延遲、吞吐量、CPU 與 RSS，結果寫入 benchmarks/results/，
+並可與 benchmarks/baselines/ 中的基準比較 (超過門檻時以非零狀態碼結束，可用於 CI)。
+
+用法:
+    python -m benchmarks.run                                  # 執行全部情境
+    python -m benchmarks.run --only minimax_hex_wav fish_wav  # 只執行部分情境
+    python -m benchmarks.run --baseline benchmarks/baselines/default.json
+    python -m benchmarks.run --save-baseline benchmarks/baselines/default.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+from benchmarks.loadgen import make_text, run_load
+from benchmarks.stubs import gateway_env
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(BENCH_DIR)
+
+# 比較時的指標與方向 (higher: 數值越高越差)
+COMPARED_METRICS = [
+    ("latency_ms.p50", "higher"),
+    ("latency_ms.p95", "higher"),
+    ("latency_ms.p99", "higher"),
+    ("throughput_rps", "lower"),
+    ("cpu_percent.avg", "higher"),
+    ("rss_mb.max", "higher"),
+]
+
+
+def _get(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+async def _wait_ready(url: str, timeout: float = 60):
+    deadline_at = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline_at:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as response:
+                    if response.status < 500:
+                        return
+            except Exception:
+                pass
+            await asyncio.sleep(0.3)
+    raise RuntimeError(f"等待服務就緒逾時: {url}")
+
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_scenario(scenario: Dict[str, Any], args, stub_url: str, work_dir: str) -> Dict[str, Any]:
+    """以情境的環境變數啟動 Gateway 並執行負載"""
+    env = {
+        **os.environ,
+        **gateway_env(stub_url),
+        "AUDIO_DIR": os.path.join(work_dir, "audios"),
+        "WEBHOOK_QUEUE_DIR": os.path.join(work_dir, "webhooks"),
+        "ACCESS_LOG_PATH": "",
+        # 每個請求都要經過上游 stub，否則量到的是快取命中
+        "AUDIO_CACHE_MODE": "off",
+        "AUDIO_CACHE_DIR": os.path.join(work_dir, "cache"),
+        **scenario.get("env", {}),
+    }
+    gateway_url = f"http://127.0.0.1:{args.gateway_port}"
+    log_path = os.path.join(work_dir, f"gateway-{scenario['name']}.log")
+    with open(log_path, "w") as log_file:
+        gateway = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(args.gateway_port), "--log-level", "warning", "--no-access-log"],
+            cwd=SERVICE_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+        )
+    try:
+        await _wait_ready(f"{gateway_url}/health")
+        payload = {
+            "text": make_text(scenario.get("chars", 50)),
+            "service": scenario["service"],
+            "voice_config": scenario.get("voice_config", {}),
+        }
+        # 暖機 (建立連線、載入模型列表等)，不計入結果
+        await run_load(gateway_url, payload, rps=2, duration=1, endpoint=scenario.get("endpoint", "/api/tts/generate"))
+        report = await run_load(
+            gateway_url, payload,
+            rps=scenario.get("rps", 10),
+            duration=args.duration or scenario.get("duration", 15),
+            endpoint=scenario.get("endpoint", "/api/tts/generate"),
+            timeout=scenario.get("timeout", 60),
+            pid=gateway.pid
+        )
+    finally:
+        _stop(gateway)
+    report["scenario"] = scenario["name"]
+    report["gateway_log"] = log_path
+    return report
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """返回超過門檻的退步項目"""
+    regressions = []
+    for name, report in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for metric, direction in COMPARED_METRICS:
+            current, previous = _get(report, metric), _get(base, metric)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            worse = change > threshold if direction == "higher" else change < -threshold
+            marker = "❌" if worse else "  "
+            print(f"{marker} {name:<22} {metric:<18} {previous:>10.1f} → {current:>10.1f} ({change:+.1%})")
+            if worse:
+                regressions.append(f"{name} {metric} {change:+.1%}")
+        if report.get("error_rate", 0) > base.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name} error_rate {base.get('error_rate')} → {report.get('error_rate')}")
+    return regressions
+
+
+async def main_async(args) -> int:
+    with open(args.scenarios, "r", encoding="utf-8") as f:
+        scenarios = json.load(f)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if scenario["name"] in args.only]
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+
+    work_dir = tempfile.mkdtemp(prefix="tts-bench-")
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub_cmd = [sys.executable, "-m", "benchmarks.stubs", "--port", str(args.stub_port), "--seed", str(args.seed)]
+    if args.profile:
+        stub_cmd += ["--profile", args.profile]
+    stub = subprocess.Popen(stub_cmd, cwd=SERVICE_DIR)
+
+    results: Dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": has_ffmpeg,
+            "profile": os.path.relpath(args.profile, SERVICE_DIR) if args.profile else None,
+            "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    try:
+        await _wait_ready(f"{stub_url}/stats")
+        for scenario in scenarios:
+            if scenario.get("requires_ffmpeg") and not has_ffmpeg:
+                print(f"⏭️  {scenario['name']}: 需要 ffmpeg，略過")
+                continue
+            print(f"▶️  {scenario['name']} ({scenario['service']}, {scenario.get('rps', 10)} rps)")
+            report = await run_scenario(scenario, args, stub_url, work_dir)
+            latency = report["latency_ms"]
+            print(
+                f"   ok={report['ok']}/{report['requests']} p50={latency['p50']}ms p95={latency['p95']}ms "
+                f"p99={latency['p99']}ms thr={report['throughput_rps']}rps "
+                f"cpu={_get(report, 'cpu_percent.avg')}% rss={_get(report, 'rss_mb.max')}MB"
+            )
+            results["scenarios"][scenario["name"]] = report
+    finally:
+        _stop(stub)
+
+    os.makedirs(os.path.join(BENCH_DIR, "results"), exist_ok=True)
+    result_path = os.path.join(BENCH_DIR, "results", f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📄 結果: {result_path}")
+
+    if args.save_baseline:
+        for report in results["scenarios"].values():
+            report.pop("gateway_log", None)
+        saved = results
+        if os.path.exists(args.save_baseline):
+            # 只更新本次執行的情境，其餘保留原基準
+            with open(args.save_baseline, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            saved["created_at"] = results["created_at"]
+            saved["environment"] = results["environment"]
+            saved["scenarios"].update(results["scenarios"])
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"📌 已更新基準: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} 項指標退步超過 {args.threshold:.0%}:")
+            for item in regressions:
+                print(f"   {item}")
+            return 1
+        print("✅ 未發現退步")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS Gateway 基準測試")
+    parser.add_argument("--scenarios", default=os.path.join(BENCH_DIR, "scenarios.json"))
+    parser.add_argument("--profile", default=os.path.join(BENCH_DIR, "profiles", "default.json"),
+                        help="上游模擬服務的延遲與錯誤設定檔")
+    parser.add_argument("--only", nargs="*", help="只執行指定名稱的情境")
+    parser.add_argument("--duration", type=float, help="覆蓋每個情境的持續秒數")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stub-port", type=int, default=18900)
+    parser.add_argument("--gateway-port", type=int, default=18080)
+    parser.add_argument("--baseline", help="與此基準比較")
+    parser.add_argument("--threshold", type=float, default=0.15, help="退步門檻 (比例)")
+    parser.add_argument("--save-baseline", help="將本次結果寫為基準")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+上游 TTS 服務的本地模擬 (壓測與基準測試用)
+
+單一 aiohttp 服務以路徑前綴模擬各上游 API，延遲與錯誤依設定檔的分布隨機產生：
+    /edge/v1                       EdgeTTS WebSocket        (EDGE_TTS_WSS_URL)
+    /minimax/v1/t2a_v2             MiniMax t2a_v2           (MINIMAX_BASE_URL)
+    /aten/api/v1/...               ATEN 送出 / 輪詢 / 下載   (ATEN_BASE_URL)
+    /voai/TTS/...                  VoAI                     (VOAI_BASE_URL)
+    /openai/v1/audio/speech        OpenAI Speech            (OPENAI_BASE_URL)
+    /fish/v1/invoke                Fish Speech              (FISH_SPEECH_URL)
+    /stats                         各服務的請求與錯誤統計
+
+用法:
+    python -m benchmarks.stubs --port 18900 --profile benchmarks/profiles/default.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import struct
+import uuid
+from typing import Dict, Any, Optional
+
+from aiohttp import WSMsgType, web
+
+from services.mock_service import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ["edge", "minimax", "aten", "voai", "openai", "fish"]
+
+DEFAULT_PROFILE = {
+    # 首個位元組前的延遲分布
+    "latency": "lognormal:median=0.3,sigma=0.4",
+    # 返回 5xx 的比例
+    "error_rate": 0.0,
+    # 不回應 (直到 hang_seconds 後才返回) 的比例，模擬上游卡住
+    "timeout_rate": 0.0,
+    "hang_seconds": 120,
+    # 每個字的音頻長度 (秒)
+    "seconds_per_char": 0.2,
+    # 串流輸出速度 (音頻秒數 / 實際秒數)，0 表示一次送出
+    "stream_speed": 20,
+}
+
+
+class ProviderProfile:
+    """單一上游服務的行為設定"""
+
+    def __init__(self, config: Dict[str, Any]):
+        merged = {**DEFAULT_PROFILE, **config}
+        self.latency = LatencyModel(merged["latency"])
+        self.error_rate = float(merged["error_rate"])
+        self.timeout_rate = float(merged["timeout_rate"])
+        self.hang_seconds = float(merged["hang_seconds"])
+        self.seconds_per_char = float(merged["seconds_per_char"])
+        self.stream_speed = float(merged["stream_speed"])
+
+
+def load_profiles(path: Optional[str]) -> Dict[str, ProviderProfile]:
+    """
+    設定檔格式: {"default": {...}, "minimax": {...}, ...}
+    各服務的設定覆蓋 default
+    """
+    config: Dict[str, Any] = {}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    default = config.get("default", {})
+    return {name: ProviderProfile({**default, **config.get(name, {})}) for name in PROVIDERS}
+
+
+# ---- 音頻生成 ----
+
+_tone_cache: Dict[int, bytes] = {}
+
+
+def _tone_second(sample_rate: int) -> bytes:
+    """一秒 440Hz 低音量 PCM16 (快取，每個請求只做重複拼接)"""
+    if sample_rate not in _tone_cache:
+        samples = (int(3000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(sample_rate))
+        _tone_cache[sample_rate] = b"".join(struct.pack("<h", sample) for sample in samples)
+    return _tone_cache[sample_rate]
+
+
+def make_pcm(seconds: float, sample_rate: int) -> bytes:
+    tone = _tone_second(sample_rate)
+    total = int(seconds * sample_rate) * 2
+    return (tone * (total // len(tone) + 1))[:total]
+
+
+def make_wav(pcm: bytes, sample_rate: int) -> bytes:
+    return (
+        b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", len(pcm)) + pcm
+    )
+
+
+# MPEG-2 Layer III、24kHz、48kbps、單聲道的靜音幀 (每幀 144 bytes、24ms)，不需要編碼器
+_MP3_FRAME = b"\xff\xf3\x64\xc0" + b"\x00" * 140
+_MP3_FRAME_SECONDS = 576 / 24000
+
+
+def make_mp3(seconds: float) -> bytes:
+    return _MP3_FRAME * max(1, int(seconds / _MP3_FRAME_SECONDS))
+
+
+def make_audio(seconds: float, audio_format: str, sample_rate: int = 24000) -> bytes:
+    if audio_format == "pcm":
+        return make_pcm(seconds, sample_rate)
+    if audio_format == "wav":
+        return make_wav(make_pcm(seconds, sample_rate), sample_rate)
+    if audio_format == "mp3":
+        return make_mp3(seconds)
+    raise ValueError(f"模擬服務不支援的格式: {audio_format}")
+
+
+def _split(data: bytes, parts: int, align: int = 2):
+    size = max(align, (len(data) // max(1, parts)) // align * align)
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+class StubServer:
+    def __init__(self, profiles: Dict[str, ProviderProfile], seed: Optional[int] = None):
+        self.profiles = profiles
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, Dict[str, int]] = {
+            name: {"requests": 0, "errors": 0, "timeouts": 0} for name in PROVIDERS
+        }
+        self._files: Dict[str, bytes] = {}
+        self._aten_jobs: Dict[str, Dict[str, Any]] = {}
+
+    def _duration(self, provider: str, text: str) -> float:
+        return max(0.2, len(text) * self.profiles[provider].seconds_per_char)
+
+    async def _before_response(self, provider: str) -> Optional[web.Response]:
+        """依設定等待延遲並注入錯誤；返回非 None 時直接以該回應結束"""
+        profile = self.profiles[provider]
+        self.stats[provider]["requests"] += 1
+        roll = self.rng.random()
+        if roll < profile.timeout_rate:
+            self.stats[provider]["timeouts"] += 1
+            await asyncio.sleep(profile.hang_seconds)
+            return web.json_response({"message": "stub timeout"}, status=504)
+        await asyncio.sleep(profile.latency.sample(self.rng))
+        if roll < profile.timeout_rate + profile.error_rate:
+            self.stats[provider]["errors"] += 1
+            return web.json_response({"message": "stub error"}, status=500)
+        return None
+
+    async def _stream(self, response: web.StreamResponse, provider: str, chunks, seconds: float):
+        """依 stream_speed 分段送出，模擬上游邊合成邊返回"""
+        chunks = list(chunks)
+        speed = self.profiles[provider].stream_speed
+        delay = seconds / speed / len(chunks) if speed > 0 and chunks else 0
+        for chunk in chunks:
+            await response.write(chunk)
+            if delay:
+                await asyncio.sleep(delay)
+
+    # ---- EdgeTTS ----
+
+    async def edge(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        request_id = uuid.uuid4().hex
+        async for message in ws:
+            if message.type != WSMsgType.TEXT or "Path:ssml" not in message.data:
+                continue
+            failure = await self._before_response("edge")
+            if failure is not None:
+                await ws.close()
+                break
+            text = re.sub(r"<[^>]+>", "", message.data.split("\r\n\r\n", 1)[-1])
+            seconds = self._duration("edge", text.strip())
+            await ws.send_str(f"X-RequestId:{request_id}\r\nPath:turn.start\r\n\r\n{{}}")
+            headers = f"X-RequestId:{request_id}\r\nContent-Type:audio/mpeg\r\nPath:audio\r\n".encode()
+            audio = make_mp3(seconds)
+            frames = [audio[i:i + len(_MP3_FRAME) * 40] for i in range(0, len(audio), len(_MP3_FRAME) * 40)]
+            speed = self.profiles["edge"].stream_speed
+            delay = seconds / speed / len(frames) if speed > 0 else 0
+            for frame in frames:
+                await ws.send_bytes(len(headers).to_bytes(2, "big") + headers + frame)
+                if delay:
+                    await asyncio.sleep(delay)
+            await ws.send_str(f"X-RequestId:{request_id}\r\nPath:turn.end\r\n\r\n{{}}")
+        return ws
+
+    # ---- MiniMax ----
+
+    async def minimax(self, request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        failure = await self._before_response("minimax")
+        if failure is not None:
+            return failure
+        setting = data.get("audio_setting") or {}
+        audio_format = setting.get("format", "mp3")
+        sample_rate = int(setting.get("sample_rate", 16000))
+        seconds = self._duration("minimax", data.get("text", ""))
+        try:
+            audio = make_audio(seconds, audio_format, sample_rate)
+        except ValueError as e:
+            return web.json_response({"base_resp": {"status_code": 2013, "status_msg": str(e)}})
+
+        if data.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            events = (
+                f'data: {json.dumps({"data": {"audio": chunk.hex(), "status": 1}, "base_resp": {"status_code": 0}})}\n\n'.encode()
+                for chunk in _split(audio, 10)
+            )
+            await self._stream(response, "minimax", events, seconds)
+            await response.write(
+                f'data: {json.dumps({"data": {"status": 2}, "base_resp": {"status_code": 0}})}\n\n'.encode()
+            )
+            await response.write_eof()
+            return response
+
+        if data.get("output_format") == "url":
+            file_id = uuid.uuid4().hex
+            self._files[file_id] = audio
+            audio_field = f"{request.scheme}://{request.host}/files/{file_id}"
+        else:
+            audio_field = audio.hex()
+        return web.json_response({
+            "data": {"audio": audio_field, "status": 2},
+            "extra_info": {"audio_length": int(seconds * 1000), "audio_format": audio_format},
+            "base_resp": {"status_code": 0, "status_msg": "success"},
+        })
+
+    async def download_file(self, request: web.Request) -> web.Response:
+        audio = self._files.pop(request.match_info["file_id"], None)
+        if audio is None:
+            return web.Response(status=404)
+        return web.Response(body=audio, content_type="application/octet-stream")
+
+    # ---- ATEN ----
+
+    async def aten_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"data": [
+            {"model_id": "stub-female", "name": "Stub Female", "language": "zh-TW", "gender": "female"},
+            {"model_id": "stub-male", "name": "Stub Male", "language": "zh-TW", "gender": "male"},
+        ]})
+
+    async def aten_submit(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        failure = await self._before_response("aten")
+        if failure is not None:
+            return failure
+        text = re.sub(r"<[^>]+>", "", data.get("ssml", ""))
+        synthesis_id = uuid.uuid4().hex
+        # 合成所需時間與音頻長度成正比
+        seconds = self._duration("aten", text.strip())
+        speed = self.profiles["aten"].stream_speed
+        self._aten_jobs[synthesis_id] = {
+            "ready_at": asyncio.get_running_loop().time() + (seconds / speed if speed > 0 else 0),
+            "seconds": seconds,
+        }
+        return web.json_response({"synthesis_id": synthesis_id})
+
+    async def aten_status(self, request: web.Request) -> web.Response:
+        synthesis_id = request.match_info["synthesis_id"]
+        job = self._aten_jobs.get(synthesis_id)
+        if job is None:
+            return web.json_response({"message": "not found"}, status=404)
+        if asyncio.get_running_loop().time() < job["ready_at"]:
+            return web.json_response({"status": "Processing"})
+        self._files[synthesis_id] = make_wav(make_pcm(job["seconds"], 22050), 22050)
+        del self._aten_jobs[synthesis_id]
+        return web.json_response({
+            "status": "Success",
+            "synthesis_path": f"{request.scheme}://{request.host}/files/{synthesis_id}",
+        })
+
+    # ---- VoAI ----
+
+    async def voai(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        failure = await self._before_response("voai")
+        if failure is not None:
+            return failure
+        text = data.get("text") or (data.get("input") or {}).get("voai_script_text", "")
+        audio_format = request.headers.get("x-output-format", "wav")
+        seconds = self._duration("voai", text)
+        try:
+            audio = make_audio(seconds, audio_format, 22050)
+        except ValueError as e:
+            return web.json_response({"message": str(e)}, status=400)
+        return web.Response(body=audio, content_type="audio/mpeg" if audio_format == "mp3" else "audio/wav")
+
+    # ---- OpenAI ----
+
+    async def openai(self, request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        failure = await self._before_response("openai")
+        if failure is not None:
+            return failure
+        audio_format = data.get("response_format", "mp3")
+        seconds = self._duration("openai", data.get("input", ""))
+        try:
+            audio = make_audio(seconds, audio_format, 24000)
+        except ValueError as e:
+            return web.json_response({"error": {"message": str(e)}}, status=400)
+        response = web.StreamResponse(headers={"Content-Type": f"audio/{audio_format}"})
+        await response.prepare(request)
+        await self._stream(response, "openai", _split(audio, 20), seconds)
+        await response.write_eof()
+        return response
+
+    # ---- Fish Speech ----
+
+    async def fish_invoke(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        failure = await self._before_response("fish")
+        if failure is not None:
+            return failure
+        seconds = self._duration("fish", data.get("text", ""))
+        return web.Response(body=make_wav(make_pcm(seconds, 44100), 44100), content_type="audio/wav")
+
+    async def fish_preprocess(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return web.json_response({
+            "code": 0,
+            "asr_format_audio_url": data.get("reference_audio"),
+            "reference_audio_text": "stub",
+        })
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/edge/v1", self.edge)
+        app.router.add_post("/minimax/v1/t2a_v2", self.minimax)
+        app.router.add_get("/files/{file_id}", self.download_file)
+        app.router.add_get("/aten/api/v1/models/api_token", self.aten_models)
+        app.router.add_post("/aten/api/v1/syntheses/api_token", self.aten_submit)
+        app.router.add_get("/aten/api/v1/syntheses/{synthesis_id}/api_token", self.aten_status)
+        app.router.add_post("/voai/TTS/Speech", self.voai)
+        app.router.add_post("/voai/TTS/generate-voice", self.voai)
+        app.router.add_post("/openai/v1/audio/speech", self.openai)
+        app.router.add_post("/fish/v1/invoke", self.fish_invoke)
+        app.router.add_post("/fish/v1/preprocess_and_tran", self.fish_preprocess)
+        app.router.add_get("/stats", self.stats_handler)
+        return app
+
+
+def gateway_env(base_url: str) -> Dict[str, str]:
+    """讓 Gateway 的各服務指向模擬服務的環境變數"""
+    ws_url = base_url.replace("http://", "ws://", 1)
+    return {
+        "EDGE_TTS_WSS_URL": f"{ws_url}/edge/v1?TrustedClientToken=stub",
+        "MINIMAX_API_KEY": "stub",
+        "MINIMAX_GROUP_ID": "stub",
+        "MINIMAX_BASE_URL": f"{base_url}/minimax/v1/t2a_v2",
+        "ATEN_API_TOKEN": "stub",
+        "ATEN_BASE_URL": f"{base_url}/aten",
+        "VOAI_API_KEY": "stub",
+        "VOAI_BASE_URL": f"{base_url}/voai",
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "FISH_SPEECH_URL": f"{base_url}/fish",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游 TTS 模擬服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18900)
+    parser.add_argument("--profile", help="延遲與錯誤設定檔 (JSON)")
+    parser.add_argument("--seed", type=int, default=None, help="隨機種子，固定後延遲與錯誤序列可重現")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = StubServer(load_profiles(args.profile), args.seed)
+    print(f"stub listening on http://{args.host}:{args.port}", flush=True)
+    web.run_app(server.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+結構化存取日誌
+每個 TTS 請求一行精簡 JSON (請求ID、服務、文字長度與雜湊、各階段耗時、音頻大小、結果)，
+先放入記憶體佇列，由背景任務批次寫入文件並依大小輪替，寫入不佔用請求的處理時間
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter:
+    """
+    Args:
+        path: 日誌文件路徑，"-" 表示輸出到 stdout，空字串表示停用
+        sample_rate: 成功請求的取樣比例 (0-1)，錯誤請求 (status >= 400) 一律記錄
+        max_bytes: 單一文件大小上限，超過時輪替為 .1、.2 ...
+        backup_count: 保留的輪替文件數
+        flush_interval: 批次寫入間隔 (秒)
+        max_queue: 佇列上限，寫入跟不上時丟棄最舊的記錄
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float = 1.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        backup_count: int = 5,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self._queue: Deque[str] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def log(self, entry: Dict[str, Any]):
+        """加入一筆記錄 (不做 I/O)"""
+        if not self.enabled:
+            return
+        status = entry.get("status") or 0
+        if status < 400 and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str))
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if self.path != "-":
+            directory = os.path.dirname(self.path)
+            try:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"⚠️ 無法建立存取日誌目錄 {directory}: {e}，停用存取日誌")
+                self.path = ""
+                return
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"📝 存取日誌: {self.path} (取樣 {self.sample_rate:.0%})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 寫出剩餘記錄
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._queue:
+            return
+        lines = list(self._queue)
+        self._queue.clear()
+        try:
+            await asyncio.to_thread(self._write, lines)
+            self.written += len(lines)
+        except Exception as e:
+            self.write_errors += 1
+            logger.warning(f"⚠️ 寫入存取日誌失敗 ({len(lines)} 筆): {e}")
+
+    def _write(self, lines: List[str]):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        if self.path == "-":
+            os.write(1, data)
+            return
+        self._rotate_if_needed(len(data))
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    def _rotate_if_needed(self, incoming: int):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if self.max_bytes <= 0 or size + incoming <= self.max_bytes:
+            return
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "path": self.path or None,
+            "sample_rate": self.sample_rate,
+            "queued": len(self._queue),
+            "written": self.written,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+准入控制
+整個 Gateway、各服務與各租戶分別設定併發上限與有界等待佇列，
+佇列已滿或等待逾時的請求直接拒絕，並依佇列消化速度計算 Retry-After。
+等待佇列以加權公平排隊 (WFQ) 在租戶之間輪流放行，大量批次請求不會讓其他租戶餓死
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+from services import deadline
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """請求未獲准入"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int, message: str):
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class AdmissionLimiter:
+    """
+    單一範圍 (全域、單一服務或單一租戶) 的併發上限與等待佇列
+
+    排隊請求依虛擬完成時間放行: 每個租戶的請求依序累加 1 / weight，
+    同一租戶內維持 FIFO，不同租戶之間依權重輪流，只有一個租戶時等同 FIFO
+    """
+
+    def __init__(self, name: str, max_concurrency: int, queue_size: int, drain_window: float = 60):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.drain_window = drain_window
+        self.active = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._completions: Deque[float] = deque()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.max_concurrency <= 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def drain_rate(self) -> float:
+        """最近時間窗內每秒完成的請求數"""
+        cutoff = time.monotonic() - self.drain_window
+        while self._completions and self._completions[0] < cutoff:
+            self._completions.popleft()
+        return len(self._completions) / self.drain_window
+
+    def retry_after(self, fallback: float) -> int:
+        """依佇列消化速度估算重試等待秒數"""
+        rate = self.drain_rate()
+        wait = (self.queue_depth + 1) / rate if rate > 0 else fallback
+        return max(1, min(120, math.ceil(wait)))
+
+    def _enqueue(self, tenant_id: str, weight: float) -> Tuple[float, int, asyncio.Future]:
+        start = max(self._virtual_time, self._finish_tags.get(tenant_id, 0.0))
+        tag = start + 1.0 / max(weight, 0.001)
+        self._finish_tags[tenant_id] = tag
+        entry = (tag, next(self._sequence), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _remove(self, entry: Tuple[float, int, asyncio.Future]):
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+
+    async def acquire(self, timeout: Optional[float], tenant_id: str = "default", weight: float = 1.0):
+        if self.unlimited or (self.active < self.max_concurrency and not self._waiters):
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected(
+                429, "queue_full", self.retry_after(timeout or 1),
+                f"{self.name} 請求過多，等待佇列已滿 ({self.queue_size})"
+            )
+
+        entry = self._enqueue(tenant_id, weight)
+        waiter = entry[2]
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 名額已移交給此請求，歸還給下一位
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove(entry)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected["timeout"] += 1
+                raise AdmissionRejected(
+                    503, "timeout", self.retry_after(timeout or 1),
+                    f"{self.name} 繁忙，排隊逾時 ({timeout:.1f}s)"
+                )
+            raise
+
+        self.admitted += 1
+
+    def release(self):
+        self._completions.append(time.monotonic())
+        # 直接把名額移交給虛擬完成時間最早的請求
+        while self._waiters:
+            tag, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._virtual_time = tag
+                waiter.set_result(None)
+                return
+        # 佇列清空後重新計算虛擬時間
+        self._virtual_time = 0.0
+        self._finish_tags.clear()
+        self.active -= 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "drain_rate": round(self.drain_rate(), 3),
+        }
+
+
+class AdmissionTicket:
+    """已取得的准入名額，release() 可重複呼叫"""
+
+    def __init__(self, limiters: List[AdmissionLimiter]):
+        self._limiters = limiters
+
+    def release(self):
+        while self._limiters:
+            self._limiters.pop().release()
+
+
+class AdmissionController:
+    """
+    三層准入控制: 依序取得租戶名額、服務名額與全域名額
+    (等待前一層時不佔用後面的名額，避免慢服務或單一租戶拖住其他請求)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        queue_size: int = 64,
+        queue_timeout: float = 30,
+        provider_limits: Optional[Dict[str, Tuple[int, int]]] = None
+    ):
+        self.queue_timeout = queue_timeout
+        self.global_limiter = AdmissionLimiter("Gateway", max_concurrency, queue_size)
+        self.providers: Dict[str, AdmissionLimiter] = {
+            service_id: AdmissionLimiter(f"服務 {service_id}", limit, queue)
+            for service_id, (limit, queue) in (provider_limits or {}).items()
+        }
+        self.tenants: Dict[str, AdmissionLimiter] = {}
+
+    def queue_depth(self, service_id: str) -> int:
+        """服務目前排隊中的請求數 (供自動路由參考)"""
+        limiter = self.providers.get(service_id)
+        return limiter.queue_depth if limiter else 0
+
+    def tenant_limiter(self, tenant: Any) -> Optional[AdmissionLimiter]:
+        """租戶的併發上限 (未設定上限的租戶返回 None)"""
+        if tenant is None or tenant.max_concurrency <= 0:
+            return None
+        limiter = self.tenants.get(tenant.id)
+        if limiter is None or limiter.max_concurrency != tenant.max_concurrency:
+            limiter = AdmissionLimiter(f"租戶 {tenant.id}", tenant.max_concurrency, tenant.queue_size)
+            self.tenants[tenant.id] = limiter
+        return limiter
+
+    async def acquire(self, service_id: str, tenant: Any = None) -> AdmissionTicket:
+        """
+        取得准入名額，排隊時間不超過 queue_timeout 與請求截止時間
+
+        Args:
+            service_id: 服務ID
+            tenant: 呼叫端租戶 (需有 id / weight / max_concurrency / queue_size)，None 表示預設租戶
+        """
+        acquired: List[AdmissionLimiter] = []
+        ticket = AdmissionTicket(acquired)
+        limiters = [self.tenant_limiter(tenant), self.providers.get(service_id), self.global_limiter]
+        tenant_id = tenant.id if tenant is not None else "default"
+        weight = tenant.weight if tenant is not None else 1.0
+
+        try:
+            for limiter in limiters:
+                if limiter is None:
+                    continue
+                await limiter.acquire(deadline.timeout(self.queue_timeout, "排隊"), tenant_id, weight)
+                acquired.append(limiter)
+        except AdmissionRejected as e:
+            ticket.release()
+            logger.warning(f"🚦 拒絕請求 ({e.status_code} {e.reason}): {e}，Retry-After {e.retry_after}s")
+            raise
+        except BaseException:
+            ticket.release()
+            raise
+
+        return ticket
+
+    @asynccontextmanager
+    async def admit(self, service_id: str, tenant: Any = None):
+        ticket = await self.acquire(service_id, tenant)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queue_timeout": self.queue_timeout,
+            "global": self.global_limiter.summary(),
+            "providers": {service_id: limiter.summary() for service_id, limiter in self.providers.items()},
+            "tenants": {tenant_id: limiter.summary() for tenant_id, limiter in self.tenants.items()},
+        }
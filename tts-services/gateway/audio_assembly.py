@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+以分段音頻組合完整腳本
+文字依句子切段，各段音頻在存入分段快取前先修剪前後靜音並統一響度，
+組合時以短交叉淡化銜接，避免段落間的爆音與音量跳動
+"""
+
+import io
+import re
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from services.audio_decoder import pcm_to_wav
+
+# 句子結尾 (保留標點在該段結尾)
+SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+
+# 低於此振幅 (約 -50 dBFS) 視為靜音
+SILENCE_THRESHOLD = 100
+
+
+def split_segments(text: str, min_chars: int = 4) -> List[str]:
+    """
+    依句子切段，過短的片段 (例如單獨的標點或稱呼) 併入下一段
+    各段去除前後空白，串接後與原文只差段間空白
+    """
+    segments: List[str] = []
+    pending = ""
+    for piece in SENTENCE_END.split(text):
+        pending += piece
+        if len(pending.strip()) >= min_chars:
+            segments.append(pending.strip())
+            pending = ""
+    if pending.strip():
+        if not segments:
+            segments.append(pending.strip())
+        elif pending[:1].isspace():
+            segments[-1] = f"{segments[-1]} {pending.strip()}"
+        else:
+            segments[-1] += pending.rstrip()
+    return segments
+
+
+def decode_pcm(wav_data: bytes) -> Tuple[np.ndarray, int]:
+    """WAV (任意樣本格式與聲道數) 轉為單聲道 int16 樣本"""
+    samples, sample_rate = sf.read(io.BytesIO(wav_data), dtype="int16", always_2d=True)
+    if samples.shape[1] > 1:
+        samples = samples.mean(axis=1).astype(np.int16)
+    else:
+        samples = samples[:, 0]
+    return np.ascontiguousarray(samples), sample_rate
+
+
+def wav_duration(wav_data: bytes) -> float:
+    """WAV 時長 (秒)，無法解析時返回 0"""
+    try:
+        return sf.info(io.BytesIO(wav_data)).duration
+    except Exception:
+        return 0.0
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, max_pause: float) -> np.ndarray:
+    """前後靜音各保留最多 max_pause 秒，段落間停頓一致"""
+    active = np.flatnonzero(np.abs(samples.astype(np.int32)) > SILENCE_THRESHOLD)
+    if active.size == 0:
+        return samples[:0]
+    keep = int(max_pause * sample_rate)
+    start = max(0, active[0] - keep)
+    end = min(len(samples), active[-1] + 1 + keep)
+    return samples[start:end]
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: float, peak_dbfs: float = -1.0, max_gain: float = 4.0) -> np.ndarray:
+    """
+    將有聲部分的 RMS 調整到 target_dbfs，峰值不超過 peak_dbfs
+    放大倍數不超過 max_gain，避免放大近乎無聲的片段
+    """
+    audio = samples.astype(np.float32)
+    active = audio[np.abs(audio) > SILENCE_THRESHOLD]
+    if active.size == 0:
+        return samples
+    rms = float(np.sqrt(np.mean(np.square(active))))
+    gain = 32767 * 10 ** (target_dbfs / 20) / rms
+    peak = float(np.max(np.abs(active)))
+    gain = min(gain, 32767 * 10 ** (peak_dbfs / 20) / peak, max_gain)
+    audio *= gain
+    np.clip(audio, -32768, 32767, out=audio)
+    return audio.astype(np.int16)
+
+
+def prepare_segment(wav_data: bytes, target_dbfs: float, max_pause: float) -> bytes:
+    """將上游返回的分段音頻整理為存入快取的格式 (修剪靜音、統一響度的單聲道 16-bit WAV)"""
+    samples, sample_rate = decode_pcm(wav_data)
+    samples = normalize_loudness(trim_silence(samples, sample_rate, max_pause), target_dbfs)
+    return pcm_to_wav(samples.tobytes(), sample_rate)
+
+
+def _resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """線性內插重新取樣 (只在同一音色的分段採樣率不一致時使用，例如服務設定變更前後的快取)"""
+    count = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(count) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+
+
+def join_segments(segments: Sequence[bytes], crossfade: float) -> Tuple[bytes, float]:
+    """
+    以交叉淡化串接分段 WAV，採樣率以第一段為準
+
+    Returns:
+        (WAV 音頻, 時長秒數)
+    """
+    decoded = [decode_pcm(wav_data) for wav_data in segments]
+    sample_rate = decoded[0][1]
+    parts = [
+        samples if rate == sample_rate else _resample(samples, rate, sample_rate)
+        for samples, rate in decoded
+    ]
+
+    fade = int(crossfade * sample_rate)
+    total = sum(len(part) for part in parts)
+    output = np.zeros(total, dtype=np.float32)
+    position = 0
+    for index, part in enumerate(parts):
+        overlap = min(fade, position, len(part)) if index > 0 else 0
+        start = position - overlap
+        chunk = part.astype(np.float32)
+        if overlap:
+            ramp = np.linspace(0, 1, overlap, dtype=np.float32)
+            output[start:position] *= 1 - ramp
+            chunk[:overlap] *= ramp
+        output[start:start + len(chunk)] += chunk
+        position = start + len(chunk)
+
+    np.clip(output[:position], -32768, 32767, out=output[:position])
+    pcm = output[:position].astype(np.int16)
+    return pcm_to_wav(pcm.tobytes(), sample_rate), position / sample_rate
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+合成音頻快取
+以 (種類, 服務, 音色設定, 語言, 文字) 為鍵保存 WAV 音頻於磁碟，重啟後仍可命中：
+- text: 整段文字的合成結果
+- segment: 單一句子 (分段) 的合成結果，已修剪靜音並統一響度，供組合模板化腳本
+依總位元組數以 LRU 淘汰，超過保存期限的項目視為未命中。
+同一個鍵同時只合成一次，其他請求等待同一個結果；所有等待者都離開時才取消合成
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("text", "segment")
+
+
+class _Flight:
+    """進行中的合成與等待者數量"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class AudioCache:
+    """
+    Args:
+        directory: 快取目錄，空字串表示停用
+        max_bytes: 總大小上限，超過時淘汰最久未使用的項目
+        ttl: 保存期限 (秒)，0 表示不限
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        # key -> (大小, 寫入時間)，依最近使用排序
+        self._index: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._in_flight: Dict[str, _Flight] = {}
+        self.hits = {kind: 0 for kind in KINDS}
+        self.misses = {kind: 0 for kind in KINDS}
+        self.shared = {kind: 0 for kind in KINDS}
+        self.stores = {kind: 0 for kind in KINDS}
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @staticmethod
+    def make_key(kind: str, service: str, voice_config: Optional[Dict[str, Any]], language: str, text: str) -> str:
+        """快取鍵 (音色設定依鍵名排序，欄位順序不影響命中)"""
+        payload = json.dumps(
+            [kind, service, voice_config or {}, language, text],
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return f"{kind}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    @staticmethod
+    def _kind(key: str) -> str:
+        return key.split("-", 1)[0]
+
+    def _scan(self) -> List[Tuple[str, int, float, float]]:
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(".tmp"):
+                    # 寫入途中中斷的暫存檔
+                    os.unlink(item.path)
+                    continue
+                if not item.name.endswith(".wav"):
+                    continue
+                stat = item.stat()
+                entries.append((item.name[:-4], stat.st_size, stat.st_mtime, stat.st_atime))
+        return entries
+
+    async def load(self):
+        """啟動時讀取磁碟上的既有項目 (依最後使用時間排序)"""
+        if not self.enabled:
+            return
+        try:
+            entries = await asyncio.to_thread(self._scan)
+        except OSError as e:
+            logger.error(f"❌ 讀取音頻快取目錄失敗，停用快取: {e}")
+            self.directory = ""
+            return
+        for key, size, stored_at, used_at in sorted(entries, key=lambda entry: entry[3]):
+            self._index[key] = (size, stored_at)
+            self.total_bytes += size
+        await self._evict()
+        logger.info(f"🗃️ 音頻快取: {len(self._index)} 項，{self.total_bytes / 1024 / 1024:.1f} MB ({self.directory})")
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _read(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as f:
+            data = f.read()
+        # 以 atime 記錄最後使用時間 (重啟後的 LRU 順序)，mtime 保留寫入時間
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+        return data
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _remove(self, keys: List[str]):
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def contains(self, key: str) -> bool:
+        entry = self._index.get(key)
+        return entry is not None and not self._expired(entry[1])
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """讀取快取，未命中返回 None"""
+        kind = self._kind(key)
+        entry = self._index.get(key)
+        if entry is None or self._expired(entry[1]):
+            self.misses[kind] += 1
+            if entry is not None:
+                await self._drop([key])
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, key)
+        except OSError as e:
+            logger.warning(f"⚠️ 讀取音頻快取失敗 {key}: {e}")
+            self.errors += 1
+            self.misses[kind] += 1
+            await self._drop([key])
+            return None
+        if key in self._index:
+            self._index.move_to_end(key)
+        self.hits[kind] += 1
+        return data
+
+    async def put(self, key: str, data: bytes):
+        """寫入快取 (失敗只記錄，不影響請求)"""
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            logger.warning(f"⚠️ 寫入音頻快取失敗 {key}: {e}")
+            self.errors += 1
+            return
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[0]
+        self._index[key] = (len(data), time.time())
+        self.total_bytes += len(data)
+        self.stores[self._kind(key)] += 1
+        await self._evict()
+
+    async def _drop(self, keys: List[str]):
+        for key in keys:
+            entry = self._index.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[0]
+        try:
+            await asyncio.to_thread(self._remove, keys)
+        except OSError as e:
+            logger.warning(f"⚠️ 刪除音頻快取失敗: {e}")
+
+    async def _evict(self):
+        """移除過期項目，並淘汰最久未使用的項目直到低於大小上限"""
+        victims = {key for key, (_, stored_at) in self._index.items() if self._expired(stored_at)}
+        remaining = self.total_bytes - sum(self._index[key][0] for key in victims)
+        for key, (size, _) in self._index.items():
+            if remaining <= self.max_bytes:
+                break
+            if key not in victims:
+                victims.add(key)
+                remaining -= size
+        if victims:
+            self.evictions += len(victims)
+            await self._drop(list(victims))
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Tuple[bytes, bool]]]
+    ) -> Tuple[bytes, str]:
+        """
+        讀取快取，未命中時合成並寫入；同一個鍵同時只合成一次
+
+        Args:
+            factory: 合成協程工廠，返回 (音頻, 是否可快取)
+
+        Returns:
+            (音頻, 來源: hit / shared / miss)
+        """
+        if self.enabled:
+            cached = await self.get(key)
+            if cached is not None:
+                return cached, "hit"
+
+        flight = self._in_flight.get(key)
+        outcome = "shared"
+        if flight is None:
+            outcome = "miss"
+            flight = _Flight(asyncio.ensure_future(self._create(key, factory)))
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared[self._kind(key)] += 1
+
+        flight.waiters += 1
+        try:
+            data = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 沒有請求在等待，取消合成 (例如所有呼叫端都已斷線)
+                flight.task.cancel()
+        return data, outcome
+
+    async def _create(self, key: str, factory: Callable[[], Awaitable[Tuple[bytes, bool]]]) -> bytes:
+        data, cacheable = await factory()
+        if cacheable:
+            await self.put(key, data)
+        return data
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory or None,
+            "entries": len(self._index),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "in_flight": len(self._in_flight),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "shared": dict(self.shared),
+            "stores": dict(self.stores),
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+背景健康檢查
+定期並行執行各服務的 health_check()，/health 直接返回最近一次的結果，
+單一服務卡住不會拖慢健康檢查端點
+
+可選的金絲雀探測 (canary) 會定期以固定短句實際合成語音，
+記錄成功與否、延遲與音頻有效性
+"""
+
+import asyncio
+import io
+import logging
+import time
+import wave
+from typing import Dict, Any, List, Optional
+
+from gateway.http_cache import CachedResponse
+from gateway.latency import RollingLatency
+
+logger = logging.getLogger(__name__)
+
+
+def validate_audio(audio_data: bytes, min_duration: float = 0.1) -> Optional[str]:
+    """檢查合成結果是否為有效音頻，返回錯誤訊息"""
+    if not audio_data:
+        return "空音頻數據"
+
+    if audio_data[:4] != b"RIFF":
+        # 非 WAV 格式 (例如轉換失敗時返回的 MP3)，只檢查大小
+        return None if len(audio_data) >= 1024 else f"音頻過短 ({len(audio_data)} bytes)"
+
+    try:
+        with wave.open(io.BytesIO(audio_data), "rb") as wav_file:
+            frames = wav_file.getnframes()
+            rate = wav_file.getframerate()
+    except Exception as e:
+        return f"WAV 解析失敗: {e}"
+
+    duration = frames / rate if rate else 0
+    if duration < min_duration:
+        return f"音頻時長過短 ({duration:.3f}s)"
+    return None
+
+
+class CanaryStats:
+    """單一服務的金絲雀探測統計"""
+
+    def __init__(self, window: int = 50):
+        self.latency = RollingLatency(window)
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_latency_ms: Optional[float] = None
+
+    def record(self, latency: float, error: Optional[str]):
+        self.runs += 1
+        self.last_latency_ms = round(latency * 1000, 1)
+        if error is None:
+            self.latency.add(latency)
+            self.consecutive_failures = 0
+            self.last_success_at = time.time()
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure_at = time.time()
+            self.last_error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+            "last_error": self.last_error,
+            "last_latency_ms": self.last_latency_ms,
+            "latency": self.latency.summary(),
+        }
+
+
+class HealthMonitor:
+    """定期探測各服務健康狀態並快取結果"""
+
+    def __init__(
+        self,
+        services: Dict[str, Any],
+        interval: float = 15,
+        probe_timeout: float = 5,
+        canary_enabled: bool = False,
+        canary_interval: float = 300,
+        canary_timeout: float = 30,
+        canary_services: Optional[List[str]] = None,
+        canary_text: str = "測試",
+        canary_failure_threshold: int = 2
+    ):
+        self.services = services
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+
+        # 金絲雀探測設定
+        self.canary_enabled = canary_enabled
+        self.canary_interval = canary_interval
+        self.canary_timeout = canary_timeout
+        self.canary_services = canary_services
+        self.canary_text = canary_text
+        self.canary_failure_threshold = canary_failure_threshold
+        self.canary_stats: Dict[str, CanaryStats] = {}
+        self._canary_task: Optional[asyncio.Task] = None
+
+        self.version = 0
+        self.checked_at: Optional[float] = None
+        self.snapshot: Optional[CachedResponse] = None
+        self._payload: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """先完成一次探測，再啟動背景定期探測"""
+        await self.probe_all()
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe_loop())
+        if self.canary_enabled and self._canary_task is None:
+            self._canary_task = asyncio.create_task(self._canary_loop())
+
+    async def stop(self):
+        for task in (self._task, self._canary_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._canary_task = None
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"健康檢查失敗: {e}")
+
+    async def _canary_loop(self):
+        while True:
+            try:
+                await self.run_canaries()
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"金絲雀探測失敗: {e}")
+            await asyncio.sleep(self.canary_interval)
+
+    def _canary_targets(self) -> List[str]:
+        service_ids = self.canary_services or list(self.services.keys())
+        return [
+            service_id for service_id in service_ids
+            if service_id in self.services and getattr(self.services[service_id], "is_initialized", False)
+        ]
+
+    async def run_canaries(self):
+        """並行對各服務執行一次金絲雀合成"""
+        await asyncio.gather(*[self._run_canary(service_id) for service_id in self._canary_targets()])
+
+    async def _run_canary(self, service_id: str):
+        service = self.services[service_id]
+        languages = getattr(service, "languages", None) or ["zh"]
+        language = "zh" if "zh" in languages else languages[0]
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                service.generate_speech(text=self.canary_text, format="wav", language=language),
+                self.canary_timeout
+            )
+            if result.get("success") and result.get("mode") == "simulation" and getattr(service, "api_key", None):
+                # 已設定金鑰卻返回模擬音頻，表示上游呼叫失敗後回退，不能視為健康
+                error = "上游合成失敗，回退到模擬音頻"
+            elif result.get("success"):
+                error = validate_audio(result.get("audio_data"))
+            else:
+                error = result.get("message", "合成失敗")
+        except asyncio.TimeoutError:
+            error = f"合成逾時 (>{self.canary_timeout}s)"
+        except Exception as e:
+            error = str(e)
+
+        latency = time.perf_counter() - start
+        self.canary_stats.setdefault(service_id, CanaryStats()).record(latency, error)
+
+        if error:
+            logger.warning(f"🐤 金絲雀探測失敗 {service_id}: {error} ({latency:.2f}s)")
+        else:
+            logger.info(f"🐤 金絲雀探測成功 {service_id}: {latency:.2f}s")
+
+    async def _probe(self, service_id: str) -> Dict[str, Any]:
+        try:
+            status = await asyncio.wait_for(self.services[service_id].health_check(), self.probe_timeout)
+        except asyncio.TimeoutError:
+            status = {"status": "unhealthy", "error": f"健康檢查逾時 (>{self.probe_timeout}s)"}
+        except Exception as e:
+            status = {"status": "unhealthy", "error": str(e)}
+
+        canary = self.canary_stats.get(service_id)
+        if canary is not None:
+            status = {**status, "canary": canary.to_dict()}
+            # 實際合成連續失敗時，即使服務自報正常也標記為不健康
+            if canary.consecutive_failures >= self.canary_failure_threshold:
+                status["status"] = "unhealthy"
+
+        return status
+
+    async def probe_all(self):
+        """並行探測所有服務，內容變更時才產生新版本"""
+        service_ids = list(self.services.keys())
+        results = await asyncio.gather(*[self._probe(service_id) for service_id in service_ids])
+        service_status = dict(zip(service_ids, results))
+
+        all_healthy = all(status.get("status") == "healthy" for status in service_status.values())
+        payload = {
+            "status": "healthy" if all_healthy else "degraded",
+            "services": service_status,
+        }
+
+        self.checked_at = time.time()
+        if payload != self._payload:
+            self._payload = payload
+            self.version += 1
+            self.snapshot = CachedResponse({**payload, "timestamp": self.checked_at})
+            logger.info(f"🩺 健康狀態更新 (版本 {self.version}): {payload['status']}")
+
+    def service_status(self, service_id: str) -> str:
+        """單一服務最近一次的健康狀態"""
+        if not self._payload:
+            return "unknown"
+        return self._payload["services"].get(service_id, {}).get("status", "unknown")
+
+    def service_mode(self, service_id: str) -> Optional[str]:
+        """單一服務最近一次健康檢查回報的模式 (real / simulation / mock)，未回報時返回 None"""
+        if not self._payload:
+            return None
+        return self._payload["services"].get(service_id, {}).get("mode")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+預先序列化的 JSON 回應快取
+回應內容只在資料版本變更時重建，並以 ETag 支援 304 Not Modified
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判斷 If-None-Match 是否命中 (支援多個值、* 與弱 ETag)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class CachedResponse:
+    """序列化完成的 JSON 回應與其 ETag"""
+
+    def __init__(self, payload: Any, headers: Dict[str, str] = None):
+        self.payload = payload
+        self.body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+        self.headers = headers or {}
+
+    def to_response(self, request: Request, extra_headers: Dict[str, str] = None) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            **self.headers,
+            **(extra_headers or {}),
+        }
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class VersionedResponseCache:
+    """
+    依版本鍵快取回應
+    版本鍵不變時直接返回已序列化的回應，變更時只由一個請求重建
+    """
+
+    def __init__(self):
+        self._key: Optional[Hashable] = None
+        self._cached: Optional[CachedResponse] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: Hashable, builder: Callable[[], Awaitable[Any]]) -> CachedResponse:
+        cached = self._cached
+        if cached is not None and self._key == key:
+            return cached
+
+        async with self._lock:
+            if self._cached is None or self._key != key:
+                self._cached = CachedResponse(await builder())
+                self._key = key
+            return self._cached
+
+    def invalidate(self):
+        self._key = None
+        self._cached = None
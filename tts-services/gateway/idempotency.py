@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key 支援
+帶相同 Idempotency-Key 的重試請求不會再次呼叫上游：合成進行中時等待同一個合成結果，
+完成後在保存期間內直接返回已保存的音頻文件；合成失敗的結果不保存，重試會重新合成
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 不影響合成結果、不納入請求指紋的欄位
+IGNORED_FIELDS = {"timeout"}
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """同一個 Idempotency-Key 對應到內容不同的請求"""
+
+
+def fingerprint(data: Dict[str, Any]) -> str:
+    """請求內容的指紋"""
+    payload = {key: value for key, value in data.items() if key not in IGNORED_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IdempotencyEntry:
+    """單一 Idempotency-Key 的合成狀態"""
+
+    def __init__(self, key: Tuple[str, str], request_fingerprint: str):
+        self.key = key
+        self.fingerprint = request_fingerprint
+        self.created_at = time.time()
+        self.completed_at: Optional[float] = None
+        self.task: Optional[asyncio.Future] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.job_id: Optional[str] = None  # 帶 callback_url 的非同步任務，重試時返回同一個 job_id
+        self.replays = 0
+
+    @property
+    def in_flight(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+
+class IdempotencyStore:
+    """
+    以 (租戶, Idempotency-Key) 為鍵保存合成結果
+    只保存結果的描述 (文件名、服務、時長)，音頻本身已保存在共享目錄，不佔用記憶體
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], IdempotencyEntry]" = OrderedDict()
+        self.hits = 0
+        self.attached = 0
+        self.misses = 0
+
+    def _purge(self):
+        """移除過期與超出數量上限的已完成結果 (進行中的合成不移除)"""
+        cutoff = time.time() - self.ttl
+        for key, entry in list(self._entries.items()):
+            if entry.completed_at is not None and entry.completed_at < cutoff:
+                del self._entries[key]
+
+        overflow = len(self._entries) - self.max_entries
+        for key, entry in list(self._entries.items()):
+            if overflow <= 0:
+                break
+            if not entry.in_flight:
+                del self._entries[key]
+                overflow -= 1
+
+    def begin(self, tenant_id: str, idempotency_key: str, data: Dict[str, Any]) -> Tuple[IdempotencyEntry, bool]:
+        """
+        查詢或建立 Idempotency-Key 對應的項目
+
+        Returns:
+            (項目, 是否由此請求負責合成)
+
+        Raises:
+            ValueError: Idempotency-Key 格式錯誤
+            IdempotencyConflict: 同一個 Key 已用於內容不同的請求
+        """
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key 長度需為 1-{MAX_KEY_LENGTH} 字元")
+
+        self._purge()
+        key = (tenant_id, idempotency_key)
+        request_fingerprint = fingerprint(data)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != request_fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key '{idempotency_key}' 已用於內容不同的請求")
+            entry.replays += 1
+            if entry.in_flight:
+                self.attached += 1
+                logger.info(f"🔁 Idempotency-Key {idempotency_key} 合成進行中，等待同一結果")
+            else:
+                self.hits += 1
+                logger.info(f"🔁 Idempotency-Key {idempotency_key} 返回已保存的結果")
+            return entry, False
+
+        self.misses += 1
+        entry = IdempotencyEntry(key, request_fingerprint)
+        self._entries[key] = entry
+        return entry, True
+
+    def run(self, entry: IdempotencyEntry, coro, describe: Callable[[Any], Dict[str, Any]]) -> asyncio.Future:
+        """
+        以獨立任務執行合成，呼叫端斷線不會取消 (重試請求可以接續等待)
+
+        Args:
+            entry: begin() 建立的項目
+            coro: 合成協程
+            describe: 從合成結果取出要保存的描述
+        """
+        task = asyncio.ensure_future(coro)
+        entry.task = task
+
+        def _done(finished: asyncio.Future):
+            if finished.cancelled() or finished.exception() is not None:
+                # 失敗不保存，讓下一次重試重新合成
+                if self._entries.get(entry.key) is entry:
+                    del self._entries[entry.key]
+                return
+            entry.result = describe(finished.result())
+            entry.completed_at = time.time()
+            entry.task = None
+
+        task.add_done_callback(_done)
+        return task
+
+    def forget(self, entry: IdempotencyEntry):
+        """移除項目 (例如保存的文件已不存在)"""
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "in_flight": sum(1 for entry in self._entries.values() if entry.in_flight),
+            "hits": self.hits,
+            "attached": self.attached,
+            "misses": self.misses,
+        }
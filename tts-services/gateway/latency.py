@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+延遲統計工具
+"""
+
+import math
+from collections import deque
+from typing import Dict, Optional
+
+
+class RollingLatency:
+    """保留最近 N 筆延遲樣本，計算百分位數 (單位: 秒)"""
+
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """p50 / p95 / p99，以毫秒表示"""
+        result = {"count": len(self.samples)}
+        for q in (50, 95, 99):
+            value = self.percentile(q)
+            result[f"p{q}_ms"] = round(value * 1000, 1) if value is not None else None
+        return result
+
+
+class EWMA:
+    """指數加權移動平均，新樣本權重為 alpha"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def add(self, sample: float):
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value = self.alpha * sample + (1 - self.alpha) * self.value
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+事件迴圈延遲監控
+背景協程定期 sleep 並量測實際喚醒的延遲 (即事件迴圈被阻塞的時間)，
+另以看門狗執行緒在阻塞發生「當下」擷取事件迴圈執行緒的堆疊，找出是哪個同步呼叫卡住了迴圈
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional
+
+from gateway.latency import EWMA, RollingLatency
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Args:
+        interval: 量測間隔 (秒)
+        threshold: 延遲超過此值視為阻塞並擷取堆疊 (秒)
+        capture_interval: 兩次堆疊擷取的最短間隔 (秒)，避免持續阻塞時大量輸出
+        max_captures: 保留最近幾筆堆疊
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.2,
+        capture_interval: float = 60,
+        max_captures: int = 20
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.capture_interval = capture_interval
+
+        self.lag = RollingLatency(600)
+        self.lag_ewma = EWMA(0.1)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.captures: Deque[Dict[str, Any]] = deque(maxlen=max_captures)
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._last_capture_at = 0.0
+        self._current_capture: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"🩺 事件迴圈延遲監控已啟動 (閾值 {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._watchdog = None
+
+    async def _measure_loop(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self._record(lag)
+
+    def _record(self, lag: float):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.lag.add(lag)
+        self.lag_ewma.add(lag)
+
+        if lag >= self.threshold:
+            self.stalls += 1
+            capture = self._current_capture
+            self._current_capture = None
+            if capture is not None:
+                # 看門狗在阻塞期間擷取的堆疊，補上最終的阻塞時間
+                capture["lag_ms"] = round(lag * 1000, 1)
+                logger.warning(
+                    f"🐢 事件迴圈阻塞 {lag * 1000:.0f}ms，阻塞位置:\n{capture['stack']}"
+                )
+            else:
+                logger.warning(f"🐢 事件迴圈阻塞 {lag * 1000:.0f}ms")
+        else:
+            self._current_capture = None
+
+    def _watch(self):
+        """看門狗執行緒: 事件迴圈超過閾值未回報心跳時，擷取迴圈執行緒目前的堆疊"""
+        check_interval = min(self.interval, self.threshold / 2)
+        while not self._stopped.wait(check_interval):
+            stalled_for = time.monotonic() - self._heartbeat - self.interval
+            if stalled_for < self.threshold or self._current_capture is not None:
+                continue
+            now = time.time()
+            if now - self._last_capture_at < self.capture_interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._last_capture_at = now
+            capture = {
+                "captured_at": now,
+                "stalled_ms": round(stalled_for * 1000, 1),
+                "lag_ms": None,
+                "stack": "".join(traceback.format_stack(frame)),
+            }
+            self._current_capture = capture
+            self.captures.append(capture)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "ewma_lag_ms": round(self.lag_ewma.value * 1000, 1) if self.lag_ewma.value is not None else None,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            **self.lag.summary(),
+        }
+
+    def recent_captures(self) -> List[Dict[str, Any]]:
+        """最近擷取的阻塞堆疊 (新到舊)"""
+        return list(reversed(self.captures))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+進行中音頻的記憶體預算
+每個請求依文字長度與採樣率預估音頻大小並預留位元組，合成完成後以實際大小校正，
+回應送出後釋放；預算不足時排隊等待，超出預算或等待逾時則拒絕
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Tuple
+
+from gateway.admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# cgroup 記憶體上限檔案 (v2 / v1)
+CGROUP_LIMIT_FILES = [
+    "/sys/fs/cgroup/memory.max",
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+]
+
+
+def detect_memory_limit() -> Optional[int]:
+    """讀取容器的記憶體上限，未限制時返回 None"""
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path, "r") as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        limit = int(value)
+        # cgroup v1 未限制時為接近 2^63 的數值
+        if limit >= 1 << 60:
+            return None
+        return limit
+    return None
+
+
+class MemoryReservation:
+    """單一請求的記憶體預留，release() 可重複呼叫"""
+
+    def __init__(self, budget: "MemoryBudget", nbytes: int):
+        self._budget = budget
+        self.nbytes = nbytes
+        self.released = False
+
+    def reconcile(self, actual_bytes: int):
+        """以實際音頻大小校正預留量"""
+        if not self.released:
+            self._budget._adjust(actual_bytes - self.nbytes)
+            self.nbytes = actual_bytes
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._budget._adjust(-self.nbytes, released=True)
+
+
+class MemoryBudget:
+    """Gateway 全域的位元組預算 (FIFO 等待，避免大請求被小請求餓死)"""
+
+    def __init__(
+        self,
+        limit_bytes: int,
+        queue_timeout: float = 30,
+        seconds_per_char: float = 0.3,
+        overhead: float = 3.0,
+        drain_window: float = 60
+    ):
+        self.limit_bytes = limit_bytes
+        self.queue_timeout = queue_timeout
+        self.seconds_per_char = seconds_per_char
+        self.overhead = overhead
+        self.drain_window = drain_window
+        self.reserved_bytes = 0
+        self.peak_bytes = 0
+        self.rejected: Dict[str, int] = {"too_large": 0, "timeout": 0}
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._releases: Deque[float] = deque()
+
+    @classmethod
+    def from_env(cls, queue_timeout: float) -> "MemoryBudget":
+        """
+        MEMORY_BUDGET_MB 明確指定預算；否則取容器記憶體上限 × MEMORY_BUDGET_FRACTION，
+        無法偵測上限時預設 1024 MB
+        """
+        budget_mb = os.getenv("MEMORY_BUDGET_MB")
+        if budget_mb:
+            limit_bytes = int(float(budget_mb) * 1024 * 1024)
+        else:
+            container_limit = detect_memory_limit()
+            fraction = float(os.getenv("MEMORY_BUDGET_FRACTION", "0.5"))
+            limit_bytes = int(container_limit * fraction) if container_limit else 1024 * 1024 * 1024
+
+        logger.info(f"🧮 音頻記憶體預算: {limit_bytes / 1024 / 1024:.0f} MB")
+        return cls(
+            limit_bytes,
+            queue_timeout=queue_timeout,
+            seconds_per_char=float(os.getenv("MEMORY_SECONDS_PER_CHAR", "0.3")),
+            overhead=float(os.getenv("MEMORY_OVERHEAD_FACTOR", "3"))
+        )
+
+    def estimate(self, text: str, sample_rate: int, channels: int = 1, sample_width: int = 2) -> int:
+        """
+        預估請求佔用的位元組數
+        音頻時長依字數估算，再乘上上游原始數據、解碼後 WAV 與回應副本的倍數
+        """
+        seconds = max(1.0, len(text or "") * self.seconds_per_char)
+        return int(seconds * sample_rate * channels * sample_width * self.overhead)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> int:
+        cutoff = time.monotonic() - self.drain_window
+        while self._releases and self._releases[0] < cutoff:
+            self._releases.popleft()
+        rate = len(self._releases) / self.drain_window
+        wait = (self.queue_depth + 1) / rate if rate > 0 else self.queue_timeout
+        return max(1, min(120, math.ceil(wait)))
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.reserved_bytes + nbytes <= self.limit_bytes
+
+    async def reserve(self, nbytes: int, timeout: Optional[float] = None) -> MemoryReservation:
+        """預留位元組，預算不足時排隊等待"""
+        if nbytes > self.limit_bytes:
+            self.rejected["too_large"] += 1
+            raise AdmissionRejected(
+                413, "too_large", 60,
+                f"請求預估需要 {nbytes / 1024 / 1024:.1f} MB，超過記憶體預算 {self.limit_bytes / 1024 / 1024:.1f} MB，請縮短文字"
+            )
+
+        if not self._waiters and self._fits(nbytes):
+            self._adjust(nbytes)
+            return MemoryReservation(self, nbytes)
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (nbytes, waiter)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 已預留成功但呼叫端放棄，歸還
+                self._adjust(-nbytes)
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(entry)
+                except ValueError:
+                    pass
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected["timeout"] += 1
+                raise AdmissionRejected(
+                    503, "memory_timeout", self._retry_after(),
+                    f"記憶體預算不足，等待逾時 ({timeout:.1f}s)"
+                )
+            raise
+
+        return MemoryReservation(self, nbytes)
+
+    def _adjust(self, delta: int, released: bool = False):
+        self.reserved_bytes += delta
+        self.peak_bytes = max(self.peak_bytes, self.reserved_bytes)
+        if released:
+            # 只以完整釋放計算消化速度，校正不算
+            self._releases.append(time.monotonic())
+        if delta < 0:
+            self._wake()
+
+    def _wake(self):
+        """依序喚醒放得下的等待者"""
+        while self._waiters:
+            nbytes, waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self.reserved_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.reserved_bytes)
+            waiter.set_result(None)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "limit_bytes": self.limit_bytes,
+            "reserved_bytes": self.reserved_bytes,
+            "peak_bytes": self.peak_bytes,
+            "queue_depth": self.queue_depth,
+            "rejected": dict(self.rejected),
+            "seconds_per_char": self.seconds_per_char,
+            "overhead": self.overhead,
+        }
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Prometheus 指標
+各元件已自行維護統計數據，這裡只在抓取時以回呼讀取並輸出文字格式，
+不引入額外依賴
+"""
+
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 回呼返回 (標籤, 數值) 列表
+Samples = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """以回呼收集的指標註冊表"""
+
+    def __init__(self):
+        self._metrics: List[Tuple[str, str, str, Callable[[], Samples]]] = []
+
+    def register(self, name: str, metric_type: str, help_text: str, collect: Callable[[], Samples]):
+        """
+        註冊指標
+
+        Args:
+            name: 指標名稱
+            metric_type: counter / gauge
+            help_text: 說明
+            collect: 抓取時呼叫，返回 (標籤, 數值) 列表
+        """
+        self._metrics.append((name, metric_type, help_text, collect))
+
+    def render(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        lines = []
+        for name, metric_type, help_text, collect in self._metrics:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning(f"收集指標 {name} 失敗: {e}")
+                continue
+
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value if isinstance(value, int) else float(value)}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+預先合成 (快取預熱)
+事先知道的腳本 (例如隔天的活動文案、固定的試聽句) 以低優先順序在閒置時合成並寫入音頻快取，
+尖峰時段的請求直接命中快取，上游用量移到離峰時段：
+- 全部任務依序執行，同時只合成一項，且只在 Gateway 與該服務沒有排隊、進行中請求不多時才送出
+- 每個任務有字數與成本上限 (以服務的計費估算)，超出上限的項目略過，不呼叫上游
+- 已在快取中的項目直接標記完成，不計入用量
+任務只保存在記憶體，重啟後需重新送出 (已寫入快取的結果不受影響)
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 項目狀態: pending (等待中)、running (合成中)、cached (已在快取)、warmed (已合成並寫入快取)、
+# uncacheable (已合成但結果不可快取，例如模擬音頻)、skipped (超出用量上限)、failed (失敗)、cancelled (已取消)
+ITEM_STATUSES = ("pending", "running", "cached", "warmed", "uncacheable", "skipped", "failed", "cancelled")
+
+# 任務狀態: scheduled (等待 start_at)、queued (排隊中)、running (執行中)、completed (完成)、cancelled (已取消)
+FINISHED_JOB_STATUSES = ("completed", "cancelled")
+
+
+class PrefetchJob:
+    """
+    一批預先合成的項目
+
+    Args:
+        tenant: 送出任務的租戶 (合成字數計入該租戶的配額)
+        items: 已驗證的項目，每項需有 text / service / voice_config / language / cache 與
+               estimated_cost_usd (整段文字的估算成本)
+        max_characters: 實際送往上游的字數上限
+        max_cost: 估算成本上限 (USD)，None 表示不限
+        start_at: 最早開始時間 (Unix 秒)，None 表示立即排隊
+    """
+
+    def __init__(
+        self,
+        tenant: Any,
+        items: List[Dict[str, Any]],
+        max_characters: int,
+        max_cost: Optional[float] = None,
+        start_at: Optional[float] = None,
+        metadata: Any = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.items = [{**item, "status": "pending", "characters": 0, "cost_usd": 0.0, "error": None} for item in items]
+        self.max_characters = max_characters
+        self.max_cost = max_cost
+        self.start_at = start_at
+        self.metadata = metadata
+        self.status = "scheduled" if start_at and start_at > time.time() else "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.characters = 0
+        self.cost_usd = 0.0
+        self.idle_wait_seconds = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_JOB_STATUSES
+
+    def over_budget(self, item: Dict[str, Any]) -> Optional[str]:
+        """以整段文字估算 (分段快取只會更少)，超出上限時返回原因"""
+        if self.characters + len(item["text"]) > self.max_characters:
+            return f"超出字數上限 {self.max_characters}"
+        if self.max_cost is not None and self.cost_usd + item["estimated_cost_usd"] > self.max_cost:
+            return f"超出成本上限 ${self.max_cost}"
+        return None
+
+    def charge(self, item: Dict[str, Any], characters: int):
+        """記錄實際送往上游的字數，成本依字數比例計算"""
+        cost = item["estimated_cost_usd"] * characters / max(1, len(item["text"]))
+        item["characters"] = characters
+        item["cost_usd"] = round(cost, 6)
+        self.characters += characters
+        self.cost_usd += cost
+
+    def progress(self) -> Dict[str, int]:
+        counts = {status: 0 for status in ITEM_STATUSES}
+        for item in self.items:
+            counts[item["status"]] += 1
+        return counts
+
+    def summary(self, include_items: bool = False) -> Dict[str, Any]:
+        progress = self.progress()
+        done = len(self.items) - progress["pending"] - progress["running"]
+        result = {
+            "job_id": self.id,
+            "tenant": self.tenant.id,
+            "status": self.status,
+            "total": len(self.items),
+            "done": done,
+            "progress": progress,
+            "characters": self.characters,
+            "max_characters": self.max_characters,
+            "cost_usd": round(self.cost_usd, 4),
+            "max_cost_usd": self.max_cost,
+            "idle_wait_seconds": round(self.idle_wait_seconds, 1),
+            "start_at": self.start_at,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "metadata": self.metadata,
+        }
+        if include_items:
+            result["items"] = [
+                {
+                    "index": index,
+                    "service": item["service"],
+                    "text": item["text"][:50],
+                    "status": item["status"],
+                    "characters": item["characters"],
+                    "cost_usd": item["cost_usd"],
+                    "error": item["error"],
+                }
+                for index, item in enumerate(self.items)
+            ]
+        return result
+
+
+class PrefetchScheduler:
+    """
+    依序執行預先合成任務的背景迴圈
+
+    Args:
+        is_cached: 項目是否已在快取中
+        run_item: 合成項目並寫入快取，返回 (是否已寫入快取, 實際送往上游的字數)；失敗時拋出例外
+        is_idle: 指定服務目前是否閒置 (可送出低優先順序的合成)
+        poll_interval: 等待閒置時的檢查間隔 (秒)
+        history: 保留的已結束任務數
+    """
+
+    def __init__(
+        self,
+        is_cached: Callable[[Dict[str, Any]], bool],
+        run_item: Callable[[PrefetchJob, Dict[str, Any]], Awaitable[Tuple[bool, int]]],
+        is_idle: Callable[[str], bool],
+        poll_interval: float = 1.0,
+        history: int = 100
+    ):
+        self.is_cached = is_cached
+        self.run_item = run_item
+        self.is_idle = is_idle
+        self.poll_interval = poll_interval
+        self.history = history
+
+        self.jobs: "OrderedDict[str, PrefetchJob]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[Tuple[PrefetchJob, asyncio.Future]] = None
+        self.items = {status: 0 for status in ITEM_STATUSES if status not in ("pending", "running")}
+        self.characters = 0
+        self.cost_usd = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    @property
+    def pending_items(self) -> int:
+        return sum(
+            1 for job in self.jobs.values() if not job.finished
+            for item in job.items if item["status"] == "pending"
+        )
+
+    def submit(self, job: PrefetchJob) -> PrefetchJob:
+        self.jobs[job.id] = job
+        self._trim_history()
+        self._wakeup.set()
+        logger.info(f"🔥 已接受預先合成任務 {job.id}: {len(job.items)} 項，字數上限 {job.max_characters}")
+        return job
+
+    def get(self, job_id: str) -> Optional[PrefetchJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[PrefetchJob]:
+        """取消任務：未開始的項目標記為 cancelled，合成中的項目立即中止"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        for item in job.items:
+            if item["status"] == "pending":
+                self._finish_item(item, "cancelled")
+        if self._current and self._current[0] is job:
+            self._current[1].cancel()
+        self._finish_job(job, "cancelled")
+        self._wakeup.set()
+        return job
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _finish_item(self, item: Dict[str, Any], status: str, error: Optional[str] = None):
+        item["status"] = status
+        item["error"] = error
+        self.items[status] += 1
+
+    def _finish_job(self, job: PrefetchJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        progress = job.progress()
+        logger.info(
+            f"🔥 預先合成任務 {job.id} {status}: 寫入快取 {progress['warmed']} 項、已在快取 {progress['cached']} 項、"
+            f"略過 {progress['skipped']} 項、失敗 {progress['failed']} 項，"
+            f"{job.characters} 字 / ${job.cost_usd:.4f}"
+        )
+        self._trim_history()
+
+    def _next_job(self) -> Tuple[Optional[PrefetchJob], Optional[float]]:
+        """返回下一個可執行的任務，以及沒有可執行任務時最近的 start_at"""
+        now = time.time()
+        upcoming = None
+        for job in self.jobs.values():
+            if job.finished:
+                continue
+            if job.status == "scheduled":
+                if job.start_at > now:
+                    upcoming = job.start_at if upcoming is None else min(upcoming, job.start_at)
+                    continue
+                job.status = "queued"
+            return job, None
+        return None, upcoming
+
+    async def _run_loop(self):
+        while True:
+            job, upcoming = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                wait = max(0.0, upcoming - time.time()) if upcoming is not None else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ 預先合成任務 {job.id} 異常: {e}")
+                for item in job.items:
+                    if item["status"] in ("pending", "running"):
+                        self._finish_item(item, "failed", str(e))
+                self._finish_job(job, "completed")
+
+    async def _wait_idle(self, job: PrefetchJob, service: str):
+        # 等待時間逐次累加，查詢進度時可看出任務正在等待閒置
+        while not job.finished and not self.is_idle(service):
+            started = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
+            job.idle_wait_seconds += time.monotonic() - started
+
+    async def _run_job(self, job: PrefetchJob):
+        job.status = "running"
+        job.started_at = job.started_at or time.time()
+        for item in job.items:
+            if job.finished:
+                return
+            if item["status"] != "pending":
+                continue
+
+            if self.is_cached(item):
+                self._finish_item(item, "cached")
+                continue
+            reason = job.over_budget(item)
+            if reason:
+                self._finish_item(item, "skipped", reason)
+                continue
+
+            await self._wait_idle(job, item["service"])
+            if job.finished:
+                return
+
+            item["status"] = "running"
+            task = asyncio.ensure_future(self.run_item(job, item))
+            self._current = (job, task)
+            try:
+                stored, characters = await task
+            except asyncio.CancelledError:
+                if job.finished:
+                    # 任務已取消，只中止這一項
+                    self._finish_item(item, "cancelled")
+                    return
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                logger.warning(f"⚠️ 預先合成失敗 ({job.id} / {item['service']}): {detail}")
+                self._finish_item(item, "failed", str(detail))
+                continue
+            finally:
+                self._current = None
+
+            job.charge(item, characters)
+            self.characters += characters
+            self.cost_usd += item["cost_usd"]
+            self._finish_item(item, "warmed" if stored else "uncacheable")
+
+        self._finish_job(job, "completed")
+
+    def summary(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        current = self._current[0].id if self._current else None
+        return {
+            "jobs": statuses,
+            "pending_items": self.pending_items,
+            "current_job": current,
+            "items": dict(self.items),
+            "characters": self.characters,
+            "cost_usd": round(self.cost_usd, 4),
+            "poll_interval": self.poll_interval,
+        }
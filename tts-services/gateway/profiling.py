@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+線上診斷工具
+- tracemalloc 記憶體追蹤：開始追蹤時保存基準快照，之後查詢相對基準增加最多的配置位置
+- 統計式 CPU 取樣：在背景執行緒定期擷取所有執行緒的堆疊，輸出 flamegraph 可用的 collapsed stack 格式
+- asyncio 任務傾印：列出所有任務與各自目前等待的位置
+"""
+
+import asyncio
+import linecache
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+
+class ProfilerBusy(Exception):
+    """已有 CPU 取樣進行中"""
+
+
+class MemoryProfiler:
+    """tracemalloc 追蹤 (追蹤期間配置會變慢，診斷完應停止)"""
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self.started_at: Optional[float] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 25) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.started_at = time.time()
+        self._baseline = tracemalloc.take_snapshot()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        status = self.status()
+        tracemalloc.stop()
+        self._baseline = None
+        self.started_at = None
+        return status
+
+    def status(self) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "started_at": self.started_at,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_mb": round(current / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+        }
+
+    def top(self, limit: int = 20, group_by: str = "lineno", compare: bool = True) -> Dict[str, Any]:
+        """
+        配置最多的位置
+
+        Args:
+            limit: 返回筆數
+            group_by: lineno (行) / filename (文件) / traceback (完整呼叫堆疊)
+            compare: 與開始追蹤時的基準快照比較，只看增加量
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc 尚未啟動")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+        if compare and self._baseline is not None:
+            stats = snapshot.compare_to(self._baseline, group_by)
+        else:
+            stats = snapshot.statistics(group_by)
+
+        entries = []
+        for stat in stats[:limit]:
+            entry = {
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+                "traceback": [
+                    f"{frame.filename}:{frame.lineno} {linecache.getline(frame.filename, frame.lineno).strip()}"
+                    for frame in stat.traceback
+                ],
+            }
+            if hasattr(stat, "size_diff"):
+                entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+                entry["count_diff"] = stat.count_diff
+            entries.append(entry)
+        return {**self.status(), "group_by": group_by, "compared": compare and self._baseline is not None, "top": entries}
+
+
+def _collapse(frame) -> str:
+    """堆疊轉成 collapsed 格式: 外層;...;內層"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class CpuSampler:
+    """統計式 CPU 取樣 (同時間只允許一個取樣)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _sample(self, duration: float, interval: float) -> Dict[str, Any]:
+        own_thread = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        counts: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                thread_name = thread_names.get(thread_id)
+                if thread_name is None:
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    thread_name = thread_names.get(thread_id, str(thread_id))
+                counts[f"{thread_name};{_collapse(frame)}"] += 1
+            samples += 1
+            time.sleep(interval)
+        return {"samples": samples, "counts": counts}
+
+    async def profile(self, duration: float, interval: float = 0.01) -> Dict[str, Any]:
+        """
+        取樣 duration 秒，返回 collapsed stack 文字 (每行「堆疊 次數」，可直接交給 flamegraph.pl / speedscope)
+
+        Raises:
+            ProfilerBusy: 已有取樣進行中
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("已有 CPU 取樣進行中")
+        try:
+            result = await asyncio.to_thread(self._sample, duration, interval)
+        finally:
+            self._lock.release()
+        collapsed = "\n".join(
+            f"{stack} {count}" for stack, count in result["counts"].most_common()
+        )
+        return {"samples": result["samples"], "collapsed": collapsed + "\n" if collapsed else ""}
+
+
+def _awaiting(coro) -> Optional[str]:
+    """沿著 cr_await 找到任務最內層正在等待的物件"""
+    awaited = None
+    while coro is not None:
+        next_coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if next_coro is None:
+            break
+        awaited = next_coro
+        coro = next_coro
+    return repr(awaited)[:200] if awaited is not None else None
+
+
+def dump_tasks(stack_limit: int = 20) -> List[Dict[str, Any]]:
+    """列出目前事件迴圈中的所有 asyncio 任務"""
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        frames = task.get_stack(limit=stack_limit)
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "awaiting": _awaiting(coro),
+            "stack": [
+                f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+                for frame in frames
+            ],
+        })
+    tasks.sort(key=lambda item: item["coro"])
+    return tasks
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+自動路由 (service: "auto")
+依語言、音色對應表、延遲 (EWMA)、排隊深度與估算成本為每個請求挑選服務，
+延遲變高的服務會自動分到較少流量
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+from gateway.latency import EWMA, RollingLatency
+from services import deadline
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ["lowest_latency", "lowest_cost", "cost_within_budget"]
+
+# 不會產生真實音頻的模式: 不參與自動路由，其延遲也不計入統計
+SIMULATED_MODES = ("simulation", "mock")
+
+
+def _base_language(language: str) -> str:
+    return (language or "").strip().lower().replace("_", "-").split("-", 1)[0]
+
+
+class ProviderStats:
+    """單一服務的路由統計"""
+
+    def __init__(self, alpha: float):
+        self.latency = EWMA(alpha)
+        self.success_latency = RollingLatency(100)
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_used_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ewma_latency_ms": round(self.latency.value * 1000, 1) if self.latency.value is not None else None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_used_at": self.last_used_at,
+        }
+
+
+class ProviderRouter:
+    """
+    路由策略:
+        - lowest_latency: 預估延遲最低
+        - lowest_cost: 估算成本最低，同價時取延遲較低者
+        - cost_within_budget: 預估延遲在預算內的服務中取成本最低，皆超出預算時退回 lowest_latency
+
+    預估延遲 = 延遲 EWMA × (1 + 進行中請求數 + 排隊請求數)；尚無樣本時使用金絲雀探測的 p50，再無則使用預設值
+    """
+
+    def __init__(
+        self,
+        services: Dict[str, Any],
+        health_monitor: Any = None,
+        policy: str = "lowest_latency",
+        latency_budget: float = 5.0,
+        alpha: float = 0.2,
+        default_latency: float = 2.0,
+        failure_penalty: float = 10.0,
+        allowed_services: Optional[List[str]] = None,
+        equivalence_path: Optional[str] = None,
+        queue_depth: Optional[Callable[[str], int]] = None
+    ):
+        if policy not in POLICIES:
+            logger.warning(f"⚠️ 路由策略 {policy} 不受支援 (可用: {POLICIES})，改用 lowest_latency")
+            policy = "lowest_latency"
+
+        self.services = services
+        self.health_monitor = health_monitor
+        self.policy = policy
+        self.latency_budget = latency_budget
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self.failure_penalty = failure_penalty
+        self.allowed_services = allowed_services
+        self.queue_depth = queue_depth
+        self.stats: Dict[str, ProviderStats] = {}
+        self.equivalence: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+        if equivalence_path:
+            self.load_equivalence(equivalence_path)
+
+    def load_equivalence(self, path: str):
+        """
+        載入音色對應表: 邏輯音色 -> {服務 ID: voice_config}
+        例如 {"zh_female": {"service1": {"voice": "zh-TW-HsiaoyuNeural"}, "service4": {"voice": "nova"}}}
+        """
+        if not os.path.exists(path):
+            logger.warning(f"⚠️ 音色對應表不存在: {path}")
+            return
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.equivalence = json.load(f)
+            logger.info(f"🔀 已載入音色對應表: {len(self.equivalence)} 組 ({path})")
+        except Exception as e:
+            logger.error(f"載入音色對應表失敗: {e}")
+
+    def _stats(self, service_id: str) -> ProviderStats:
+        if service_id not in self.stats:
+            self.stats[service_id] = ProviderStats(self.alpha)
+        return self.stats[service_id]
+
+    @asynccontextmanager
+    async def track(self, service_id: str):
+        """
+        記錄一次上游請求的延遲與排隊深度，區塊內拋出例外視為失敗
+        區塊內可將合成結果的 mode 寫入產生的 dict，模擬音頻 (例如上游失敗後的回退) 不計入延遲統計
+        """
+        stats = self._stats(service_id)
+        stats.in_flight += 1
+        stats.requests += 1
+        call: Dict[str, Any] = {"mode": None}
+        start = time.perf_counter()
+        try:
+            yield call
+        except Exception as e:
+            # 客戶端錯誤 (4xx，例如斷線) 不算服務失敗
+            if getattr(e, "status_code", 500) >= 500:
+                stats.failures += 1
+                stats.last_error = str(getattr(e, "detail", None) or e)
+                # 失敗以懲罰延遲計入，讓流量暫時轉向其他服務；呼叫端截止時間造成的失敗不計入
+                if not deadline.expired():
+                    stats.latency.add(max(time.perf_counter() - start, self.failure_penalty))
+            raise
+        else:
+            if call["mode"] not in SIMULATED_MODES:
+                latency = time.perf_counter() - start
+                stats.latency.add(latency)
+                stats.success_latency.add(latency)
+        finally:
+            stats.in_flight -= 1
+            stats.last_used_at = time.time()
+
+    def expected_latency(self, service_id: str) -> float:
+        """預估延遲 (秒)"""
+        stats = self._stats(service_id)
+        base = stats.latency.value
+
+        if base is None and self.health_monitor is not None:
+            canary = getattr(self.health_monitor, "canary_stats", {}).get(service_id)
+            if canary is not None:
+                base = canary.latency.percentile(50)
+
+        if base is None:
+            base = self.default_latency
+
+        queued = self.queue_depth(service_id) if self.queue_depth else 0
+        return base * (1 + stats.in_flight + queued)
+
+    def min_latency(self, service_id: str, min_samples: int = 5) -> Optional[float]:
+        """近期成功請求的最短延遲 (秒)，樣本不足時返回 None"""
+        samples = self._stats(service_id).success_latency.samples
+        if len(samples) < min_samples:
+            return None
+        return min(samples)
+
+    def _supports_language(self, service: Any, language: str) -> bool:
+        if not language:
+            return True
+        languages = getattr(service, "languages", None) or []
+        wanted = _base_language(language)
+        return any(
+            lang.lower() == language.lower() or _base_language(lang) == wanted
+            for lang in languages
+        )
+
+    def _candidates(self, language: str, voice_group: Optional[str], allowed: Optional[List[str]]) -> List[str]:
+        candidates = []
+        for service_id, service in self.services.items():
+            if allowed and service_id not in allowed:
+                continue
+            if not getattr(service, "is_initialized", False):
+                continue
+            if self.health_monitor is not None:
+                if self.health_monitor.service_status(service_id) == "unhealthy":
+                    continue
+                # 未設定金鑰的模擬模式與 mock 服務只會返回假音頻，不參與自動路由
+                if self.health_monitor.service_mode(service_id) in SIMULATED_MODES:
+                    continue
+            if voice_group and service_id not in self.equivalence.get(voice_group, {}):
+                continue
+            if not self._supports_language(service, language):
+                continue
+            candidates.append(service_id)
+        return candidates
+
+    async def route(
+        self,
+        text: str,
+        language: str,
+        voice_config: Optional[Dict[str, Any]] = None,
+        routing: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        為請求挑選服務
+
+        Args:
+            text: 要合成的文字
+            language: 請求語言
+            voice_config: 音色配置，可用 voice_group 指定音色對應表中的邏輯音色
+            routing: 單次請求的路由設定 (policy, latency_budget_ms, services)
+
+        Returns:
+            {"service": 服務 ID, "voice_config": 轉換後的音色配置, "policy": 策略, "candidates": 評分明細}
+        """
+        routing = routing or {}
+        voice_config = dict(voice_config or {})
+        voice_group = voice_config.pop("voice_group", None)
+
+        if voice_group and voice_group not in self.equivalence:
+            raise ValueError(f"音色群組 '{voice_group}' 不存在。可用群組: {list(self.equivalence.keys())}")
+
+        policy = routing.get("policy") or self.policy
+        if policy not in POLICIES:
+            raise ValueError(f"路由策略 '{policy}' 不受支援。可用策略: {POLICIES}")
+
+        budget_ms = routing.get("latency_budget_ms")
+        try:
+            budget = float(budget_ms) / 1000 if budget_ms is not None else self.latency_budget
+        except (TypeError, ValueError):
+            raise ValueError(f"latency_budget_ms 必須是數字: {budget_ms!r}")
+
+        allowed = routing.get("services") or self.allowed_services
+        if not isinstance(allowed, (list, type(None))):
+            raise ValueError("routing.services 必須是服務 ID 陣列")
+        candidates = self._candidates(language, voice_group, allowed)
+        if not candidates:
+            raise ValueError(f"沒有可用的服務支援語言 '{language}'" + (f" 與音色群組 '{voice_group}'" if voice_group else ""))
+
+        scored = []
+        for service_id in candidates:
+            service = self.services[service_id]
+            config = {**voice_config, **self.equivalence.get(voice_group, {}).get(service_id, {})}
+            cost = 0.0
+            if hasattr(service, "estimate_cost"):
+                estimate = await service.estimate_cost(text, config.get("model"))
+                # 以未四捨五入的成本比較，短文字也能區分價格
+                cost = estimate.get("character_count", 0) * estimate.get("price_per_1k_chars", 0) / 1000
+            scored.append({
+                "service": service_id,
+                "voice_config": config,
+                "expected_latency_ms": round(self.expected_latency(service_id) * 1000, 1),
+                "estimated_cost_usd": round(cost, 6),
+            })
+
+        def by_latency(c):
+            return c["expected_latency_ms"], c["estimated_cost_usd"]
+
+        def by_cost(c):
+            return c["estimated_cost_usd"], c["expected_latency_ms"]
+
+        # 有截止時間時，優先考慮預估能在剩餘時間內完成的服務
+        scored_pool = scored
+        left = deadline.remaining()
+        if left is not None:
+            scored_pool = [c for c in scored if c["expected_latency_ms"] <= left * 1000] or scored
+
+        if policy == "lowest_cost":
+            chosen = min(scored_pool, key=by_cost)
+        elif policy == "cost_within_budget":
+            within = [c for c in scored_pool if c["expected_latency_ms"] <= budget * 1000]
+            chosen = min(within, key=by_cost) if within else min(scored_pool, key=by_latency)
+        else:
+            chosen = min(scored_pool, key=by_latency)
+
+        logger.info(
+            f"🔀 自動路由 ({policy}): {chosen['service']} "
+            f"(預估 {chosen['expected_latency_ms']}ms, ${chosen['estimated_cost_usd']})"
+        )
+
+        return {
+            "service": chosen["service"],
+            "voice_config": chosen["voice_config"],
+            "policy": policy,
+            "candidates": scored,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """路由狀態"""
+        return {
+            "policy": self.policy,
+            "policies": POLICIES,
+            "latency_budget_ms": round(self.latency_budget * 1000, 1),
+            "voice_groups": {group: list(mapping.keys()) for group, mapping in self.equivalence.items()},
+            "providers": {
+                service_id: {
+                    **self._stats(service_id).to_dict(),
+                    "expected_latency_ms": round(self.expected_latency(service_id) * 1000, 1),
+                }
+                for service_id in self.services
+            },
+        }
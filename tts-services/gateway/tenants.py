@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+租戶 (呼叫端身份) 與用量
+以 X-API-Key 或 X-Tenant-ID 識別呼叫端，每個租戶有公平排隊權重、併發上限與每日字數配額，
+並記錄用量供查詢；未帶身份的請求歸入 default 租戶
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Any, Mapping, Optional, Set
+
+from gateway.admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+# X-Tenant-ID 允許的格式
+TENANT_ID_PATTERN = re.compile(r"[A-Za-z0-9_.\-]{1,64}")
+
+
+class TenantAuthError(Exception):
+    """呼叫端身份無效"""
+
+
+def _utc_today() -> datetime.date:
+    return datetime.datetime.utcnow().date()
+
+
+def _seconds_until_utc_midnight() -> int:
+    now = datetime.datetime.utcnow()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return max(1, int((midnight - now).total_seconds()))
+
+
+class QuotaReservation:
+    """
+    單一請求預留的字數配額 (檢查配額時即佔用，避免並行請求一起超出配額)
+    commit() 以實際字數計入用量，release() 退回預留；兩者只有第一次呼叫生效
+    """
+
+    def __init__(self, tenant: "Tenant", characters: int):
+        self._tenant = tenant
+        self.characters = characters
+        self.settled = False
+
+    def commit(self, characters: Optional[int] = None):
+        """記錄一次成功合成，characters 為實際送往上游的字數 (預設為預留字數)"""
+        if not self.settled:
+            self.release()
+            self._tenant.record(self.characters if characters is None else characters)
+
+    def release(self):
+        if not self.settled:
+            self.settled = True
+            self._tenant.characters_reserved -= self.characters
+
+
+class Tenant:
+    """單一租戶的設定與用量 (每日配額以 UTC 日期計算)"""
+
+    def __init__(
+        self,
+        tenant_id: str,
+        weight: float = 1.0,
+        max_concurrency: int = 0,
+        queue_size: int = 32,
+        daily_char_quota: int = 0,
+        configured: bool = False
+    ):
+        self.id = tenant_id
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.daily_char_quota = daily_char_quota
+        self.configured = configured
+
+        self.day = _utc_today()
+        self.characters_today = 0
+        self.characters_reserved = 0
+        self.characters_total = 0
+        self.requests = 0
+        self.quota_rejected = 0
+        self.last_request_at: Optional[float] = None
+
+    def _roll_day(self):
+        today = _utc_today()
+        if today != self.day:
+            self.day = today
+            self.characters_today = 0
+
+    def remaining_quota(self) -> Optional[int]:
+        """今日剩餘字數 (扣除進行中請求的預留)，未設定配額時返回 None"""
+        if self.daily_char_quota <= 0:
+            return None
+        self._roll_day()
+        return max(0, self.daily_char_quota - self.characters_today - self.characters_reserved)
+
+    def check_quota(self, characters: int) -> QuotaReservation:
+        """
+        檢查並預留今日字數配額，返回的預留由呼叫端在合成成功時 commit()、失敗或取消時 release()
+
+        Raises:
+            AdmissionRejected: 請求字數超過今日剩餘配額 (429，Retry-After 至 UTC 午夜)
+        """
+        remaining = self.remaining_quota()
+        if remaining is not None and characters > remaining:
+            self.quota_rejected += 1
+            raise AdmissionRejected(
+                429, "quota", _seconds_until_utc_midnight(),
+                f"租戶 {self.id} 今日字數配額不足 (剩餘 {remaining}，請求 {characters}，每日 {self.daily_char_quota})"
+            )
+        self.characters_reserved += characters
+        return QuotaReservation(self, characters)
+
+    def record(self, characters: int):
+        """記錄一次成功合成的用量"""
+        self._roll_day()
+        self.characters_today += characters
+        self.characters_total += characters
+        self.requests += 1
+        self.last_request_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._roll_day()
+        return {
+            "tenant": self.id,
+            "configured": self.configured,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "daily_char_quota": self.daily_char_quota,
+            "day": self.day.isoformat(),
+            "characters_today": self.characters_today,
+            "characters_reserved": self.characters_reserved,
+            "remaining_quota": self.remaining_quota(),
+            "characters_total": self.characters_total,
+            "requests": self.requests,
+            "quota_rejected": self.quota_rejected,
+            "last_request_at": self.last_request_at,
+        }
+
+
+class TenantRegistry:
+    """
+    租戶設定檔 (JSON):
+
+        {
+          "tenants": {
+            "studio": {"api_keys": ["sk-..."], "weight": 4, "max_concurrency": 8},
+            "campaign": {"api_keys": ["sk-..."], "weight": 1, "max_concurrency": 4, "daily_char_quota": 500000}
+          }
+        }
+
+    識別順序: X-API-Key (對應設定檔中的租戶) → X-Tenant-ID (allow_header 時) → default。
+    未列在設定檔的 X-Tenant-ID 使用預設設定
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        default_weight: float = 1.0,
+        default_max_concurrency: int = 0,
+        default_queue_size: int = 32,
+        default_daily_char_quota: int = 0,
+        allow_header: bool = True,
+        require_api_key: bool = False,
+        max_tenants: int = 1000
+    ):
+        self.path = path
+        self.default_weight = default_weight
+        self.default_max_concurrency = default_max_concurrency
+        self.default_queue_size = default_queue_size
+        self.default_daily_char_quota = default_daily_char_quota
+        self.allow_header = allow_header
+        self.require_api_key = require_api_key
+        self.max_tenants = max_tenants
+
+        self.tenants: Dict[str, Tenant] = {}
+        self._api_keys: Dict[str, str] = {}
+        self._keyed_tenants: Set[str] = set()
+        self.load()
+
+    def _new_tenant(self, tenant_id: str, config: Optional[Dict[str, Any]] = None) -> Tenant:
+        config = config or {}
+        return Tenant(
+            tenant_id,
+            weight=float(config.get("weight", self.default_weight)),
+            max_concurrency=int(config.get("max_concurrency", self.default_max_concurrency)),
+            queue_size=int(config.get("queue_size", self.default_queue_size)),
+            daily_char_quota=int(config.get("daily_char_quota", self.default_daily_char_quota)),
+            configured=bool(config)
+        )
+
+    def load(self):
+        """載入租戶設定檔，保留已有租戶的用量"""
+        self._api_keys = {}
+        self._keyed_tenants = set()
+        self.tenants.setdefault(DEFAULT_TENANT, self._new_tenant(DEFAULT_TENANT))
+
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                tenants = json.load(f).get("tenants", {})
+        except Exception as e:
+            logger.warning(f"⚠️ 載入租戶設定失敗 ({self.path}): {e}")
+            return
+
+        for tenant_id, config in tenants.items():
+            tenant = self._new_tenant(tenant_id, config)
+            existing = self.tenants.get(tenant_id)
+            if existing is not None:
+                # 保留用量，只更新設定
+                existing.weight = tenant.weight
+                existing.max_concurrency = tenant.max_concurrency
+                existing.queue_size = tenant.queue_size
+                existing.daily_char_quota = tenant.daily_char_quota
+                existing.configured = True
+            else:
+                self.tenants[tenant_id] = tenant
+            for api_key in config.get("api_keys", []):
+                self._api_keys[api_key] = tenant_id
+                self._keyed_tenants.add(tenant_id)
+
+        logger.info(f"👥 已載入 {len(tenants)} 個租戶設定")
+
+    def resolve(self, headers: Mapping[str, str]) -> Tenant:
+        """
+        依請求標頭識別租戶
+
+        Raises:
+            TenantAuthError: API Key 無效、X-Tenant-ID 格式錯誤，或要求 API Key 但未提供
+        """
+        api_key = headers.get("x-api-key")
+        if api_key:
+            tenant_id = self._api_keys.get(api_key)
+            if tenant_id is None:
+                raise TenantAuthError("API Key 無效")
+            return self.tenants[tenant_id]
+
+        if self.require_api_key:
+            raise TenantAuthError("缺少 X-API-Key")
+
+        tenant_id = headers.get("x-tenant-id") if self.allow_header else None
+        if not tenant_id:
+            return self.tenants[DEFAULT_TENANT]
+
+        if not TENANT_ID_PATTERN.fullmatch(tenant_id):
+            raise TenantAuthError(f"X-Tenant-ID 格式錯誤: {tenant_id}")
+
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            if len(self.tenants) >= self.max_tenants:
+                logger.warning(f"⚠️ 租戶數量已達上限 {self.max_tenants}，{tenant_id} 歸入 default")
+                return self.tenants[DEFAULT_TENANT]
+            tenant = self._new_tenant(tenant_id)
+            self.tenants[tenant_id] = tenant
+        elif tenant_id in self._keyed_tenants:
+            # 設定了 API Key 的租戶不可只憑標頭冒用
+            raise TenantAuthError(f"租戶 {tenant_id} 需要 X-API-Key")
+        return tenant
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        return self.tenants.get(tenant_id)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "require_api_key": self.require_api_key,
+            "allow_header": self.allow_header,
+            "tenants": {tenant_id: tenant.to_dict() for tenant_id, tenant in self.tenants.items()},
+        }
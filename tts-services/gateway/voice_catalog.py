@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+統一音色目錄
+彙整各 TTS 服務的音色列表並建立記憶體索引，背景依 TTL 定期刷新，
+請求在送往上游前先以目錄驗證音色名稱
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 可作為篩選條件的欄位
+INDEX_FIELDS = ["language", "gender", "style", "tag"]
+
+# 各服務的性別標記統一為 male / female / neutral / unknown
+GENDER_ALIASES = {
+    "male": "male", "m": "male", "男": "male", "男聲": "male", "男性": "male",
+    "female": "female", "f": "female", "女": "female", "女聲": "female", "女性": "female",
+    "neutral": "neutral", "中性": "neutral",
+}
+
+VoiceKey = Tuple[str, str]
+
+
+def normalize_gender(gender: Any) -> str:
+    """統一性別標記"""
+    if not gender:
+        return "unknown"
+    return GENDER_ALIASES.get(str(gender).strip().lower(), "unknown")
+
+
+def _language_keys(language: str) -> List[str]:
+    """語言索引鍵，zh-TW 同時以 zh-tw 與 zh 建立索引"""
+    language = language.strip().lower().replace("_", "-")
+    keys = [language]
+    if "-" in language:
+        keys.append(language.split("-", 1)[0])
+    return keys
+
+
+class VoiceCatalog:
+    """
+    記憶體音色索引
+
+    各服務實作 list_voices()，返回:
+        - voices: 音色列表 (id, name, languages, gender, styles, tags 及其他欄位)
+        - authoritative: 列表是否完整，完整時才拒絕目錄外的音色
+        - voice_key: voice_config 中指定音色的欄位名稱
+        - constraints: voice_config 欄位 -> 音色欄位，例如 {"style": "styles"}
+        - scoped_constraints: 可用值取決於另一個欄位的限制，例如 VoAI 的風格依模型版本
+          {"style": {"by": "model", "field": "model_styles", "default": "Neo"}}
+          表示 style 需在 entry["model_styles"][voice_config["model"] 或 "Neo"] 之中
+    """
+
+    def __init__(self, services: Dict[str, Any], ttl: float = 600, refresh_timeout: float = 30):
+        self.services = services
+        self.ttl = ttl
+        self.refresh_timeout = refresh_timeout
+        self.version = 0
+        self.refreshed_at: Dict[str, float] = {}
+
+        self._voices: Dict[VoiceKey, Dict[str, Any]] = {}
+        self._by_provider: Dict[str, List[VoiceKey]] = {}
+        self._index: Dict[str, Dict[str, Set[VoiceKey]]] = {field: {} for field in INDEX_FIELDS}
+        self._provider_meta: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """啟動背景刷新任務 (立即刷新一次，之後每 TTL 秒刷新)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """停止背景刷新任務"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"音色目錄刷新失敗: {e}")
+            await asyncio.sleep(self.ttl)
+
+    async def refresh(self):
+        """並行向各服務取得音色列表，建立新索引後一次替換"""
+        service_ids = [sid for sid, service in self.services.items() if hasattr(service, "list_voices")]
+        results = await asyncio.gather(
+            *[asyncio.wait_for(self.services[sid].list_voices(), self.refresh_timeout) for sid in service_ids],
+            return_exceptions=True
+        )
+
+        voices = dict(self._voices)
+        provider_meta = dict(self._provider_meta)
+
+        for service_id, result in zip(service_ids, results):
+            if isinstance(result, BaseException):
+                # 刷新失敗時保留上一版的列表
+                logger.warning(f"⚠️ 獲取 {service_id} 音色列表失敗，沿用舊資料: {result!r}")
+                continue
+
+            for key in [key for key in voices if key[0] == service_id]:
+                del voices[key]
+
+            for voice in result.get("voices", []):
+                entry = self._normalize_entry(service_id, voice)
+                voices[(service_id, entry["id"])] = entry
+
+            provider_meta[service_id] = {
+                "authoritative": bool(result.get("authoritative")) and bool(result.get("voices")),
+                "voice_key": result.get("voice_key", "voice"),
+                "constraints": result.get("constraints", {}),
+                "scoped_constraints": result.get("scoped_constraints", {}),
+                "count": len(result.get("voices", [])),
+            }
+            self.refreshed_at[service_id] = time.time()
+
+        if voices == self._voices and provider_meta == self._provider_meta:
+            # 內容未變更時保留版本號，/api/services 的 ETag 與快取不會因定期刷新而失效
+            logger.debug(f"🗂️ 音色目錄未變更 (版本 {self.version})")
+            return
+        self._rebuild(voices, provider_meta)
+        logger.info(f"🗂️ 音色目錄已刷新 (版本 {self.version}): {len(self._voices)} 個音色")
+
+    def _normalize_entry(self, service_id: str, voice: Dict[str, Any]) -> Dict[str, Any]:
+        entry = dict(voice)
+        entry["id"] = str(voice["id"])
+        entry["provider"] = service_id
+        entry["name"] = voice.get("name") or entry["id"]
+        entry["languages"] = [lang for lang in (voice.get("languages") or []) if lang]
+        entry["gender"] = normalize_gender(voice.get("gender"))
+        entry["styles"] = list(voice.get("styles") or [])
+        entry["tags"] = list(voice.get("tags") or [])
+        return entry
+
+    def _rebuild(self, voices: Dict[VoiceKey, Dict[str, Any]], provider_meta: Dict[str, Dict[str, Any]]):
+        by_provider: Dict[str, List[VoiceKey]] = {}
+        index: Dict[str, Dict[str, Set[VoiceKey]]] = {field: {} for field in INDEX_FIELDS}
+
+        for key, entry in voices.items():
+            by_provider.setdefault(key[0], []).append(key)
+
+            values = {
+                "language": [lang_key for lang in entry["languages"] for lang_key in _language_keys(lang)],
+                "gender": [entry["gender"]],
+                "style": [style.lower() for style in entry["styles"]],
+                "tag": [tag.lower() for tag in entry["tags"]],
+            }
+            for field, field_values in values.items():
+                for value in field_values:
+                    index[field].setdefault(value, set()).add(key)
+
+        self._voices = voices
+        self._by_provider = by_provider
+        self._index = index
+        self._provider_meta = provider_meta
+        self.version += 1
+
+    def get(self, service_id: str, voice_id: str) -> Optional[Dict[str, Any]]:
+        """依服務與音色 ID 查詢"""
+        return self._voices.get((service_id, voice_id))
+
+    def find(
+        self,
+        provider: Optional[str] = None,
+        language: Optional[str] = None,
+        gender: Optional[str] = None,
+        style: Optional[str] = None,
+        tag: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """依條件篩選音色，各條件以索引集合取交集"""
+        candidates: Optional[Set[VoiceKey]] = None
+
+        if provider:
+            candidates = set(self._by_provider.get(provider, []))
+
+        filters = {
+            "language": _language_keys(language)[0] if language else None,
+            "gender": normalize_gender(gender) if gender else None,
+            "style": style.lower() if style else None,
+            "tag": tag.lower() if tag else None,
+        }
+        for field, value in filters.items():
+            if value is None:
+                continue
+            matched = self._index[field].get(value, set())
+            candidates = set(matched) if candidates is None else candidates & matched
+
+        if candidates is None:
+            keys = list(self._voices.keys())
+        else:
+            keys = sorted(candidates)
+
+        return [self._voices[key] for key in keys]
+
+    def validate(self, service_id: str, voice_config: Dict[str, Any]) -> Optional[str]:
+        """
+        驗證請求的音色，返回錯誤訊息；無法判斷時 (目錄未載入或列表不完整) 返回 None 放行
+        """
+        meta = self._provider_meta.get(service_id)
+        if not meta or not meta["authoritative"] or not voice_config:
+            return None
+
+        voice_id = voice_config.get(meta["voice_key"])
+        if not voice_id:
+            return None
+
+        entry = self._voices.get((service_id, str(voice_id)))
+        if entry is None:
+            suggestions = [self._voices[key]["id"] for key in self._by_provider.get(service_id, [])[:10]]
+            return f"服務 '{service_id}' 不支援音色 '{voice_id}'，可用音色例如: {suggestions}"
+
+        for config_key, entry_field in meta["constraints"].items():
+            value = voice_config.get(config_key)
+            allowed = entry.get(entry_field)
+            if value and allowed and value not in allowed:
+                return f"音色 '{voice_id}' 不支援 {config_key}='{value}'，可用值: {allowed}"
+
+        for config_key, scope in meta.get("scoped_constraints", {}).items():
+            value = voice_config.get(config_key)
+            scope_value = voice_config.get(scope["by"]) or scope.get("default")
+            allowed = (entry.get(scope["field"]) or {}).get(scope_value)
+            if value and allowed and value not in allowed:
+                return (
+                    f"音色 '{voice_id}' 在 {scope['by']}='{scope_value}' 不支援 {config_key}='{value}'，"
+                    f"可用值: {allowed}"
+                )
+
+        return None
+
+    def summary(self) -> Dict[str, Any]:
+        """目錄狀態摘要"""
+        return {
+            "version": self.version,
+            "total": len(self._voices),
+            "ttl": self.ttl,
+            "providers": {
+                service_id: {**meta, "refreshed_at": self.refreshed_at.get(service_id)}
+                for service_id, meta in self._provider_meta.items()
+            },
+        }
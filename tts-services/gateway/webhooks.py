@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Webhook 完成通知
+帶 callback_url 的請求在合成完成 (或失敗) 後，由 Gateway 把結果 POST 到該網址。
+每筆通知先寫入磁碟佇列再發送，失敗時以指數退避重試，重啟後繼續投遞；
+設定 WEBHOOK_SECRET 時以 HMAC-SHA256 簽名。
+預設拒絕解析到內部位址 (loopback、私有網段、link-local 等) 的 callback_url，
+送出時與投遞時 (含連線當下的 DNS 解析) 都會檢查，避免 Gateway 被用來存取內部服務
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-TTS-Signature"
+
+
+def sign_payload(secret: str, timestamp: int, body: bytes) -> str:
+    """
+    簽名格式: t=<timestamp>,v1=<hex>
+    v1 = HMAC-SHA256(secret, "<timestamp>." + body)，接收端應驗證並拒絕過舊的 timestamp
+    """
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class UnsafeCallbackURL(ValueError):
+    """callback_url 不允許投遞 (格式錯誤、不在允許清單或指向內部位址)"""
+
+
+def is_internal_address(address: str) -> bool:
+    """非公網位址 (loopback、私有網段、link-local、保留、多播等)"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+class _ExternalOnlyResolver(AbstractResolver):
+    """
+    投遞時的 DNS 解析器：非信任主機解析到內部位址時拒絕連線
+    (檢查連線當下的解析結果，送出後才改變 DNS 記錄也無法繞過)
+    """
+
+    def __init__(self, is_trusted):
+        self._resolver = aiohttp.DefaultResolver()
+        self._is_trusted = is_trusted
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict[str, Any]]:
+        addresses = await self._resolver.resolve(host, port, family)
+        if not self._is_trusted(host):
+            blocked = [entry["host"] for entry in addresses if is_internal_address(entry["host"])]
+            if blocked:
+                raise OSError(f"callback_url 主機 {host} 解析到內部位址 {blocked[0]}")
+        return addresses
+
+    async def close(self) -> None:
+        await self._resolver.close()
+
+
+class WebhookDispatcher:
+    """
+    磁碟佇列 + 背景投遞
+
+    每筆通知是佇列目錄下的一個 JSON 文件，投遞成功後刪除；
+    重試次數用盡或收到不可重試的回應 (4xx，408 / 429 除外) 時移到 failed/ 子目錄保留；
+    allowed_hosts 中的主機或 allow_private_networks 為 True 時才可投遞到內部位址
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        secret: Optional[str] = None,
+        max_attempts: int = 8,
+        base_delay: float = 5,
+        max_delay: float = 3600,
+        timeout: float = 10,
+        allowed_hosts: Optional[List[str]] = None,
+        allow_private_networks: bool = False
+    ):
+        self.queue_dir = queue_dir
+        self.failed_dir = os.path.join(queue_dir, "failed")
+        self.secret = secret
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.allowed_hosts = allowed_hosts
+        self.allow_private_networks = allow_private_networks
+
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+
+    def validate_url(self, url: str):
+        """
+        檢查 callback_url
+
+        Raises:
+            UnsafeCallbackURL: 網址格式錯誤或主機不在允許清單
+        """
+        parsed = urlparse(url or "")
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise UnsafeCallbackURL(f"callback_url 必須是 http(s) 網址: {url}")
+        if self.allowed_hosts and parsed.hostname not in self.allowed_hosts:
+            raise UnsafeCallbackURL(f"callback_url 主機不在允許清單: {parsed.hostname}")
+
+    def _is_trusted(self, host: str) -> bool:
+        """明確列在允許清單的主機 (例如同一 compose 網路內的接收端) 可以是內部位址"""
+        return self.allow_private_networks or bool(self.allowed_hosts and host in self.allowed_hosts)
+
+    async def check_url(self, url: str):
+        """
+        檢查 callback_url 格式與允許清單，並解析主機確認不是內部位址
+
+        Raises:
+            UnsafeCallbackURL: 網址無效、主機不在允許清單或解析到內部位址
+            ValueError: 主機無法解析 (投遞時視為暫時失敗並重試)
+        """
+        self.validate_url(url)
+        parsed = urlparse(url)
+        host = parsed.hostname
+        if self._is_trusted(host):
+            return
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, parsed.port or (443 if parsed.scheme == "https" else 80), type=socket.SOCK_STREAM
+            )
+        except (OSError, UnicodeError) as e:
+            raise ValueError(f"callback_url 主機無法解析: {host} ({e})")
+        for info in infos:
+            address = info[4][0]
+            if is_internal_address(address):
+                raise UnsafeCallbackURL(f"callback_url 不可指向內部位址: {host} ({address})")
+
+    def _path(self, delivery_id: str, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.queue_dir, f"{delivery_id}.json")
+
+    def _write(self, delivery: Dict[str, Any], directory: Optional[str] = None):
+        """先寫暫存檔再改名，避免中途重啟留下不完整的文件"""
+        path = self._path(delivery["id"], directory)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(delivery, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _remove(self, delivery_id: str):
+        try:
+            os.remove(self._path(delivery_id))
+        except OSError:
+            pass
+
+    def _load(self):
+        """載入重啟前未完成的通知"""
+        try:
+            os.makedirs(self.failed_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"⚠️ 無法建立 Webhook 佇列目錄 {self.queue_dir}: {e}，通知將不會持久化")
+            return
+        for name in os.listdir(self.queue_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.queue_dir, name), "r", encoding="utf-8") as f:
+                    delivery = json.load(f)
+                self._pending[delivery["id"]] = delivery
+            except Exception as e:
+                logger.warning(f"⚠️ 無法讀取 Webhook 佇列文件 {name}: {e}")
+        if self._pending:
+            logger.info(f"📮 載入 {len(self._pending)} 筆未完成的 Webhook 通知")
+
+    async def start(self):
+        self._load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._deliver_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def enqueue(self, url: str, payload: Dict[str, Any]) -> str:
+        """寫入佇列並喚醒投遞迴圈，返回通知ID"""
+        delivery = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "payload": payload,
+            "attempts": 0,
+            "created_at": time.time(),
+            "next_attempt_at": time.time(),
+            "last_error": None,
+        }
+        try:
+            os.makedirs(self.failed_dir, exist_ok=True)
+            self._write(delivery)
+        except OSError as e:
+            logger.warning(f"⚠️ Webhook 通知寫入佇列失敗，僅保留在記憶體: {e}")
+        self._pending[delivery["id"]] = delivery
+        self._wakeup.set()
+        return delivery["id"]
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _deliver_loop(self):
+        connector = aiohttp.TCPConnector(resolver=_ExternalOnlyResolver(self._is_trusted))
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as session:
+            while True:
+                now = time.time()
+                due = [d for d in self._pending.values() if d["next_attempt_at"] <= now]
+                # 同時投遞，單一緩慢的接收端不會拖住其他通知
+                results = await asyncio.gather(
+                    *(self._deliver(session, delivery) for delivery in due),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.error(f"❌ Webhook 投遞異常: {result}")
+
+                upcoming = [d["next_attempt_at"] for d in self._pending.values()]
+                wait = max(0.0, min(upcoming) - time.time()) if upcoming else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver(self, session: aiohttp.ClientSession, delivery: Dict[str, Any]):
+        body = json.dumps(delivery["payload"], ensure_ascii=False).encode("utf-8")
+        timestamp = int(time.time())
+        headers = {
+            "Content-Type": "application/json",
+            "X-TTS-Webhook-Id": delivery["id"],
+            "X-TTS-Webhook-Attempt": str(delivery["attempts"] + 1),
+        }
+        if self.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(self.secret, timestamp, body)
+
+        delivery["attempts"] += 1
+        retryable = True
+        try:
+            # 佇列中的通知可能在設定變更前寫入，投遞前重新檢查；不跟隨重新導向 (可能指向內部位址)
+            await self.check_url(delivery["url"])
+            async with session.post(delivery["url"], data=body, headers=headers, allow_redirects=False) as response:
+                if 200 <= response.status < 300:
+                    self._pending.pop(delivery["id"], None)
+                    self._remove(delivery["id"])
+                    self.delivered += 1
+                    logger.info(f"📮 Webhook 已送達: {delivery['url']} (第 {delivery['attempts']} 次)")
+                    return
+                delivery["last_error"] = f"HTTP {response.status}"
+                retryable = response.status >= 500 or response.status in (408, 429)
+        except UnsafeCallbackURL as e:
+            delivery["last_error"] = str(e)
+            retryable = False
+        except Exception as e:
+            delivery["last_error"] = str(e) or type(e).__name__
+
+        if not retryable or delivery["attempts"] >= self.max_attempts:
+            self._pending.pop(delivery["id"], None)
+            try:
+                self._write(delivery, self.failed_dir)
+            except OSError as e:
+                logger.warning(f"⚠️ 無法保留失敗的 Webhook 通知: {e}")
+            self._remove(delivery["id"])
+            self.failed += 1
+            logger.error(
+                f"❌ Webhook 投遞失敗，放棄: {delivery['url']} "
+                f"({delivery['attempts']} 次，{delivery['last_error']})"
+            )
+            return
+
+        delay = self._backoff(delivery["attempts"])
+        delivery["next_attempt_at"] = time.time() + delay
+        try:
+            self._write(delivery)
+        except OSError as e:
+            logger.warning(f"⚠️ Webhook 通知寫入佇列失敗: {e}")
+        self.retries += 1
+        logger.warning(
+            f"⚠️ Webhook 投遞失敗 ({delivery['last_error']})，{delay:.0f}s 後重試: {delivery['url']}"
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queue_dir": self.queue_dir,
+            "signed": bool(self.secret),
+            "pending": self.pending,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
@@ -5,15 +5,23 @@ HeyGem 自定義 TTS 服務集合
 """
 
 import os
+import re
 import sys
 import asyncio
 import uvicorn
 from fastapi import FastAPI, HTTPException, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Tuple
 import logging
 import json
+import uuid
+import hmac
+import hashlib
+import time
+import datetime
 
 # 載入環境變數
 try:
@@ -26,7 +34,12 @@ except ImportError:
     logger.warning("⚠️ python-dotenv 未安裝，跳過 .env 文件載入")
 
 # 設置日誌
-logging.basicConfig(level=logging.INFO)
+from services import timing
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[%(request_id)s] %(message)s")
+for _handler in logging.getLogger().handlers:
+    # 日誌帶上 X-Request-ID，對應到單一請求
+    _handler.addFilter(timing.RequestIdFilter())
 logger = logging.getLogger(__name__)
 
 # 導入自定義 TTS 服務
@@ -34,7 +47,30 @@ from services.edgetts_service import TTSService1
 from services.minimax_service import TTSService2
 from services.aten_service import TTSService3
 from services.openai_service import TTSService4
+from services.fishspeech_service import TTSService5
 from services.voai_service import VoAIService
+from services.mock_service import MockBehavior, MockTTSService
+from services import deadline
+from services.audio_decoder import pcm_to_wav, wav_stream_header
+from gateway.voice_catalog import VoiceCatalog
+from gateway.health_monitor import HealthMonitor
+from gateway.http_cache import VersionedResponseCache
+from gateway.router import ProviderRouter
+from gateway.admission import AdmissionController, AdmissionRejected
+from gateway.memory_budget import MemoryBudget
+from gateway.tenants import TenantRegistry, TenantAuthError
+from gateway.idempotency import IdempotencyStore, IdempotencyConflict
+from gateway.webhooks import WebhookDispatcher
+from gateway.metrics import MetricsRegistry
+from gateway.loop_monitor import LoopLagMonitor
+from gateway.access_log import AccessLogWriter
+from gateway.profiling import MemoryProfiler, CpuSampler, ProfilerBusy, dump_tasks
+from gateway.audio_cache import AudioCache
+from gateway.audio_assembly import join_segments, prepare_segment, split_segments, wav_duration
+from gateway.prefetch import PrefetchJob, PrefetchScheduler
+
+# 音頻輸出目錄 (與 Node 服務共享)
+AUDIO_DIR = os.getenv("AUDIO_DIR", "/app/data/audios")
 
 app = FastAPI(
     title="HeyGem Custom TTS Services",
@@ -53,7 +89,7 @@ app.add_middleware(
 
 class TTSRequest(BaseModel):
     text: str
-    service: Optional[str] = "service1"  # service1, service2, service3, service4, service5, service6
+    service: Optional[str] = "service1"  # service1, service2, service3, service4, service5, service6, mock, auto
     voice_config: Optional[dict] = None
     format: Optional[str] = "wav"
     language: Optional[str] = "zh"
@@ -80,6 +116,257 @@ class ServiceInfo(BaseModel):
 # 初始化 TTS 服務
 tts_services = {}
 
+# 統一音色目錄 (背景依 TTL 刷新)
+voice_catalog = VoiceCatalog(tts_services, ttl=float(os.getenv("VOICE_CATALOG_TTL", "600")))
+
+# 背景健康檢查與服務列表快取
+health_monitor = HealthMonitor(
+    tts_services,
+    interval=float(os.getenv("HEALTH_CHECK_INTERVAL", "15")),
+    probe_timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", "5")),
+    canary_enabled=os.getenv("HEALTH_CANARY_ENABLED", "false").lower() == "true",
+    canary_interval=float(os.getenv("HEALTH_CANARY_INTERVAL", "300")),
+    canary_timeout=float(os.getenv("HEALTH_CANARY_TIMEOUT", "30")),
+    canary_services=[s.strip() for s in os.getenv("HEALTH_CANARY_SERVICES", "").split(",") if s.strip()] or None,
+    canary_text=os.getenv("HEALTH_CANARY_TEXT", "測試"),
+    canary_failure_threshold=int(os.getenv("HEALTH_CANARY_FAILURE_THRESHOLD", "2"))
+)
+services_cache = VersionedResponseCache()
+
+# 剩餘時間低於此值的請求直接拒絕 (秒)
+DEADLINE_MIN_REMAINING = float(os.getenv("DEADLINE_MIN_REMAINING_MS", "100")) / 1000
+
+# 合成期間檢查客戶端是否斷線的間隔 (秒)
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL_MS", "250")) / 1000
+
+def _provider_admission_limits() -> dict:
+    """讀取各服務的准入設定: ADMISSION_SERVICE5_MAX_CONCURRENCY / ADMISSION_SERVICE5_QUEUE_SIZE"""
+    limits = {}
+    for key, value in os.environ.items():
+        match = re.fullmatch(r"ADMISSION_(SERVICE\d+)_MAX_CONCURRENCY", key)
+        if match:
+            service_id = match.group(1).lower()
+            queue_size = int(os.getenv(f"ADMISSION_{match.group(1)}_QUEUE_SIZE", "16"))
+            limits[service_id] = (int(value), queue_size)
+    return limits
+
+# 准入控制 (全域與各服務的併發上限與等待佇列)
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32")),
+    queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "64")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "30000")) / 1000,
+    provider_limits=_provider_admission_limits()
+)
+
+# 租戶 (X-API-Key / X-Tenant-ID)：公平排隊權重、併發上限與每日字數配額
+tenants = TenantRegistry(
+    path=os.getenv(
+        "TENANTS_FILE",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "tenants.json")
+    ),
+    default_weight=float(os.getenv("TENANT_DEFAULT_WEIGHT", "1")),
+    default_max_concurrency=int(os.getenv("TENANT_DEFAULT_MAX_CONCURRENCY", "0")),
+    default_queue_size=int(os.getenv("TENANT_DEFAULT_QUEUE_SIZE", "32")),
+    default_daily_char_quota=int(os.getenv("TENANT_DEFAULT_DAILY_CHAR_QUOTA", "0")),
+    allow_header=os.getenv("TENANT_ALLOW_HEADER", "true").lower() == "true",
+    require_api_key=os.getenv("TENANT_REQUIRE_API_KEY", "false").lower() == "true"
+)
+
+# Idempotency-Key：重試請求返回已保存的結果或等待進行中的合成
+idempotency = IdempotencyStore(
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", "3600")),
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+)
+
+# Webhook 完成通知 (請求帶 callback_url 時非同步合成)
+webhooks = WebhookDispatcher(
+    queue_dir=os.getenv("WEBHOOK_QUEUE_DIR", "/app/data/webhooks"),
+    secret=os.getenv("WEBHOOK_SECRET") or None,
+    max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8")),
+    base_delay=float(os.getenv("WEBHOOK_BASE_DELAY", "5")),
+    max_delay=float(os.getenv("WEBHOOK_MAX_DELAY", "3600")),
+    timeout=float(os.getenv("WEBHOOK_TIMEOUT", "10")),
+    allowed_hosts=[h.strip() for h in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()] or None,
+    allow_private_networks=os.getenv("WEBHOOK_ALLOW_PRIVATE_NETWORKS", "false").lower() == "true"
+)
+
+# 下載網址的對外前綴，未設定時使用請求的 base URL
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+# 非同步合成任務 (保留引用，避免任務被回收)
+_async_jobs: set = set()
+
+# 事件迴圈延遲監控 (阻塞超過閾值時擷取堆疊)
+loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000,
+    threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "200")) / 1000,
+    capture_interval=float(os.getenv("LOOP_LAG_CAPTURE_INTERVAL", "60"))
+)
+
+# 結構化存取日誌 (每個 TTS 請求一行 JSON，背景批次寫入)
+access_log = AccessLogWriter(
+    path=os.getenv("ACCESS_LOG_PATH", "/app/data/logs/tts_access.log"),
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1")),
+    max_bytes=int(float(os.getenv("ACCESS_LOG_MAX_MB", "50")) * 1024 * 1024),
+    backup_count=int(os.getenv("ACCESS_LOG_BACKUP_COUNT", "5")),
+    flush_interval=float(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", "1"))
+)
+
+# 管理端點的存取權杖，未設定時停用管理端點
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 模擬服務 (容量規劃與故障演練)，設定由所有模擬實例共用
+mock_behavior = MockBehavior.from_env()
+# 目前被模擬服務替換的真實服務 (恢復時放回)
+_impersonated_services: dict = {}
+
+# 線上診斷 (tracemalloc / CPU 取樣)
+memory_profiler = MemoryProfiler()
+cpu_sampler = CpuSampler()
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# 合成音頻快取 (整段文字與分段，保存在磁碟)
+audio_cache = AudioCache(
+    directory=os.getenv("AUDIO_CACHE_DIR", "/app/data/cache/tts"),
+    max_bytes=int(float(os.getenv("AUDIO_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+    ttl=float(os.getenv("AUDIO_CACHE_TTL", "604800"))
+)
+# off: 不使用快取, text: 整段文字, segments: 另依句子分段快取並組合 (可由請求的 cache 欄位覆寫)
+CACHE_MODES = ("off", "text", "segments")
+AUDIO_CACHE_MODE = os.getenv("AUDIO_CACHE_MODE", "text")
+AUDIO_CACHE_MIN_SEGMENT_CHARS = int(os.getenv("AUDIO_CACHE_MIN_SEGMENT_CHARS", "4"))
+AUDIO_CACHE_CROSSFADE = float(os.getenv("AUDIO_CACHE_CROSSFADE_MS", "15")) / 1000
+AUDIO_CACHE_MAX_PAUSE = float(os.getenv("AUDIO_CACHE_MAX_PAUSE_MS", "250")) / 1000
+AUDIO_CACHE_TARGET_DBFS = float(os.getenv("AUDIO_CACHE_TARGET_DBFS", "-20"))
+# 單一請求同時合成的分段數 (整個請求只佔用一個准入名額)
+AUDIO_CACHE_SEGMENT_CONCURRENCY = max(1, int(os.getenv("AUDIO_CACHE_SEGMENT_CONCURRENCY", "4")))
+
+# 預先合成 (閒置時以低優先順序預熱音頻快取)
+PREFETCH_MAX_ITEMS = int(os.getenv("PREFETCH_MAX_ITEMS", "1000"))
+PREFETCH_MAX_CHARACTERS = int(os.getenv("PREFETCH_MAX_CHARACTERS", "200000"))
+PREFETCH_MAX_COST = float(os.getenv("PREFETCH_MAX_COST_USD", "0")) or None
+# Gateway 進行中請求不超過此數、且沒有任何排隊時才送出預先合成
+PREFETCH_IDLE_MAX_ACTIVE = int(os.getenv("PREFETCH_IDLE_MAX_ACTIVE", "2"))
+prefetch = PrefetchScheduler(
+    is_cached=lambda item: audio_cache.contains(_prefetch_key(item)),
+    run_item=lambda job, item: _run_prefetch_item(job, item),
+    is_idle=lambda service: _prefetch_idle(service),
+    poll_interval=float(os.getenv("PREFETCH_IDLE_POLL_INTERVAL", "1")),
+    history=int(os.getenv("PREFETCH_HISTORY", "100"))
+)
+
+# 進行中音頻的記憶體預算 (依預估音頻大小預留位元組)
+memory_budget = MemoryBudget.from_env(queue_timeout=admission.queue_timeout)
+
+# 自動路由 (service: "auto")
+provider_router = ProviderRouter(
+    tts_services,
+    health_monitor=health_monitor,
+    policy=os.getenv("ROUTER_POLICY", "lowest_latency"),
+    latency_budget=float(os.getenv("ROUTER_LATENCY_BUDGET_MS", "5000")) / 1000,
+    alpha=float(os.getenv("ROUTER_EWMA_ALPHA", "0.2")),
+    default_latency=float(os.getenv("ROUTER_DEFAULT_LATENCY_MS", "2000")) / 1000,
+    allowed_services=[s.strip() for s in os.getenv("ROUTER_SERVICES", "").split(",") if s.strip()] or None,
+    equivalence_path=os.getenv(
+        "VOICE_EQUIVALENCE_FILE",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_equivalence.json")
+    ),
+    queue_depth=admission.queue_depth
+)
+
+# Prometheus 指標 (抓取時從各元件讀取)
+metrics = MetricsRegistry()
+
+def _admission_samples(field: str):
+    summary = admission.summary()
+    yield {"scope": "global"}, summary["global"][field]
+    for service_id, limiter in summary["providers"].items():
+        yield {"scope": service_id}, limiter[field]
+
+def _admission_rejections():
+    summary = admission.summary()
+    scopes = {"global": summary["global"], **summary["providers"]}
+    for scope, limiter in scopes.items():
+        for reason, count in limiter["rejected"].items():
+            yield {"scope": scope, "reason": reason}, count
+
+def _router_samples(field: str):
+    for service_id, stats in provider_router.stats.items():
+        yield {"service": service_id}, getattr(stats, field)
+
+metrics.register("tts_admission_active", "gauge", "進行中的請求數", lambda: _admission_samples("active"))
+metrics.register("tts_admission_queue_depth", "gauge", "排隊中的請求數", lambda: _admission_samples("queue_depth"))
+metrics.register("tts_admission_admitted_total", "counter", "已准入的請求數", lambda: _admission_samples("admitted"))
+metrics.register("tts_admission_rejected_total", "counter", "被拒絕的請求數", _admission_rejections)
+metrics.register("tts_admission_drain_rate", "gauge", "佇列消化速度 (請求/秒)", lambda: _admission_samples("drain_rate"))
+def _tenant_samples(field: str):
+    for tenant_id, tenant in tenants.tenants.items():
+        yield {"tenant": tenant_id}, getattr(tenant, field)
+
+metrics.register("tts_tenant_requests_total", "counter", "各租戶成功的合成請求數", lambda: _tenant_samples("requests"))
+metrics.register("tts_tenant_characters_total", "counter", "各租戶累計合成字數", lambda: _tenant_samples("characters_total"))
+metrics.register("tts_tenant_characters_today", "gauge", "各租戶今日合成字數 (UTC)", lambda: _tenant_samples("characters_today"))
+metrics.register("tts_tenant_quota_rejected_total", "counter", "各租戶因配額被拒絕的請求數", lambda: _tenant_samples("quota_rejected"))
+metrics.register(
+    "tts_tenant_active", "gauge", "各租戶進行中的請求數 (僅設定併發上限的租戶)",
+    lambda: (({"tenant": tenant_id}, limiter.active) for tenant_id, limiter in admission.tenants.items())
+)
+metrics.register(
+    "tts_idempotency_requests_total", "counter", "帶 Idempotency-Key 的請求 (hit: 返回保存結果, attached: 等待進行中的合成, miss: 新合成)",
+    lambda: (({"result": result}, count) for result, count in (
+        ("hit", idempotency.hits), ("attached", idempotency.attached), ("miss", idempotency.misses)
+    ))
+)
+metrics.register(
+    "tts_webhook_deliveries_total", "counter", "Webhook 投遞次數",
+    lambda: (({"result": result}, count) for result, count in (
+        ("delivered", webhooks.delivered), ("failed", webhooks.failed), ("retry", webhooks.retries)
+    ))
+)
+metrics.register("tts_webhook_pending", "gauge", "Webhook 佇列中的通知數", lambda: [({}, webhooks.pending)])
+metrics.register("tts_event_loop_lag_seconds", "gauge", "事件迴圈最近一次量測的延遲", lambda: [({}, loop_monitor.last_lag)])
+metrics.register("tts_event_loop_lag_max_seconds", "gauge", "事件迴圈延遲最大值", lambda: [({}, loop_monitor.max_lag)])
+metrics.register(
+    "tts_event_loop_lag_p99_seconds", "gauge", "事件迴圈延遲 p99 (最近 600 次量測)",
+    lambda: [({}, loop_monitor.lag.percentile(99))] if loop_monitor.lag.samples else []
+)
+metrics.register("tts_event_loop_stalls_total", "counter", "事件迴圈阻塞超過閾值的次數", lambda: [({}, loop_monitor.stalls)])
+metrics.register("tts_memory_budget_bytes", "gauge", "音頻記憶體預算", lambda: [({}, memory_budget.limit_bytes)])
+metrics.register("tts_memory_reserved_bytes", "gauge", "已預留的音頻記憶體", lambda: [({}, memory_budget.reserved_bytes)])
+metrics.register("tts_memory_peak_bytes", "gauge", "音頻記憶體預留峰值", lambda: [({}, memory_budget.peak_bytes)])
+metrics.register("tts_memory_queue_depth", "gauge", "等待記憶體預算的請求數", lambda: [({}, memory_budget.queue_depth)])
+metrics.register(
+    "tts_memory_rejected_total", "counter", "因記憶體預算被拒絕的請求數",
+    lambda: (({"reason": reason}, count) for reason, count in memory_budget.rejected.items())
+)
+metrics.register(
+    "tts_audio_cache_requests_total", "counter", "音頻快取查詢次數 (hit: 命中, shared: 等待進行中的合成, miss: 未命中)",
+    lambda: (
+        ({"kind": kind, "result": result}, counts[kind])
+        for result, counts in (("hit", audio_cache.hits), ("shared", audio_cache.shared), ("miss", audio_cache.misses))
+        for kind in counts
+    )
+)
+metrics.register("tts_audio_cache_bytes", "gauge", "音頻快取佔用的磁碟空間", lambda: [({}, audio_cache.total_bytes)])
+metrics.register("tts_audio_cache_evictions_total", "counter", "音頻快取淘汰的項目數", lambda: [({}, audio_cache.evictions)])
+metrics.register(
+    "tts_prefetch_items_total", "counter", "預先合成已處理的項目數 (依結果)",
+    lambda: (({"status": status}, count) for status, count in prefetch.items.items())
+)
+metrics.register("tts_prefetch_pending_items", "gauge", "預先合成等待中的項目數", lambda: [({}, prefetch.pending_items)])
+metrics.register("tts_prefetch_characters_total", "counter", "預先合成送往上游的字數", lambda: [({}, prefetch.characters)])
+metrics.register("tts_provider_requests_total", "counter", "各服務的上游請求數", lambda: _router_samples("requests"))
+metrics.register("tts_provider_failures_total", "counter", "各服務的上游失敗數", lambda: _router_samples("failures"))
+metrics.register("tts_provider_in_flight", "gauge", "各服務進行中的上游請求數", lambda: _router_samples("in_flight"))
+metrics.register(
+    "tts_provider_latency_ewma_seconds", "gauge", "各服務的延遲 EWMA",
+    lambda: (
+        ({"service": service_id}, stats.latency.value)
+        for service_id, stats in provider_router.stats.items()
+        if stats.latency.value is not None
+    )
+)
+
 @app.on_event("startup")
 async def startup_event():
     """啟動時初始化所有 TTS 服務"""
@@ -108,17 +395,57 @@ async def startup_event():
         await tts_services["service4"].initialize()
         logger.info("✅ TTS Service 4 初始化完成")
         
+        # 初始化服務 5 - Fish Speech
+        tts_services["service5"] = TTSService5()
+        await tts_services["service5"].initialize()
+        logger.info("✅ TTS Service 5 (Fish Speech) 初始化完成")
+        
         # 初始化服務 6 - VoAI
         tts_services["service6"] = VoAIService()
         await tts_services["service6"].initialize()
         logger.info("✅ TTS Service 6 (VoAI) 初始化完成")
         
+        # 模擬服務 (可選)
+        try:
+            _apply_mock(
+                enabled=os.getenv("MOCK_TTS_ENABLED", "false").lower() == "true",
+                impersonate=[s.strip() for s in os.getenv("MOCK_TTS_IMPERSONATE", "").split(",") if s.strip()]
+            )
+        except ValueError as e:
+            logger.error(f"❌ 模擬服務設定錯誤: {e}")
+        
+        # 背景載入音色目錄，不阻塞啟動
+        voice_catalog.start()
+        await health_monitor.start()
+        await webhooks.start()
+        await loop_monitor.start()
+        await access_log.start()
+        await audio_cache.load()
+        await prefetch.start()
+        
         logger.info("🎉 所有 TTS 服務初始化完成！")
         
     except Exception as e:
         logger.error(f"❌ TTS 服務初始化失敗: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """關閉時釋放各服務的連線池"""
+    await voice_catalog.stop()
+    await health_monitor.stop()
+    await webhooks.stop()
+    await loop_monitor.stop()
+    await access_log.stop()
+    await prefetch.stop()
+    
+    for service_id, service in [*tts_services.items(), *_impersonated_services.items()]:
+        if hasattr(service, "close"):
+            try:
+                await service.close()
+            except Exception as e:
+                logger.warning(f"關閉服務 {service_id} 失敗: {e}")
+
 @app.get("/")
 async def root():
     """根路徑"""
@@ -130,43 +457,28 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
-    """健康檢查"""
-    service_status = {}
-    
-    for service_id, service in tts_services.items():
-        try:
-            status = await service.health_check()
-            service_status[service_id] = status
-        except Exception as e:
-            service_status[service_id] = {"status": "unhealthy", "error": str(e)}
-    
-    all_healthy = all(status.get("status") == "healthy" for status in service_status.values())
+async def health_check(request: Request):
+    """健康檢查 (返回背景探測的最新結果，支援 ETag)"""
+    if health_monitor.snapshot is None:
+        await health_monitor.probe_all()
     
-    return {
-        "status": "healthy" if all_healthy else "degraded",
-        "services": service_status,
-        "timestamp": asyncio.get_event_loop().time()
-    }
+    return health_monitor.snapshot.to_response(
+        request,
+        {"X-Health-Checked-At": str(health_monitor.checked_at)}
+    )
 
-@app.get("/api/services", response_model=List[ServiceInfo])
-async def list_services():
-    """列出所有可用的 TTS 服務"""
-    services_info = []
+async def _build_services_info() -> List[dict]:
+    """並行獲取各服務信息，組成服務列表"""
+    service_ids = list(tts_services.keys())
+    infos = await asyncio.gather(
+        *[tts_services[service_id].get_info() for service_id in service_ids],
+        return_exceptions=True
+    )
     
-    for service_id, service in tts_services.items():
-        try:
-            info = await service.get_info()
-            services_info.append(ServiceInfo(
-                id=service_id,
-                name=info.get("name", f"TTS Service {service_id}"),
-                description=info.get("description", "自定義 TTS 服務"),
-                status="healthy",
-                languages=info.get("languages", ["zh", "en"]),
-                features=info.get("features", ["text_to_speech"])
-            ))
-        except Exception as e:
-            logger.error(f"獲取服務 {service_id} 信息失敗: {e}")
+    services_info = []
+    for service_id, info in zip(service_ids, infos):
+        if isinstance(info, BaseException):
+            logger.error(f"獲取服務 {service_id} 信息失敗: {info}")
             services_info.append(ServiceInfo(
                 id=service_id,
                 name=f"TTS Service {service_id}",
@@ -174,120 +486,1327 @@ async def list_services():
                 status="unhealthy",
                 languages=[],
                 features=[]
-            ))
+            ).model_dump())
+            continue
+        
+        services_info.append(ServiceInfo(
+            id=service_id,
+            name=info.get("name", f"TTS Service {service_id}"),
+            description=info.get("description", "自定義 TTS 服務"),
+            status="unhealthy" if health_monitor.service_status(service_id) == "unhealthy" else "healthy",
+            languages=info.get("languages", ["zh", "en"]),
+            features=info.get("features", ["text_to_speech"])
+        ).model_dump())
     
     return services_info
 
-@app.post("/api/tts/generate")
-async def generate_tts(request: Request):
-    """
-    TTS 語音合成統一入口 - 統一輸出 WAV 格式
-    根據 service 參數路由到對應的 TTS 服務
-    """
+@app.get("/api/services", response_model=List[ServiceInfo])
+async def list_services(request: Request):
+    """列出所有可用的 TTS 服務 (音色目錄或健康狀態變更時才重建，支援 ETag)"""
+    cached = await services_cache.get(
+        (voice_catalog.version, health_monitor.version),
+        _build_services_info
+    )
+    return cached.to_response(request)
+
+async def _parse_request_body(request: Request) -> dict:
+    """讀取並解析 TTS 請求體，兼容非 UTF-8 編碼"""
+    # 直接解析 JSON 請求體
+    body = await request.body()
+    logger.info(f"收到原始請求體長度: {len(body)} bytes")
+    
     try:
-        # 直接解析 JSON 請求體
-        body = await request.body()
-        logger.info(f"收到原始請求體長度: {len(body)} bytes")
-        
+        # 嘗試不同的編碼方式解碼
         try:
-            # 嘗試不同的編碼方式解碼
+            body_str = body.decode('utf-8')
+        except UnicodeDecodeError:
+            # 如果 UTF-8 失敗，嘗試其他編碼
             try:
-                body_str = body.decode('utf-8')
+                body_str = body.decode('big5')
+                logger.info("使用 Big5 編碼解碼請求體")
             except UnicodeDecodeError:
-                # 如果 UTF-8 失敗，嘗試其他編碼
                 try:
-                    body_str = body.decode('big5')
-                    logger.info("使用 Big5 編碼解碼請求體")
+                    body_str = body.decode('gbk')
+                    logger.info("使用 GBK 編碼解碼請求體")
                 except UnicodeDecodeError:
-                    try:
-                        body_str = body.decode('gbk')
-                        logger.info("使用 GBK 編碼解碼請求體")
-                    except UnicodeDecodeError:
-                        body_str = body.decode('utf-8', errors='ignore')
-                        logger.warning("使用 UTF-8 忽略錯誤模式解碼請求體")
-            
-            logger.info(f"解碼後的請求體: {body_str}")
-            data = json.loads(body_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析錯誤: {e}")
-            raise HTTPException(status_code=400, detail=f"JSON 格式錯誤: {str(e)}")
+                    body_str = body.decode('utf-8', errors='ignore')
+                    logger.warning("使用 UTF-8 忽略錯誤模式解碼請求體")
         
-        logger.info(f"解析後的數據: {data}")
+        logger.debug(f"解碼後的請求體: {body_str}")
+        data = json.loads(body_str)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON 解析錯誤: {e}")
+        raise HTTPException(status_code=400, detail=f"JSON 格式錯誤: {str(e)}")
+    
+    logger.debug(f"解析後的數據: {data}")
+    return data
+
+async def _extract_tts_params(data: dict):
+    """提取並檢查 TTS 請求參數，返回 (text, service, voice_config, language)"""
+    text = data.get("text")
+    service = data.get("service", "service1")
+    voice_config = data.get("voice_config") or {}
+    language = data.get("language", "zh")
+    
+    if not text:
+        raise HTTPException(status_code=400, detail="缺少必要參數: text")
+    
+    logger.info(f"收到 TTS 請求: service={service}, text={text[:50]}...")
+    
+    # 自動路由：依延遲、排隊深度、語言與成本挑選服務
+    if service == "auto":
+        routing = data.get("routing")
+        if routing is not None and not isinstance(routing, dict):
+            raise HTTPException(status_code=400, detail="routing 必須是物件")
+        try:
+            decision = await provider_router.route(text, language, voice_config, data.get("routing"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        service = decision["service"]
+        voice_config = decision["voice_config"]
+    
+    # 語言參數轉換 - ATEN 服務需要特定格式
+    if service == "service3" and language == "zh":
+        language = "zh-TW"
+    
+    # 檢查服務是否存在
+    if service not in tts_services:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"服務 '{service}' 不存在。可用服務: {list(tts_services.keys()) + ['auto']}"
+        )
+    
+    # 送往上游前先以音色目錄驗證音色，服務自身的檢查 (例如 Fish Speech 參考音頻路徑) 同樣返回 400
+    voice_error = voice_catalog.validate(service, voice_config)
+    if not voice_error and hasattr(tts_services[service], "validate_voice_config"):
+        voice_error = tts_services[service].validate_voice_config(voice_config)
+    if voice_error:
+        raise HTTPException(status_code=400, detail=voice_error)
+    
+    return text, service, voice_config, language
+
+def _apply_deadline(request: Request, data: dict):
+    """
+    設定請求截止時間 (X-Request-Deadline / X-Request-Timeout / timeout 欄位)
+    每個請求在獨立的 task 中處理，contextvar 不會影響其他請求
+    """
+    try:
+        request_deadline = deadline.parse_deadline(request.headers, data)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"截止時間格式錯誤: {e}")
+    
+    deadline.set_deadline(request_deadline)
+    
+    left = deadline.remaining()
+    if left is not None and left < DEADLINE_MIN_REMAINING:
+        raise HTTPException(status_code=504, detail="請求已超過截止時間")
+
+def _check_deadline_feasible(service: str):
+    """剩餘時間少於該服務近期最短延遲時，不可能如期完成，直接拒絕"""
+    left = deadline.remaining()
+    fastest = provider_router.min_latency(service)
+    if left is not None and fastest is not None and left < fastest:
+        raise HTTPException(
+            status_code=504,
+            detail=f"剩餘時間 {left:.2f}s 不足以完成 {service} 合成 (近期最短 {fastest:.2f}s)"
+        )
+
+def _failure_response(message: str) -> HTTPException:
+    """合成失敗時的錯誤回應，超過截止時間時返回 504"""
+    if deadline.expired():
+        return HTTPException(status_code=504, detail=f"請求已超過截止時間: {message}")
+    return HTTPException(status_code=500, detail=message)
+
+async def _run_until_disconnect(request: Optional[Request], coro):
+    """
+    執行合成協程並監看客戶端連線
+    客戶端斷線時取消整個協程樹 (上游連線、輪詢迴圈、ffmpeg 子程序)，返回 499；
+    與其他請求共用的工作 (例如 Fish Speech 參考音頻預處理) 以 shield 保護，不受影響。
+    request 為 None 時不監看 (例如 Idempotency-Key 的合成由重試請求接續等待)
+    """
+    if request is None:
+        return await coro
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("🔌 客戶端已斷線，取消合成")
+                raise HTTPException(status_code=499, detail="客戶端已斷線")
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+def _resolve_tenant(request: Request):
+    """識別呼叫端租戶，身份無效返回 401"""
+    try:
+        return tenants.resolve(request.headers)
+    except TenantAuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+def _check_quota(tenant, text: str):
+    """檢查並預留租戶今日字數配額，返回預留 (成功時 commit、失敗時 release)；不足返回 429"""
+    try:
+        return tenant.check_quota(len(text))
+    except AdmissionRejected as e:
+        logger.warning(f"👥 {e}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def _acquire_admission(service: str, tenant=None):
+    """取得准入名額，過載時返回 429 / 503 並附上 Retry-After"""
+    try:
+        with timing.stage("queue"):
+            return await admission.acquire(service, tenant)
+    except AdmissionRejected as e:
+        if deadline.expired():
+            raise HTTPException(status_code=504, detail=f"請求已超過截止時間: {e}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def _reserve_memory(tts_service, text: str, nbytes: Optional[int] = None):
+    """
+    依預估音頻大小預留記憶體 (已知實際大小時以 nbytes 指定)，
+    預算不足時排隊，超出預算返回 413、等待逾時返回 503
+    """
+    if nbytes is None:
+        sample_rate = getattr(tts_service, "sample_rate", None) or getattr(tts_service, "stream_sample_rate", 24000)
+        nbytes = memory_budget.estimate(text, sample_rate)
+    try:
+        with timing.stage("queue"):
+            return await memory_budget.reserve(nbytes, timeout=deadline.timeout(memory_budget.queue_timeout, "記憶體預算"))
+    except AdmissionRejected as e:
+        if deadline.expired():
+            raise HTTPException(status_code=504, detail=f"請求已超過截止時間: {e}")
+        logger.warning(f"🧮 記憶體預算拒絕請求 ({e.status_code} {e.reason}): {e}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def _require_admin(request: Request):
+    """檢查管理端點權杖 (X-Admin-Token 或 Authorization: Bearer)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="管理端點未啟用，請設定 ADMIN_TOKEN")
+    token = request.headers.get("x-admin-token") or ""
+    authorization = request.headers.get("authorization") or ""
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="管理權杖無效")
+
+def _log_access(
+    endpoint: str,
+    status: Optional[int],
+    data: Optional[dict] = None,
+    tenant=None,
+    response: Optional[Response] = None,
+    error: Any = None,
+    **extra
+):
+    """寫入一筆存取日誌 (只記錄文字長度與雜湊，不記錄內容)"""
+    timer = timing.current()
+    text = (data or {}).get("text") or ""
+    headers = response.headers if response is not None else {}
+    if status is None:
+        outcome = "cancelled"
+    elif status == 202:
+        outcome = "accepted"
+    elif status >= 400:
+        outcome = "error"
+    elif headers.get("idempotent-replayed"):
+        outcome = "replayed"
+    else:
+        outcome = "ok"
+    entry = {
+        "ts": round(time.time(), 3),
+        "request_id": timer.request_id if timer else None,
+        "endpoint": endpoint,
+        "status": status,
+        "outcome": outcome,
+        "tenant": tenant.id if tenant is not None else None,
+        "service": headers.get("x-service") or (data or {}).get("service"),
+        "routed": headers.get("x-routed") == "auto",
+        "text_chars": len(text),
+        "text_sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] if text else None,
+        "cache": headers.get("x-cache"),
+        "bytes": len(response.body) if isinstance(response, Response) and hasattr(response, "body") else None,
+        "duration_ms": round(timer.elapsed() * 1000, 1) if timer else None,
+        "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in timer.stages.items()} if timer else {},
+    }
+    if error is not None:
+        entry["error"] = str(error)[:500]
+    entry.update(extra)
+    access_log.log(entry)
+
+def _apply_mock(enabled: Optional[bool] = None, impersonate: Optional[List[str]] = None):
+    """
+    啟用 / 停用獨立的模擬服務 ("mock")，並以模擬服務替換指定的真實服務
+    impersonate 為完整清單：不在清單內的服務恢復為真實服務
+
+    Raises:
+        ValueError: 服務不存在
+    """
+    if impersonate is not None:
+        unknown = [
+            service_id for service_id in impersonate
+            if service_id == "mock" or (service_id not in tts_services and service_id not in _impersonated_services)
+        ]
+        if unknown:
+            raise ValueError(f"無法模擬的服務: {unknown}")
+
+    if enabled is True and "mock" not in tts_services:
+        tts_services["mock"] = MockTTSService(mock_behavior)
+        logger.info("🧪 已啟用模擬服務 mock")
+    elif enabled is False and "mock" in tts_services:
+        del tts_services["mock"]
+        logger.info("🧪 已停用模擬服務 mock")
+
+    if impersonate is None:
+        return
+    for service_id in list(_impersonated_services):
+        if service_id not in impersonate:
+            tts_services[service_id] = _impersonated_services.pop(service_id)
+            logger.info(f"🧪 {service_id} 已恢復為真實服務")
+    for service_id in impersonate:
+        if service_id not in _impersonated_services:
+            real_service = tts_services[service_id]
+            _impersonated_services[service_id] = real_service
+            tts_services[service_id] = MockTTSService(mock_behavior, impersonate=real_service, service_id=service_id)
+            logger.warning(f"🧪 {service_id} 已由模擬服務替換")
+
+def _mock_status() -> dict:
+    instances = [service for service in tts_services.values() if isinstance(service, MockTTSService)]
+    return {
+        "enabled": "mock" in tts_services,
+        "impersonating": sorted(_impersonated_services),
+        "behavior": mock_behavior.to_dict(),
+        "instances": [service.summary() for service in instances],
+    }
+
+def _new_audio_filename(service: str) -> str:
+    """產生音頻文件名"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"tts_{service}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+async def _save_audio_file(filename: str, audio_data: bytes) -> str:
+    """保存音頻文件到共享目錄，返回文件路徑 (在執行緒中寫入，不阻塞事件迴圈)"""
+    # 確保音頻目錄存在
+    os.makedirs(AUDIO_DIR, exist_ok=True)
+    
+    # 保存音頻文件
+    audio_path = os.path.join(AUDIO_DIR, filename)
+    with timing.stage("write"):
+        await asyncio.to_thread(_write_file, audio_path, audio_data)
+    
+    logger.info(f"✅ 音頻文件已保存: {audio_path} (格式: WAV)")
+    return audio_path
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _read_audio_file(filename: str) -> Optional[bytes]:
+    """讀取共享目錄中已保存的音頻文件，不存在時返回 None"""
+    try:
+        return await asyncio.to_thread(_read_file, os.path.join(AUDIO_DIR, filename))
+    except OSError:
+        return None
+
+def _timing_headers() -> dict:
+    """X-Request-ID 與 Server-Timing 標頭 (各階段到目前為止的耗時)，同時記錄到日誌"""
+    timer = timing.current()
+    if timer is None:
+        return {}
+    logger.info(f"⏱️ 階段耗時: {timer.summary()}")
+    return {
+        "X-Request-ID": timer.request_id,
+        "Server-Timing": timer.server_timing(),
+    }
+
+def _attach_timing(exc: HTTPException) -> HTTPException:
+    """錯誤回應同樣帶上 X-Request-ID 與 Server-Timing"""
+    exc.headers = {**(exc.headers or {}), **_timing_headers()}
+    return exc
+
+def _audio_headers(service: str, filename: str, routed: bool = False) -> dict:
+    """音頻回應的共用標頭"""
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "X-Service": service,
+        "X-Filename": filename,
+        "X-Audio-Path": f"/data/audios/{filename}",
+        "X-Audio-Format": "WAV",
+        **_timing_headers()
+    }
+    if routed:
+        headers["X-Routed"] = "auto"
+    return headers
+
+def _cache_mode(data: dict) -> str:
+    """請求的快取模式 (cache 欄位，未指定時使用 AUDIO_CACHE_MODE)"""
+    mode = data.get("cache") or AUDIO_CACHE_MODE
+    if mode not in CACHE_MODES:
+        raise HTTPException(status_code=400, detail=f"cache 需為 {' / '.join(CACHE_MODES)}")
+    return mode if audio_cache.enabled else "off"
+
+def _cacheable(result: dict) -> bool:
+    """模擬音頻 (含 API 失敗回退) 與模擬服務的輸出不寫入快取"""
+    return result.get("mode") not in ("simulation", "mock")
+
+async def _cached_generated(
+    tts_service, quota, service: str, data: dict, text: str, audio_data: bytes, save: bool = True
+) -> dict:
+    """整段文字命中快取：不呼叫上游、不佔用准入名額，也不計入字數用量"""
+    reservation = await _reserve_memory(tts_service, text, nbytes=len(audio_data))
+    filename = None
+    try:
+        if save:
+            filename = _new_audio_filename(service)
+            await _save_audio_file(filename, audio_data)
+        quota.commit(0)
+    except BaseException:
+        reservation.release()
+        raise
+    logger.info(f"🗃️ 音頻快取命中: {service} ({len(text)} 字)")
+    return {
+        "audio_data": audio_data,
+        "filename": filename,
+        "service": service,
+        "routed": data.get("service") == "auto",
+        "duration": wav_duration(audio_data),
+        "reservation": reservation,
+        "cache": "hit",
+        "characters": 0,
+    }
+
+async def _synthesize_segments(
+    tts_service,
+    service: str,
+    voice_config: dict,
+    language: str,
+    segments: List[str],
+    concurrency: int = AUDIO_CACHE_SEGMENT_CONCURRENCY
+) -> List[Tuple[bytes, str]]:
+    """
+    逐段查詢分段快取，只合成缺少的分段 (同時最多 concurrency 段)
+    與其他請求相同的分段只合成一次；任一段失敗時取消其餘分段。返回各段的 (音頻, 來源)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def synthesize(segment: str) -> Tuple[bytes, bool]:
+        async with provider_router.track(service) as call:
+            result = await tts_service.generate_speech(
+                text=segment,
+                voice_config=voice_config,
+                format="wav",
+                language=language
+            )
+            call["mode"] = result.get("mode")
+            if not result["success"]:
+                raise _failure_response(result["message"])
+        prepared = await asyncio.to_thread(
+            prepare_segment, result["audio_data"], AUDIO_CACHE_TARGET_DBFS, AUDIO_CACHE_MAX_PAUSE
+        )
+        return prepared, _cacheable(result)
+    
+    async def fetch(segment: str) -> Tuple[bytes, str]:
+        async with semaphore:
+            return await audio_cache.get_or_create(
+                audio_cache.make_key("segment", service, voice_config, language, segment),
+                lambda: synthesize(segment)
+            )
+    
+    tasks = [asyncio.ensure_future(fetch(segment)) for segment in segments]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        # 失敗或請求取消時，其餘分段不再呼叫上游 (其他請求共用的合成仍會繼續)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _generate_from_segments(
+    request: Optional[Request],
+    data: dict,
+    tenant,
+    quota,
+    service: str,
+    voice_config: dict,
+    language: str,
+    text: str,
+    segments: List[str],
+    text_key: str,
+    save: bool = True,
+    segment_concurrency: int = AUDIO_CACHE_SEGMENT_CONCURRENCY
+) -> dict:
+    """
+    以分段快取組合整段音頻：命中的分段直接使用，缺少的分段才呼叫上游，以交叉淡化串接
+    與一般合成相同，先取得准入名額 (整個請求一個) 再預留記憶體
+    """
+    tts_service = tts_services[service]
+    ticket = await _acquire_admission(service, tenant)
+    try:
+        reservation = await _reserve_memory(tts_service, text)
+    except BaseException:
+        ticket.release()
+        raise
+    filename = None
+    try:
+        try:
+            parts = await _run_until_disconnect(request, _synthesize_segments(
+                tts_service, service, voice_config, language, segments, segment_concurrency
+            ))
+        finally:
+            ticket.release()
+        with timing.stage("assemble"):
+            audio_data, duration = await asyncio.to_thread(
+                join_segments, [audio for audio, _ in parts], AUDIO_CACHE_CROSSFADE
+            )
+        # 只計入本請求實際合成的分段 (等待其他請求進行中的合成不計)
+        synthesized = [segment for segment, (_, source) in zip(segments, parts) if source == "miss"]
+        quota.commit(sum(len(segment) for segment in synthesized))
+        reservation.reconcile(len(audio_data))
+        # 所有分段都可快取時，同時保存整段結果，相同腳本下次直接命中
+        if all(audio_cache.contains(audio_cache.make_key("segment", service, voice_config, language, segment)) for segment in segments):
+            await audio_cache.put(text_key, audio_data)
+        if save:
+            filename = _new_audio_filename(service)
+            await _save_audio_file(filename, audio_data)
+    except BaseException:
+        reservation.release()
+        raise
+    
+    hits = len(segments) - len(synthesized)
+    logger.info(f"🧩 分段組合: {hits}/{len(segments)} 段命中快取，合成 {len(synthesized)} 段")
+    return {
+        "audio_data": audio_data,
+        "filename": filename,
+        "service": service,
+        "routed": data.get("service") == "auto",
+        "duration": duration,
+        "reservation": reservation,
+        "cache": "hit" if not synthesized else ("miss" if hits == 0 else "partial"),
+        "cache_segments": f"{hits}/{len(segments)}",
+        "characters": sum(len(segment) for segment in synthesized),
+    }
+
+async def _generate_audio(
+    request: Optional[Request],
+    data: dict,
+    tenant,
+    save: bool = True,
+    segment_concurrency: int = AUDIO_CACHE_SEGMENT_CONCURRENCY
+) -> dict:
+    """
+    合成並保存一段 WAV 音頻 (先查詢音頻快取)
+    返回的 reservation 為記憶體預留，由呼叫端在回應送出後釋放；
+    save 為 False 時不寫入共享目錄 (filename 為 None)，例如只為預熱快取的合成
+    """
+    # 提取參數
+    text, service, voice_config, language = await _extract_tts_params(data)
+    quota = _check_quota(tenant, text)
+    try:
+        return await _synthesize_audio(
+            request, data, tenant, quota, text, service, voice_config, language, save, segment_concurrency
+        )
+    finally:
+        # 成功時已以實際字數計入用量；失敗或取消時退回預留的配額
+        quota.release()
+
+async def _synthesize_audio(
+    request: Optional[Request],
+    data: dict,
+    tenant,
+    quota,
+    text: str,
+    service: str,
+    voice_config: dict,
+    language: str,
+    save: bool,
+    segment_concurrency: int
+) -> dict:
+    """_generate_audio 的合成部分：先查詢音頻快取，再分段或整段合成"""
+    cache_mode = _cache_mode(data)
+    
+    # 獲取對應的 TTS 服務
+    tts_service = tts_services[service]
+    
+    text_key = None
+    if cache_mode != "off":
+        text_key = audio_cache.make_key("text", service, voice_config, language, text)
+        cached = await audio_cache.get(text_key)
+        if cached is not None:
+            return await _cached_generated(tts_service, quota, service, data, text, cached, save)
+    
+    _check_deadline_feasible(service)
+    
+    if cache_mode == "segments":
+        segments = split_segments(text, AUDIO_CACHE_MIN_SEGMENT_CHARS)
+        if len(segments) > 1:
+            return await _generate_from_segments(
+                request, data, tenant, quota, service, voice_config, language, text, segments, text_key, save,
+                segment_concurrency
+            )
+    
+    # 統一使用 WAV 格式調用 TTS 服務 (記錄延遲供自動路由使用，客戶端斷線時取消)
+    ticket = await _acquire_admission(service, tenant)
+    try:
+        reservation = await _reserve_memory(tts_service, text)
+    except BaseException:
+        ticket.release()
+        raise
+    try:
+        async with provider_router.track(service) as call:
+            result = await _run_until_disconnect(request, tts_service.generate_speech(
+                text=text,
+                voice_config=voice_config,
+                format="wav",  # 統一使用 WAV 格式
+                language=language
+            ))
+            call["mode"] = result.get("mode")
+            if not result["success"]:
+                raise _failure_response(result["message"])
         
-        # 提取參數
-        text = data.get("text")
-        service = data.get("service", "service1")
-        voice_config = data.get("voice_config") or {}
-        language = data.get("language", "zh")
+        # 保存音頻文件到共享目錄
+        audio_data = result["audio_data"]
+        quota.commit(len(text))
+        reservation.reconcile(len(audio_data))
+        filename = None
+        if save:
+            filename = _new_audio_filename(service)
+            await _save_audio_file(filename, audio_data)
+    except BaseException:
+        reservation.release()
+        raise
+    finally:
+        ticket.release()
+    
+    if text_key and _cacheable(result):
+        await audio_cache.put(text_key, audio_data)
+    
+    return {
+        "audio_data": audio_data,
+        "filename": filename,
+        "service": service,
+        "routed": data.get("service") == "auto",
+        "duration": result.get("duration", 0),
+        "reservation": reservation,
+        "cache": "miss" if text_key else None,
+        "characters": len(text),
+    }
+
+def _generated_response(generated: dict, replayed: bool = False, background: Optional[BackgroundTask] = None) -> Response:
+    """統一返回 WAV 格式"""
+    headers = {
+        **_audio_headers(generated["service"], generated["filename"], generated["routed"]),
+        "X-Duration": str(generated["duration"]),
+    }
+    if generated.get("cache"):
+        headers["X-Cache"] = generated["cache"]
+    if generated.get("cache_segments"):
+        headers["X-Cache-Segments"] = generated["cache_segments"]
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return Response(
+        content=generated["audio_data"],
+        media_type="audio/wav",
+        headers=headers,
+        background=background
+    )
+
+async def _generate_detached(data: dict, tenant) -> dict:
+    """Idempotency-Key 的合成：不隨呼叫端斷線取消，完成後立即釋放記憶體預留"""
+    generated = await _generate_audio(None, data, tenant)
+    generated["reservation"].release()
+    return generated
+
+def _describe_generated(generated: dict) -> dict:
+    """Idempotency-Key 保存的結果描述 (音頻本身已保存在共享目錄)"""
+    return {key: generated[key] for key in ("filename", "service", "routed", "duration")}
+
+async def _generate_idempotent(request: Request, data: dict, tenant, idempotency_key: str) -> Response:
+    """
+    帶 Idempotency-Key 的請求
+    相同 Key 的重試返回已保存的音頻，或等待進行中的同一個合成，不會再次呼叫上游
+    """
+    try:
+        entry, owner = idempotency.begin(tenant.id, idempotency_key, data)
+        if entry.result is not None:
+            audio_data = await _read_audio_file(entry.result["filename"])
+            if audio_data is not None:
+                return _generated_response({**entry.result, "audio_data": audio_data}, replayed=True)
+            # 保存的文件已被清除，重新合成
+            logger.warning(f"⚠️ Idempotency-Key {idempotency_key} 的音頻文件已不存在，重新合成")
+            idempotency.forget(entry)
+            entry, owner = idempotency.begin(tenant.id, idempotency_key, data)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if owner:
+        idempotency.run(entry, _generate_detached(data, tenant), describe=_describe_generated)
+    
+    # 呼叫端斷線只停止等待，合成繼續進行並保存結果供重試取用
+    generated = await _run_until_disconnect(request, asyncio.shield(entry.task))
+    return _generated_response(generated, replayed=not owner)
+
+async def _run_async_job(job_id: str, data: dict, tenant, callback_url: str, base_url: str):
+    """執行非同步合成，完成或失敗後把結果寫入 Webhook 佇列"""
+    payload = {
+        "job_id": job_id,
+        "request_id": timing.current_request_id(),
+        "tenant": tenant.id,
+        "metadata": data.get("metadata"),
+    }
+    try:
+        generated = await _generate_detached(data, tenant)
+        filename = generated["filename"]
+        payload.update({
+            "success": True,
+            "status": "completed",
+            "service": generated["service"],
+            "routed": generated["routed"],
+            "filename": filename,
+            "duration": generated["duration"],
+            "audio_path": f"/data/audios/{filename}",
+            "download_url": f"{base_url}/api/tts/audio/{filename}",
+        })
+    except HTTPException as e:
+        payload.update({"success": False, "status": "failed", "status_code": e.status_code, "message": str(e.detail)})
+    except Exception as e:
+        logger.error(f"非同步 TTS 任務 {job_id} 失敗: {e}")
+        payload.update({"success": False, "status": "failed", "status_code": 500, "message": str(e)})
+    
+    payload["completed_at"] = time.time()
+    webhooks.enqueue(callback_url, payload)
+
+async def _submit_async_job(
+    request: Request, data: dict, tenant, callback_url: str, idempotency_key: Optional[str] = None
+) -> JSONResponse:
+    """
+    接受帶 callback_url 的請求，立即返回 202，合成完成後以 Webhook 通知
+    參數、音色與配額先檢查，錯誤直接返回 4xx；帶 Idempotency-Key 的重試返回同一個 job_id，不會再次合成
+    """
+    try:
+        await webhooks.check_url(callback_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 配額只在此檢查，正式預留在任務開始合成時進行
+    text, _, _, _ = await _extract_tts_params(data)
+    _cache_mode(data)
+    _check_quota(tenant, text).release()
+    
+    entry = None
+    if idempotency_key is not None:
+        try:
+            entry, owner = idempotency.begin(tenant.id, idempotency_key, data)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not owner:
+            if entry.job_id is None:
+                raise HTTPException(status_code=422, detail=f"Idempotency-Key '{idempotency_key}' 已用於內容不同的請求")
+            logger.info(f"🔁 Idempotency-Key {idempotency_key} 返回已接受的非同步任務 {entry.job_id}")
+            return _async_job_response(entry.job_id, replayed=True)
+    
+    job_id = uuid.uuid4().hex
+    base_url = PUBLIC_BASE_URL or str(request.base_url).rstrip("/")
+    job = _run_async_job(job_id, data, tenant, callback_url, base_url)
+    if entry is not None:
+        entry.job_id = job_id
+        task = idempotency.run(entry, job, describe=lambda _: {"job_id": job_id})
+    else:
+        task = asyncio.ensure_future(job)
+    _async_jobs.add(task)
+    task.add_done_callback(_async_jobs.discard)
+    
+    logger.info(f"📮 已接受非同步 TTS 任務 {job_id}，完成後通知 {callback_url}")
+    return _async_job_response(job_id)
+
+def _async_job_response(job_id: str, replayed: bool = False) -> JSONResponse:
+    headers = _timing_headers()
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "message": "已接受，合成完成後將通知 callback_url",
+            "job_id": job_id,
+        },
+        headers=headers
+    )
+
+@app.post("/api/tts/generate")
+async def generate_tts(request: Request):
+    """
+    TTS 語音合成統一入口 - 統一輸出 WAV 格式
+    根據 service 參數路由到對應的 TTS 服務；帶 Idempotency-Key 的重試不會重複合成；
+    帶 callback_url 時立即返回 202，完成後以 Webhook 通知結果
+    """
+    data = tenant = response = error = status = None
+    try:
+        timing.start(timing.request_id_from(request.headers))
+        with timing.stage("parse"):
+            data = await _parse_request_body(request)
+        _apply_deadline(request, data)
+        tenant = _resolve_tenant(request)
         
-        # 語言參數轉換 - ATEN 服務需要特定格式
-        if service == "service3" and language == "zh":
-            language = "zh-TW"
+        callback_url = data.get("callback_url")
+        idempotency_key = request.headers.get("idempotency-key")
+        if callback_url:
+            response = await _submit_async_job(request, data, tenant, callback_url, idempotency_key)
+        elif idempotency_key is not None:
+            response = await _generate_idempotent(request, data, tenant, idempotency_key)
+        else:
+            generated = await _generate_audio(request, data, tenant)
+            # 回應送出後釋放記憶體預留
+            response = _generated_response(generated, background=BackgroundTask(generated["reservation"].release))
+        status = response.status_code
+        return response
+            
+    except HTTPException as e:
+        status, error = e.status_code, e.detail
+        raise _attach_timing(e)
+    except Exception as e:
+        logger.error(f"TTS 生成錯誤: {e}")
+        failure = _failure_response(f"TTS 生成失敗: {str(e)}")
+        status, error = failure.status_code, failure.detail
+        raise _attach_timing(failure)
+    finally:
+        _log_access("generate", status, data, tenant, response, error)
+
+@app.post("/api/tts/stream")
+async def stream_tts(request: Request):
+    """
+    TTS 串流合成入口 - 邊合成邊輸出 WAV
+    支援串流的服務逐塊輸出 PCM，首個音頻片段到達即開始回應；
+    其餘服務合成完成後一次輸出完整 WAV
+    """
+    data = tenant = quota = response = error = status = None
+    streaming = False
+    try:
+        timing.start(timing.request_id_from(request.headers))
+        with timing.stage("parse"):
+            data = await _parse_request_body(request)
+        _apply_deadline(request, data)
+        text, service, voice_config, language = await _extract_tts_params(data)
+        routed = data.get("service") == "auto"
+        tenant = _resolve_tenant(request)
+        quota = _check_quota(tenant, text)
+        _check_deadline_feasible(service)
+        tts_service = tts_services[service]
         
-        if not text:
-            raise HTTPException(status_code=400, detail="缺少必要參數: text")
+        # 整段文字命中快取時直接返回完整 WAV
+        if _cache_mode(data) != "off":
+            cached = await audio_cache.get(audio_cache.make_key("text", service, voice_config, language, text))
+            if cached is not None:
+                generated = await _cached_generated(tts_service, quota, service, data, text, cached)
+                response = _generated_response(generated, background=BackgroundTask(generated["reservation"].release))
+                response.headers["X-Streaming"] = "false"
+                status = response.status_code
+                return response
         
-        logger.info(f"收到 TTS 請求: service={service}, text={text[:50]}...")
+        filename = _new_audio_filename(service)
         
-        # 檢查服務是否存在
-        if service not in tts_services:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"服務 '{service}' 不存在。可用服務: {list(tts_services.keys())}"
+        if not getattr(tts_service, "supports_streaming", False):
+            ticket = await _acquire_admission(service, tenant)
+            try:
+                reservation = await _reserve_memory(tts_service, text)
+            except BaseException:
+                ticket.release()
+                raise
+            try:
+                async with provider_router.track(service) as call:
+                    result = await _run_until_disconnect(request, tts_service.generate_speech(
+                        text=text,
+                        voice_config=voice_config,
+                        format="wav",
+                        language=language
+                    ))
+                    call["mode"] = result.get("mode")
+                    if not result["success"]:
+                        raise _failure_response(result["message"])
+                
+                quota.commit(len(text))
+                reservation.reconcile(len(result["audio_data"]))
+                await _save_audio_file(filename, result["audio_data"])
+            except BaseException:
+                reservation.release()
+                raise
+            finally:
+                ticket.release()
+            
+            response = Response(
+                content=result["audio_data"],
+                media_type="audio/wav",
+                headers={
+                    **_audio_headers(service, filename, routed),
+                    "X-Duration": str(result.get("duration", 0)),
+                    "X-Streaming": "false",
+                },
+                background=BackgroundTask(reservation.release)
             )
+            status = response.status_code
+            return response
         
-        # 獲取對應的 TTS 服務
-        tts_service = tts_services[service]
-        
-        # 統一使用 WAV 格式調用 TTS 服務
-        result = await tts_service.generate_speech(
+        # 串流的准入名額與記憶體預留保留到串流結束 (串流期間累積完整 PCM 供保存)
+        ticket = await _acquire_admission(service, tenant)
+        try:
+            reservation = await _reserve_memory(tts_service, text)
+        except BaseException:
+            ticket.release()
+            raise
+        sample_rate = tts_service.stream_sample_rate
+        chunks = tts_service.generate_speech_stream(
             text=text,
             voice_config=voice_config,
-            format="wav",  # 統一使用 WAV 格式
             language=language
         )
         
-        if result["success"]:
-            # 保存音頻文件到共享目錄
-            import uuid
-            import datetime
-            
-            audio_data = result["audio_data"]
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"tts_{service}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
-            
-            # 確保音頻目錄存在
-            audio_dir = "/app/data/audios"
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            # 保存音頻文件
-            audio_path = os.path.join(audio_dir, filename)
-            with open(audio_path, "wb") as f:
-                f.write(audio_data)
-            
-            logger.info(f"✅ 音頻文件已保存: {audio_path} (格式: WAV)")
-            
-            # 統一返回 WAV 格式
-            return Response(
-                content=audio_data,
-                media_type="audio/wav",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}",
-                    "X-Service": service,
-                    "X-Duration": str(result.get("duration", 0)),
-                    "X-Filename": filename,
-                    "X-Audio-Path": f"/data/audios/{filename}",
-                    "X-Audio-Format": "WAV"
-                }
-            )
-        else:
-            raise HTTPException(status_code=500, detail=result["message"])
+        async def next_chunk() -> Optional[bytes]:
+            try:
+                return await chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+        
+        # 先取得第一個片段，讓上游錯誤仍能以 HTTP 錯誤回應 (以首包延遲供自動路由使用)
+        try:
+            async with provider_router.track(service):
+                first_chunk = await _run_until_disconnect(request, next_chunk())
+                if first_chunk is None:
+                    raise HTTPException(status_code=500, detail="TTS 串流未返回音頻數據")
+        except BaseException:
+            await chunks.aclose()
+            reservation.release()
+            ticket.release()
+            raise
+        
+        async def cleanup():
+            # 回應結束後 (包含客戶端斷線、生成器未啟動) 一定執行；未完成的串流退回預留的配額
+            ticket.release()
+            reservation.release()
+            quota.release()
+            await chunks.aclose()
+        
+        async def audio_stream():
+            pcm_chunks = [first_chunk]
+            completed = False
+            stream_error = None
+            try:
+                yield wav_stream_header(sample_rate)
+                yield first_chunk
+                async for chunk in chunks:
+                    pcm_chunks.append(chunk)
+                    yield chunk
+                completed = True
+                quota.commit(len(text))
+                reservation.reconcile(sum(len(chunk) for chunk in pcm_chunks))
+            except Exception as e:
+                logger.error(f"TTS 串流中斷: {e}")
+                stream_error = e
+                raise
+            finally:
+                # 客戶端斷線時 StreamingResponse 會取消此生成器，
+                # 關閉上游串流以釋放連線與 ffmpeg 子程序
+                await chunks.aclose()
+                ticket.release()
+                quota.release()
+                if not completed:
+                    logger.info("🔌 串流未完成，不保存音頻文件")
+                _log_access(
+                    "stream", 200, data, tenant, error=stream_error,
+                    service=service, routed=routed, streaming=True, completed=completed,
+                    bytes=sum(len(chunk) for chunk in pcm_chunks)
+                )
             
-    except HTTPException:
-        raise
+            # 串流結束後保存完整音頻，與 /api/tts/generate 行為一致
+            try:
+                await _save_audio_file(filename, pcm_to_wav(b"".join(pcm_chunks), sample_rate))
+            finally:
+                reservation.release()
+        
+        streaming = True
+        return StreamingResponse(
+            audio_stream(),
+            media_type="audio/wav",
+            headers={
+                **_audio_headers(service, filename, routed),
+                "X-Sample-Rate": str(sample_rate),
+                "X-Streaming": "true",
+            },
+            background=BackgroundTask(cleanup)
+        )
+        
+    except HTTPException as e:
+        status, error = e.status_code, e.detail
+        raise _attach_timing(e)
     except Exception as e:
-        logger.error(f"TTS 生成錯誤: {e}")
-        raise HTTPException(status_code=500, detail=f"TTS 生成失敗: {str(e)}")
+        logger.error(f"TTS 串流生成錯誤: {e}")
+        failure = _failure_response(f"TTS 串流生成失敗: {str(e)}")
+        status, error = failure.status_code, failure.detail
+        raise _attach_timing(failure)
+    finally:
+        # 串流回應的配額與存取日誌在串流結束時處理
+        if not streaming:
+            if quota is not None:
+                quota.release()
+            _log_access("stream", status, data, tenant, response, error)
+
+@app.get("/api/voices")
+async def list_voices(
+    provider: Optional[str] = None,
+    language: Optional[str] = None,
+    gender: Optional[str] = None,
+    style: Optional[str] = None,
+    tag: Optional[str] = None
+):
+    """查詢統一音色目錄，可依服務、語言、性別、風格、標籤篩選"""
+    voices = voice_catalog.find(provider=provider, language=language, gender=gender, style=style, tag=tag)
+    return {
+        "version": voice_catalog.version,
+        "total": len(voices),
+        "voices": voices,
+    }
+
+@app.get("/api/voices/status")
+async def voice_catalog_status():
+    """音色目錄狀態"""
+    return voice_catalog.summary()
+
+@app.get("/api/voices/{service_id}/{voice_id}")
+async def get_voice(service_id: str, voice_id: str):
+    """查詢單一音色"""
+    voice = voice_catalog.get(service_id, voice_id)
+    if voice is None:
+        raise HTTPException(status_code=404, detail=f"音色 '{voice_id}' 不存在於服務 '{service_id}'")
+    return voice
+
+@app.post("/api/voices/refresh")
+async def refresh_voices(request: Request):
+    """立即刷新音色目錄 (需管理權杖，會向所有上游重新取得音色列表)"""
+    _require_admin(request)
+    await voice_catalog.refresh()
+    return voice_catalog.summary()
+
+@app.get("/api/router")
+async def router_status(request: Request):
+    """自動路由狀態：各服務的延遲 EWMA、排隊深度與音色群組 (需管理權杖)"""
+    _require_admin(request)
+    return provider_router.summary()
+
+@app.get("/api/admission")
+async def admission_status(request: Request):
+    """准入控制狀態：各範圍的併發、佇列深度、拒絕次數與消化速度，以及音頻記憶體預算 (需管理權杖)"""
+    _require_admin(request)
+    return {**admission.summary(), "memory": memory_budget.summary()}
+
+@app.get("/api/tenants")
+async def tenant_usage(request: Request):
+    """各租戶的設定與用量 (今日字數、剩餘配額、累計請求數，需管理權杖)"""
+    _require_admin(request)
+    return tenants.summary()
+
+@app.get("/api/tenants/{tenant_id}/usage")
+async def get_tenant_usage(request: Request, tenant_id: str):
+    """查詢單一租戶的用量 (呼叫端只能查詢自己的租戶，其他租戶需管理權杖)"""
+    if _resolve_tenant(request).id != tenant_id:
+        _require_admin(request)
+    tenant = tenants.get(tenant_id)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail=f"租戶 '{tenant_id}' 不存在")
+    limiter = admission.tenants.get(tenant_id)
+    return {**tenant.to_dict(), "admission": limiter.summary() if limiter else None}
+
+@app.post("/api/tenants/reload")
+async def reload_tenants(request: Request):
+    """重新載入租戶設定檔 (保留用量，需管理權杖)"""
+    _require_admin(request)
+    tenants.load()
+    return tenants.summary()
+
+@app.get("/api/tts/audio/{filename}")
+async def download_audio(filename: str):
+    """下載已保存的音頻文件 (Webhook 通知中的 download_url)"""
+    if not re.fullmatch(r"[A-Za-z0-9_.\-]+\.wav", filename):
+        raise HTTPException(status_code=400, detail="文件名格式錯誤")
+    audio_path = os.path.join(AUDIO_DIR, filename)
+    if not os.path.isfile(audio_path):
+        raise HTTPException(status_code=404, detail=f"音頻文件 '{filename}' 不存在")
+    return FileResponse(audio_path, media_type="audio/wav", filename=filename)
+
+@app.get("/api/webhooks")
+async def webhook_status(request: Request):
+    """Webhook 投遞狀態：佇列中、已送達、已放棄與重試次數 (需管理權杖)"""
+    _require_admin(request)
+    return webhooks.summary()
+
+@app.get("/api/idempotency")
+async def idempotency_status(request: Request):
+    """Idempotency-Key 狀態：保存的結果數、進行中的合成與重用次數 (需管理權杖)"""
+    _require_admin(request)
+    return idempotency.summary()
+
+@app.get("/api/admin/loop-lag")
+async def loop_lag_status(request: Request):
+    """事件迴圈延遲統計與最近擷取的阻塞堆疊 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    return {
+        **loop_monitor.summary(),
+        "captures": loop_monitor.recent_captures(),
+    }
+
+@app.post("/api/admin/profile/memory/start")
+async def start_memory_profile(request: Request, frames: int = 25):
+    """開始 tracemalloc 追蹤並保存基準快照 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    frames = max(1, min(frames, 100))
+    logger.info(f"🔬 開始 tracemalloc 追蹤 ({frames} 層堆疊)")
+    return memory_profiler.start(frames)
+
+@app.get("/api/admin/profile/memory")
+async def memory_profile_top(request: Request, limit: int = 20, group_by: str = "lineno", compare: bool = True):
+    """tracemalloc 配置最多的位置，預設與基準快照比較 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by 必須是 lineno、filename 或 traceback")
+    if not memory_profiler.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc 尚未啟動，請先呼叫 /api/admin/profile/memory/start")
+    # 快照與統計在大量配置時需要數秒，移到執行緒避免阻塞事件迴圈
+    return await asyncio.to_thread(memory_profiler.top, max(1, min(limit, 200)), group_by, compare)
+
+@app.post("/api/admin/profile/memory/stop")
+async def stop_memory_profile(request: Request):
+    """停止 tracemalloc 追蹤 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    logger.info("🔬 停止 tracemalloc 追蹤")
+    return memory_profiler.stop()
+
+@app.get("/api/admin/profile/cpu", response_class=PlainTextResponse)
+async def cpu_profile(request: Request, seconds: float = 10, interval_ms: float = 10):
+    """
+    統計式 CPU 取樣 (需要 ADMIN_TOKEN)
+    返回 collapsed stack 文字，可交給 flamegraph.pl 或 speedscope 產生火焰圖
+    """
+    _require_admin(request)
+    seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+    interval = max(1.0, interval_ms) / 1000
+    logger.info(f"🔬 CPU 取樣 {seconds:.1f}s (間隔 {interval * 1000:.0f}ms)")
+    try:
+        result = await cpu_sampler.profile(seconds, interval)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(result["collapsed"], headers={"X-Profile-Samples": str(result["samples"])})
+
+@app.get("/api/admin/tasks")
+async def asyncio_tasks(request: Request):
+    """列出所有 asyncio 任務與目前等待的位置 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    tasks = dump_tasks()
+    return {"count": len(tasks), "tasks": tasks}
+
+@app.get("/api/admin/mock")
+async def mock_status(request: Request):
+    """模擬服務狀態 (需要 ADMIN_TOKEN)"""
+    _require_admin(request)
+    return _mock_status()
+
+@app.put("/api/admin/mock")
+async def update_mock(request: Request):
+    """
+    執行期間切換模擬服務 (需要 ADMIN_TOKEN)
+    body: {"enabled": true, "impersonate": ["service2"], "behavior": {"error_rate": 1.0}}，省略的欄位不變
+    """
+    _require_admin(request)
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="請求體必須是 JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="請求體必須是 JSON 物件")
+    impersonate = body.get("impersonate")
+    if impersonate is not None and not isinstance(impersonate, list):
+        raise HTTPException(status_code=400, detail="impersonate 必須是服務ID陣列")
+    try:
+        if body.get("behavior"):
+            mock_behavior.update(body["behavior"])
+        _apply_mock(enabled=body.get("enabled"), impersonate=impersonate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.warning(f"🧪 模擬服務設定已更新: {_mock_status()}")
+    # 立即更新健康狀態與服務列表
+    await health_monitor.probe_all()
+    return _mock_status()
+
+@app.get("/api/audio-cache")
+async def audio_cache_status(request: Request):
+    """音頻快取狀態：項目數、佔用空間與各種類的命中率 (需管理權杖)"""
+    _require_admin(request)
+    return {**audio_cache.summary(), "mode": AUDIO_CACHE_MODE}
+
+def _prefetch_key(item: dict) -> str:
+    return audio_cache.make_key("text", item["service"], item["voice_config"], item["language"], item["text"])
+
+def _prefetch_idle(service: str) -> bool:
+    """Gateway 與該服務都沒有排隊 (含記憶體預算)，且進行中的請求不多時才算閒置"""
+    if admission.global_limiter.queue_depth or admission.queue_depth(service) or memory_budget.queue_depth:
+        return False
+    return admission.global_limiter.active <= PREFETCH_IDLE_MAX_ACTIVE
+
+async def _run_prefetch_item(job: PrefetchJob, item: dict) -> Tuple[bool, int]:
+    """
+    以一般合成流程合成 (准入、配額、分段快取)，只寫入快取，不保存到共享目錄
+    分段逐段合成，低優先順序的預先合成同時只佔用一個上游請求
+    """
+    timing.start(f"prefetch-{job.id}")
+    data = {key: item[key] for key in ("text", "service", "voice_config", "language", "cache")}
+    generated = await _generate_audio(None, data, job.tenant, save=False, segment_concurrency=1)
+    generated["reservation"].release()
+    return audio_cache.contains(_prefetch_key(item)), generated["characters"]
+
+async def _parse_prefetch_items(data: dict) -> List[dict]:
+    """檢查預先合成項目，服務、音色與快取模式在送出時即驗證，並估算各項成本"""
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="缺少必要參數: items")
+    if len(items) > PREFETCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"items 最多 {PREFETCH_MAX_ITEMS} 項")
+    
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail=f"items[{index}] 必須是物件")
+        if item.get("service") == "auto":
+            # 自動路由的結果隨負載變化，預熱的快取不一定會被命中
+            raise HTTPException(status_code=400, detail=f"items[{index}]: 預先合成需指定服務，不支援 auto")
+        try:
+            text, service, voice_config, language = await _extract_tts_params(item)
+            cache_mode = _cache_mode({"cache": item.get("cache") or data.get("cache")})
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"items[{index}]: {e.detail}")
+        if cache_mode == "off":
+            raise HTTPException(status_code=400, detail=f"items[{index}]: 預先合成的 cache 需為 text 或 segments")
+        cost = await tts_services[service].estimate_cost(text)
+        parsed.append({
+            "text": text,
+            "service": service,
+            "voice_config": voice_config,
+            "language": language,
+            "cache": cache_mode,
+            "estimated_cost_usd": cost.get("estimated_cost_usd", 0.0),
+        })
+    return parsed
+
+def _parse_prefetch_limit(data: dict, field: str, default: Optional[float], cast) -> Optional[float]:
+    """用量上限只能調低，不能超過環境變數設定的上限"""
+    value = data.get(field)
+    if value is None:
+        return default
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{field} 必須是數字")
+    if value <= 0:
+        raise HTTPException(status_code=400, detail=f"{field} 必須大於 0")
+    return min(value, default) if default is not None else value
+
+@app.post("/api/tts/prefetch")
+async def submit_prefetch(request: Request):
+    """
+    預先合成一批已知的腳本並寫入音頻快取 (不產生音頻文件)
+    立即返回 202，任務在 Gateway 閒置時以低優先順序依序執行，進度以 GET /api/tts/prefetch/{job_id} 查詢
+    """
+    data = await _parse_request_body(request)
+    tenant = _resolve_tenant(request)
+    if not audio_cache.enabled:
+        raise HTTPException(status_code=400, detail="音頻快取未啟用，無法預先合成")
+    
+    items = await _parse_prefetch_items(data)
+    max_characters = _parse_prefetch_limit(data, "max_characters", PREFETCH_MAX_CHARACTERS, int)
+    max_cost = _parse_prefetch_limit(data, "max_cost_usd", PREFETCH_MAX_COST, float)
+    start_at = data.get("start_at")
+    if start_at is not None and not isinstance(start_at, (int, float)):
+        raise HTTPException(status_code=400, detail="start_at 必須是 Unix 時間 (秒)")
+    
+    job = prefetch.submit(PrefetchJob(
+        tenant, items, max_characters, max_cost=max_cost, start_at=start_at, metadata=data.get("metadata")
+    ))
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "message": "已接受，將在閒置時預先合成並寫入音頻快取",
+            "job_id": job.id,
+            "status_url": f"/api/tts/prefetch/{job.id}",
+            **job.summary(),
+        }
+    )
+
+def _owned_prefetch_job(request: Request, job_id: str) -> PrefetchJob:
+    """只有送出任務的租戶可以查詢或取消 (其他租戶視為不存在)"""
+    tenant = _resolve_tenant(request)
+    job = prefetch.get(job_id)
+    if job is None or job.tenant.id != tenant.id:
+        raise HTTPException(status_code=404, detail="預先合成任務不存在")
+    return job
+
+@app.get("/api/tts/prefetch")
+async def prefetch_status(request: Request):
+    """預先合成的整體統計，以及呼叫端租戶自己的任務"""
+    tenant = _resolve_tenant(request)
+    summary = prefetch.summary()
+    current = prefetch.get(summary["current_job"]) if summary["current_job"] else None
+    if current is None or current.tenant.id != tenant.id:
+        summary["current_job"] = None
+    return {
+        **summary,
+        "idle_max_active": PREFETCH_IDLE_MAX_ACTIVE,
+        "job_list": [job.summary() for job in reversed(prefetch.jobs.values()) if job.tenant.id == tenant.id],
+    }
+
+@app.get("/api/tts/prefetch/{job_id}")
+async def get_prefetch_job(job_id: str, request: Request):
+    return _owned_prefetch_job(request, job_id).summary(include_items=True)
+
+@app.delete("/api/tts/prefetch/{job_id}")
+async def cancel_prefetch_job(job_id: str, request: Request):
+    """取消預先合成任務 (只限送出任務的租戶)，已寫入快取的結果保留"""
+    job = _owned_prefetch_job(request, job_id)
+    prefetch.cancel(job_id)
+    return {"success": True, "message": "已取消", **job.summary()}
+
+@app.get("/api/access-log")
+async def access_log_status(request: Request):
+    """存取日誌狀態：已寫入、取樣略過、丟棄與寫入失敗的筆數 (需管理權杖)"""
+    _require_admin(request)
+    return access_log.summary()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request):
+    """Prometheus 指標 (需管理權杖，抓取設定以 Bearer 權杖存取)"""
+    _require_admin(request)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/tts/services/{service_id}/info")
 async def get_service_info(service_id: str):
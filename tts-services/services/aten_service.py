@@ -13,6 +13,9 @@ import os
 from typing import Dict, Any, Optional, List
 import xml.etree.ElementTree as ET
 
+from services import deadline, timing
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+
 logger = logging.getLogger(__name__)
 
 class ATENService:
@@ -28,6 +31,7 @@ class ATENService:
         self.features = ["text_to_speech", "ssml_support", "voice_models", "streaming"]
         self.sample_rate = 22050
         self.is_initialized = False
+        self.price_per_1k_chars = get_price_per_1k_chars("aten", 0.02)  # 每 1K 字符價格 (USD)
         
         # API 配置
         self.api_token = None
@@ -80,6 +84,10 @@ class ATENService:
             "rate_limit": f"{self.rate_limit}/min",
         }
     
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        """估算成本 (按字符計費)"""
+        return estimate_char_cost(text, self.price_per_1k_chars)
+    
     async def get_info(self) -> Dict[str, Any]:
         """獲取服務信息"""
         return {
@@ -126,6 +134,30 @@ class ATENService:
             logger.error(f"載入聲優模型失敗: {e}")
             raise
     
+    async def list_voices(self) -> Dict[str, Any]:
+        """
+        音色目錄 (供統一音色索引使用)
+        每次刷新時重新向 API 載入聲優模型
+        """
+        if not self.api_token:
+            return {"voices": [], "authoritative": False, "voice_key": "voice_name"}
+        
+        await self._load_available_models()
+        self.is_initialized = True
+        
+        entries = []
+        for model in self.available_models:
+            language = model.get("language")
+            entries.append({
+                "id": model["model_id"],
+                "name": model.get("name") or model.get("model_name") or model["model_id"],
+                "languages": model.get("languages") or ([language] if language else self.languages),
+                "gender": model.get("gender"),
+                "tags": model.get("tags") or [],
+            })
+        
+        return {"voices": entries, "authoritative": True, "voice_key": "voice_name"}
+    
     async def get_available_voices(self, language: str = None) -> Dict[str, Any]:
         """獲取可用的音色列表"""
         try:
@@ -198,7 +230,8 @@ class ATENService:
             ssml = self._build_ssml(text, voice_name, voice_config, language)
             
             # 發送合成請求
-            synthesis_result = await self._synthesize_ssml(ssml, voice_config)
+            with timing.stage("submit"):
+                synthesis_result = await self._synthesize_ssml(ssml, voice_config)
             
             if not synthesis_result["success"]:
                 return synthesis_result
@@ -206,10 +239,12 @@ class ATENService:
             synthesis_id = synthesis_result["synthesis_id"]
             
             # 等待合成完成
-            audio_url = await self._wait_for_synthesis(synthesis_id)
+            with timing.stage("poll"):
+                audio_url = await self._wait_for_synthesis(synthesis_id)
             
             # 下載音頻文件
-            audio_data = await self._download_audio(audio_url)
+            with timing.stage("download"):
+                audio_data = await self._download_audio(audio_url)
             
             return {
                 "success": True,
@@ -305,7 +340,8 @@ class ATENService:
             if voice_config.get("use_custom_poly", False):
                 data["is_customized_poly_list_used"] = True
             
-            async with aiohttp.ClientSession() as session:
+            timeout = aiohttp.ClientTimeout(total=deadline.timeout(30, "ATEN 合成請求"))
+            async with aiohttp.ClientSession(timeout=timeout) as session:
                 async with session.post(url, headers=headers, json=data) as response:
                     if response.status == 200:
                         result = await response.json()
@@ -338,10 +374,13 @@ class ATENService:
                 "Authorization": self.api_token
             }
             
+            # 輪詢時間不超過請求截止時間
+            max_wait_time = deadline.timeout(max_wait_time, "ATEN 合成輪詢")
             start_time = time.time()
             
             while time.time() - start_time < max_wait_time:
-                async with aiohttp.ClientSession() as session:
+                timeout = aiohttp.ClientTimeout(total=deadline.timeout(30, "ATEN 合成輪詢"))
+                async with aiohttp.ClientSession(timeout=timeout) as session:
                     async with session.get(url, headers=headers) as response:
                         if response.status == 200:
                             result = await response.json()
@@ -362,7 +401,7 @@ class ATENService:
                             
                             elif status in ["Waiting", "Processing"]:
                                 logger.debug(f"合成中... 狀態: {status}")
-                                await asyncio.sleep(2)  # 等待2秒後重試
+                                await asyncio.sleep(deadline.timeout(2, "ATEN 合成輪詢"))  # 等待2秒後重試
                                 continue
                             
                             else:
@@ -371,9 +410,10 @@ class ATENService:
                         else:
                             error_text = await response.text()
                             logger.error(f"查詢合成狀態失敗: {response.status} - {error_text}")
-                            await asyncio.sleep(2)
+                            await asyncio.sleep(deadline.timeout(2, "ATEN 合成輪詢"))
             
-            raise Exception(f"合成超時 (超過 {max_wait_time} 秒)")
+            deadline.check("ATEN 合成輪詢")
+            raise Exception(f"合成超時 (超過 {max_wait_time:.0f} 秒)")
             
         except Exception as e:
             logger.error(f"等待合成完成失敗: {e}")
@@ -386,7 +426,8 @@ class ATENService:
                 "Authorization": self.api_token
             }
             
-            async with aiohttp.ClientSession() as session:
+            timeout = aiohttp.ClientTimeout(total=deadline.timeout(60, "ATEN 音頻下載"))
+            async with aiohttp.ClientSession(timeout=timeout) as session:
                 async with session.get(audio_url, headers=headers) as response:
                     if response.status == 200:
                         audio_data = await response.read()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+共用音頻解碼器
+各 TTS 服務以壓縮格式 (mp3 / flac / opus ...) 從上游下載音頻，
+統一在 Gateway 本地解碼為 16-bit PCM WAV
+"""
+
+import asyncio
+import io
+import logging
+import os
+import struct
+import wave
+from typing import AsyncIterator, Iterable, Optional
+
+from services import deadline, timing
+
+logger = logging.getLogger(__name__)
+
+# 可用於上游傳輸的音頻格式
+TRANSFER_FORMATS = ["wav", "mp3", "flac", "opus", "aac", "pcm"]
+
+
+def get_transfer_format(provider: str, default: str, supported: Iterable[str] = None) -> str:
+    """
+    讀取服務的上游傳輸格式設定
+
+    環境變數名稱為 {PROVIDER}_TRANSFER_FORMAT，例如 VOAI_TRANSFER_FORMAT=mp3
+    設定值不在服務支援的格式內時回退到預設值
+    """
+    supported = list(supported or TRANSFER_FORMATS)
+    env_name = f"{provider.upper()}_TRANSFER_FORMAT"
+    transfer_format = (os.getenv(env_name) or default).strip().lower()
+
+    if transfer_format not in supported:
+        logger.warning(f"⚠️ {env_name}={transfer_format} 不受支援 (可用: {supported})，改用 {default}")
+        transfer_format = default
+
+    return transfer_format
+
+
+def pcm_to_wav(pcm_data: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """將原始 PCM 數據封裝為 WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_data)
+    return buffer.getvalue()
+
+
+def wav_stream_header(sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """
+    串流輸出用的 WAV 檔頭
+    總長度未知，RIFF / data 長度欄位填入 0xFFFFFFFF，播放器會讀到串流結束為止
+    """
+    byte_rate = sample_rate * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate,
+                                 channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def _fix_wav_header(wav_data: bytes) -> bytes:
+    """
+    修正 ffmpeg 輸出到管道時未回填的 RIFF / data 長度欄位
+    """
+    if len(wav_data) < 12 or wav_data[:4] != b"RIFF" or wav_data[8:12] != b"WAVE":
+        return wav_data
+
+    data = bytearray(wav_data)
+    struct.pack_into("<I", data, 4, len(data) - 8)
+
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(data[offset:offset + 4])
+        if chunk_id == b"data":
+            struct.pack_into("<I", data, offset + 4, len(data) - offset - 8)
+            break
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    return bytes(data)
+
+
+async def decode_to_wav(
+    audio_data: bytes,
+    source_format: str,
+    sample_rate: Optional[int] = None,
+    channels: int = 1
+) -> bytes:
+    """
+    將上游回傳的音頻解碼為 16-bit PCM WAV
+
+    Args:
+        audio_data: 上游回傳的音頻數據
+        source_format: 來源格式 (wav, mp3, flac, opus, aac, pcm)
+        sample_rate: 輸出採樣率，pcm 來源時為必要參數；未指定則保留原始採樣率 (wav 來源直接返回)
+        channels: 輸出聲道數
+
+    Returns:
+        WAV 音頻數據
+    """
+    source_format = (source_format or "").lower()
+
+    if source_format == "wav":
+        return audio_data
+
+    if source_format == "pcm":
+        if not sample_rate:
+            raise ValueError("PCM 來源必須指定採樣率")
+        return pcm_to_wav(audio_data, sample_rate, channels)
+
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-map_metadata", "-1",
+        "-fflags", "+bitexact",
+        "-acodec", "pcm_s16le",  # 16-bit PCM
+        "-ac", str(channels),
+    ]
+    if sample_rate:
+        cmd += ["-ar", str(sample_rate)]
+    cmd += ["-f", "wav", "pipe:1"]
+
+    # 解碼時間同樣受請求截止時間限制，已逾時則不啟動 ffmpeg
+    decode_timeout = deadline.timeout(None, "音頻解碼")
+
+    with timing.stage("transcode"):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(audio_data), decode_timeout)
+        except asyncio.TimeoutError:
+            raise deadline.DeadlineExceeded("音頻解碼")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    if process.returncode != 0:
+        error_text = stderr.decode("utf-8", errors="ignore").strip()
+        logger.error(f"ffmpeg 解碼失敗: {error_text}")
+        raise Exception(f"音頻解碼失敗 ({source_format}): {error_text}")
+
+    wav_data = _fix_wav_header(stdout)
+    logger.info(f"成功解碼 {source_format.upper()} ({len(audio_data)} bytes) 到 WAV ({len(wav_data)} bytes)")
+    return wav_data
+
+
+async def decode_stream(
+    chunks: AsyncIterator[bytes],
+    source_format: str,
+    sample_rate: int,
+    channels: int = 1
+) -> AsyncIterator[bytes]:
+    """
+    將上游串流的音頻逐塊解碼為 16-bit PCM
+
+    pcm 來源直接透傳；壓縮格式交給常駐的 ffmpeg 管道，
+    一邊寫入上游數據一邊讀出解碼後的 PCM，不等待完整音頻
+    """
+    source_format = (source_format or "").lower()
+
+    if source_format == "pcm":
+        async for chunk in chunks:
+            if chunk:
+                yield chunk
+        return
+
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-fflags", "nobuffer",
+        "-probesize", "32",
+        "-analyzeduration", "0",
+        "-f", source_format,
+        "-i", "pipe:0",
+        "-acodec", "pcm_s16le",
+        "-ac", str(channels),
+        "-ar", str(sample_rate),
+        "-f", "s16le", "pipe:1"
+    ]
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            try:
+                process.stdin.close()
+            except Exception:
+                pass
+
+    feeder = asyncio.create_task(feed())
+
+    try:
+        while True:
+            read_timeout = deadline.timeout(None, "音頻串流解碼")
+            pcm = await asyncio.wait_for(process.stdout.read(8192), read_timeout)
+            if not pcm:
+                break
+            yield pcm
+
+        # 上游讀取失敗時在這裡拋出
+        await feeder
+
+        if await process.wait() != 0:
+            error_text = (await process.stderr.read()).decode("utf-8", errors="ignore").strip()
+            raise Exception(f"音頻串流解碼失敗 ({source_format}): {error_text}")
+
+    except asyncio.TimeoutError:
+        raise deadline.DeadlineExceeded("音頻串流解碼")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
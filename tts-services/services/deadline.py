@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+請求截止時間
+Gateway 在收到請求時設定截止時間 (contextvar)，各服務的連線逾時、輪詢迴圈與
+音頻解碼都以剩餘時間為上限，呼叫端放棄的請求不會繼續佔用上游資源
+"""
+
+import contextvars
+import time
+from typing import Any, Dict, Mapping, Optional
+
+# 截止時間，time.monotonic() 時間軸；None 表示未設定
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """請求已超過截止時間"""
+
+    def __init__(self, stage: str = ""):
+        self.stage = stage
+        super().__init__(f"請求已超過截止時間{f' ({stage})' if stage else ''}")
+
+
+def parse_deadline(headers: Mapping[str, str], data: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """
+    從請求解析截止時間，返回 monotonic 時間
+
+    支援 (取最早者):
+        - X-Request-Deadline: 絕對時間 (Unix 時間戳，秒或毫秒)
+        - X-Request-Timeout: 相對逾時 (秒)
+        - 請求體 timeout 欄位: 相對逾時 (秒)
+    """
+    now_wall = time.time()
+    now = time.monotonic()
+    candidates = []
+
+    value = headers.get("x-request-deadline")
+    if value:
+        timestamp = float(value)
+        if timestamp > 1e12:  # 毫秒
+            timestamp /= 1000
+        candidates.append(now + (timestamp - now_wall))
+
+    value = headers.get("x-request-timeout")
+    if value:
+        candidates.append(now + float(value))
+
+    if data and data.get("timeout") is not None:
+        candidates.append(now + float(data["timeout"]))
+
+    return min(candidates) if candidates else None
+
+
+def set_deadline(deadline: Optional[float]) -> contextvars.Token:
+    """設定目前請求的截止時間"""
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: contextvars.Token):
+    _deadline.reset(token)
+
+
+def get_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """剩餘秒數，未設定截止時間時返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(stage: str = ""):
+    """已超過截止時間時拋出 DeadlineExceeded"""
+    if expired():
+        raise DeadlineExceeded(stage)
+
+
+def timeout(default: Optional[float] = None, stage: str = "") -> Optional[float]:
+    """
+    以剩餘時間限制逾時設定
+
+    Args:
+        default: 原本的逾時 (秒)，None 表示不限
+        stage: 階段名稱，用於錯誤訊息
+
+    Returns:
+        min(default, 剩餘時間)；兩者皆無時返回 None
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded(stage)
+    return left if default is None else min(default, left)
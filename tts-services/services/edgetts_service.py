@@ -9,9 +9,12 @@ import edge_tts
 import io
 import logging
 from typing import Dict, Any
-import tempfile
 import os
 
+from services import deadline, timing
+from services.audio_decoder import decode_to_wav
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+
 logger = logging.getLogger(__name__)
 
 class TTSService1:
@@ -26,6 +29,8 @@ class TTSService1:
         self.languages = ["zh", "en", "ja", "ko", "es", "fr", "de"]
         self.features = ["text_to_speech", "multi_language", "multi_voice", "free"]
         self.is_initialized = False
+        self.sample_rate = 44100  # 轉換後 WAV 的採樣率 (上游 MP3 為 24kHz，解碼時重採樣)
+        self.price_per_1k_chars = get_price_per_1k_chars("edgetts", 0.0)  # 每 1K 字符價格 (USD)，免費服務
         
         # EdgeTTS 支援的中文音色
         self.zh_voices = [
@@ -52,6 +57,12 @@ class TTSService1:
         try:
             logger.info(f"正在初始化 {self.name}...")
             
+            # 可指向本地測試服務 (例如 benchmarks/stubs.py)
+            wss_url = os.getenv("EDGE_TTS_WSS_URL")
+            if wss_url:
+                edge_tts.communicate.WSS_URL = wss_url
+                logger.info(f"   WebSocket URL: {wss_url}")
+            
             # 簡化初始化，不進行實際測試連接
             # 避免在啟動時觸發 403 錯誤
             self.is_initialized = True
@@ -59,8 +70,8 @@ class TTSService1:
                 
         except Exception as e:
             logger.error(f"❌ {self.name} 初始化失敗: {e}")
-            # 即使出錯也標記為已初始化，讓服務能正常啟動
-            self.is_initialized = True
+            # 標記為未初始化，健康檢查如實回報；服務啟動不受影響
+            self.is_initialized = False
     
     async def health_check(self) -> Dict[str, Any]:
         """健康檢查"""
@@ -72,6 +83,10 @@ class TTSService1:
             "supported_voices": len(self.zh_voices) + len(self.en_voices),
         }
     
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        """估算成本 (按字符計費)"""
+        return estimate_char_cost(text, self.price_per_1k_chars)
+    
     async def get_info(self) -> Dict[str, Any]:
         """獲取服務信息"""
         return {
@@ -140,7 +155,7 @@ class TTSService1:
                 "success": True,
                 "audio_data": audio_data,
                 "duration": len(audio_data) / 16000,  # 估算時長
-                "sample_rate": 24000,  # EdgeTTS 默認採樣率
+                "sample_rate": self.sample_rate if format.lower() == "wav" else 24000,  # MP3 保持 EdgeTTS 默認採樣率
                 "format": format,
                 "service": "edgetts",
                 "text_length": len(text),
@@ -174,14 +189,30 @@ class TTSService1:
                 ssml_text = text
                 logger.info("使用純文本生成語音")
             
-            # 創建 EdgeTTS 通信對象
-            communicate = edge_tts.Communicate(ssml_text, voice)
+            # 創建 EdgeTTS 通信對象 (連線與讀取逾時不超過請求截止時間)
+            communicate = edge_tts.Communicate(
+                ssml_text,
+                voice,
+                connect_timeout=deadline.timeout(10, "EdgeTTS 連線"),
+                receive_timeout=deadline.timeout(60, "EdgeTTS 讀取")
+            )
             
             # 收集音頻數據
-            audio_data = b""
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
+            async def collect() -> bytes:
+                audio = b""
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        audio += chunk["data"]
+                return audio
+            
+            collect_timeout = deadline.timeout(None, "EdgeTTS 合成")
+            try:
+                # EdgeTTS 以 WebSocket 串流返回音頻，連線與接收都計入下載
+                with timing.stage("download"):
+                    audio_data = await asyncio.wait_for(collect(), collect_timeout)
+            except asyncio.TimeoutError:
+                deadline.check("EdgeTTS 合成")
+                raise
             
             if len(audio_data) == 0:
                 raise Exception("EdgeTTS 返回空音頻數據")
@@ -202,47 +233,8 @@ class TTSService1:
         將 MP3 音頻數據轉換為 WAV 格式
         """
         try:
-            import tempfile
-            import subprocess
-            
-            # 創建臨時檔案
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as mp3_file:
-                mp3_file.write(mp3_data)
-                mp3_path = mp3_file.name
-            
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file:
-                wav_path = wav_file.name
-            
-            try:
-                # 使用 ffmpeg 轉換格式
-                cmd = [
-                    "ffmpeg", "-i", mp3_path,
-                    "-acodec", "pcm_s16le",  # 16-bit PCM
-                    "-ar", "44100",          # 44.1kHz 採樣率
-                    "-ac", "1",              # 單聲道
-                    "-y",                    # 覆蓋輸出檔案
-                    wav_path
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    logger.error(f"ffmpeg 轉換失敗: {result.stderr}")
-                    raise Exception(f"音頻格式轉換失敗: {result.stderr}")
-                
-                # 讀取轉換後的 WAV 檔案
-                with open(wav_path, "rb") as f:
-                    wav_data = f.read()
-                
-                logger.info(f"成功轉換 MP3 ({len(mp3_data)} bytes) 到 WAV ({len(wav_data)} bytes)")
-                return wav_data
-                
-            finally:
-                # 清理臨時檔案
-                try:
-                    os.unlink(mp3_path)
-                    os.unlink(wav_path)
-                except:
-                    pass
+            # 使用共用解碼器，透過管道交給 ffmpeg，不落地臨時檔案
+            return await decode_to_wav(mp3_data, "mp3", sample_rate=self.sample_rate)
                     
         except Exception as e:
             logger.error(f"MP3 到 WAV 轉換失敗: {e}")
@@ -250,6 +242,34 @@ class TTSService1:
             logger.warning("轉換失敗，返回原始 MP3 數據")
             return mp3_data
     
+    async def list_voices(self) -> Dict[str, Any]:
+        """
+        音色目錄 (供統一音色索引使用)
+        優先取得 EdgeTTS 線上完整音色列表，失敗時退回內建列表
+        """
+        try:
+            voices = await edge_tts.list_voices()
+            entries = []
+            for voice in voices:
+                voice_tag = voice.get("VoiceTag") or {}
+                entries.append({
+                    "id": voice["ShortName"],
+                    "name": voice.get("FriendlyName") or voice["ShortName"],
+                    "languages": [voice.get("Locale")],
+                    "gender": voice.get("Gender"),
+                    "styles": [],
+                    "tags": voice_tag.get("ContentCategories", []) + voice_tag.get("VoicePersonalities", []),
+                })
+            return {"voices": entries, "authoritative": True, "voice_key": "voice"}
+            
+        except Exception as e:
+            logger.warning(f"獲取 EdgeTTS 線上音色列表失敗，使用內建列表: {e}")
+            entries = [
+                {"id": voice, "name": voice, "languages": ["-".join(voice.split("-")[:2])]}
+                for voice in self.zh_voices + self.en_voices
+            ]
+            return {"voices": entries, "authoritative": False, "voice_key": "voice"}
+    
     async def get_available_voices(self, language: str = None) -> Dict[str, Any]:
         """
         獲取可用的音色列表
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+TTS Service 5 - Fish Speech 實現
+串接 docker-compose 中的本地 Fish Speech 服務 (tts-server)，支援參考音頻聲音克隆
+"""
+
+import asyncio
+import aiohttp
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+
+from services import deadline, timing
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+
+logger = logging.getLogger(__name__)
+
+class FishSpeechService:
+    """
+    TTS 服務 5 - Fish Speech
+    本地 GPU 語音克隆服務，參考音頻依內容雜湊快取，每段參考音頻只預處理一次
+    """
+
+    def __init__(self):
+        self.name = "Fish Speech 語音克隆"
+        self.description = "本地 Fish Speech 語音合成服務，支援以參考音頻克隆聲音"
+        self.languages = ["zh", "en", "ja"]
+        self.features = ["text_to_speech", "voice_cloning", "local_gpu"]
+        self.sample_rate = 44100
+        self.is_initialized = False
+        self.price_per_1k_chars = get_price_per_1k_chars("fish_speech", 0.0)  # 每 1K 字符價格 (USD)，本地 GPU 服務
+
+        # 服務配置 (從環境變數讀取)
+        self.base_url = "http://tts-server:8080"
+        self.max_concurrency = 1  # GPU 服務同時處理的請求數
+        self.local_data_dir = "/app/data"  # Gateway 看到的共享資料目錄
+        self.remote_data_dir = "/code/data"  # Fish Speech 容器看到的共享資料目錄
+        self.reference_cache_path = "/app/data/temp/fish_references.json"
+
+        # 連線池與併發控制 (於 initialize 中建立)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+        # 參考音頻快取: 內容雜湊 -> 預處理結果
+        self.reference_cache: Dict[str, Dict[str, Any]] = {}
+        # 文件雜湊快取: 路徑 -> (mtime, size, 內容雜湊)，避免重複讀取大檔案
+        self._file_hashes: Dict[str, Tuple[float, int, str]] = {}
+        # 同一參考音頻的並發預處理共用同一個任務
+        self._pending_references: Dict[str, asyncio.Future] = {}
+
+        # 推理參數預設值
+        self.default_params = {
+            "topP": 0.7,
+            "max_new_tokens": 1024,
+            "chunk_length": 100,
+            "repetition_penalty": 1.2,
+            "temperature": 0.7,
+        }
+
+    async def initialize(self):
+        """初始化 Fish Speech 服務"""
+        try:
+            logger.info(f"正在初始化 {self.name}...")
+
+            self.base_url = os.getenv("FISH_SPEECH_URL", self.base_url).rstrip("/")
+            self.max_concurrency = max(1, int(os.getenv("FISH_SPEECH_MAX_CONCURRENCY", self.max_concurrency)))
+            self.local_data_dir = os.getenv("FISH_SPEECH_LOCAL_DATA_DIR", self.local_data_dir)
+            self.remote_data_dir = os.getenv("FISH_SPEECH_DATA_DIR", self.remote_data_dir)
+            self.reference_cache_path = os.getenv("FISH_SPEECH_REFERENCE_CACHE", self.reference_cache_path)
+
+            # 長連線連線池，連線數與 GPU 併發上限一致
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency * 2,
+                keepalive_timeout=60
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=300, sock_connect=10)
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            self._load_reference_cache()
+
+            logger.info(f"🔧 配置信息:")
+            logger.info(f"   Base URL: {self.base_url}")
+            logger.info(f"   Max Concurrency: {self.max_concurrency}")
+            logger.info(f"   Cached References: {len(self.reference_cache)}")
+
+            # 簡化初始化，不進行實際測試連接
+            # 避免 GPU 服務較晚啟動時導致 Gateway 無法啟動
+            self.is_initialized = True
+            logger.info(f"✅ {self.name} 初始化完成")
+
+        except Exception as e:
+            logger.error(f"❌ {self.name} 初始化失敗: {e}")
+            self.is_initialized = False
+
+    async def close(self):
+        """關閉連線池"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def health_check(self) -> Dict[str, Any]:
+        """健康檢查"""
+        return {
+            "status": "healthy" if self.is_initialized else "unhealthy",
+            "name": self.name,
+            "initialized": self.is_initialized,
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "cached_references": len(self.reference_cache),
+        }
+
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        """估算成本 (按字符計費)"""
+        return estimate_char_cost(text, self.price_per_1k_chars)
+
+    async def get_info(self) -> Dict[str, Any]:
+        """獲取服務信息"""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "languages": self.languages,
+            "features": self.features,
+            "sample_rate": self.sample_rate,
+            "version": "1.0.0",
+            "model_type": "Fish Speech",
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def generate_speech(
+        self,
+        text: str,
+        voice_config: Dict[str, Any] = None,
+        format: str = "wav",
+        language: str = "zh"
+    ) -> Dict[str, Any]:
+        """
+        生成語音
+
+        Args:
+            text: 要合成的文本
+            voice_config: 語音配置
+                - reference_audio: 參考音頻路徑 (共享資料目錄下，如 /data/models/xxx.wav)
+                - trainingFiles: 聲音模型的訓練文件列表，未指定 reference_audio 時使用第一個
+                - reference_text: 參考音頻文字稿 (可選，未提供時使用服務端 ASR 結果)
+                - temperature / topP / repetition_penalty / max_new_tokens / chunk_length: 推理參數
+            format: 音頻格式 (wav)
+            language: 語言 (zh, en, ja)
+
+        Returns:
+            包含音頻數據和元信息的字典
+        """
+        try:
+            if not self.is_initialized:
+                raise Exception("服務尚未初始化")
+
+            logger.info(f"Fish Speech 生成語音: {text[:50]}... (語言: {language})")
+
+            # 解析語音配置
+            if voice_config is None:
+                voice_config = {}
+
+            reference = None
+            reference_path = self._resolve_reference_path(voice_config)
+            if reference_path:
+                reference = await self._get_reference(reference_path, voice_config.get("reference_text"), language)
+            elif voice_config.get("voice") not in (None, "", "default"):
+                # Fish Speech 只能以參考音頻克隆聲音，音色名稱本身無效
+                logger.warning(f"⚠️ Fish Speech 未提供參考音頻 (voice={voice_config.get('voice')})，使用預設聲音")
+
+            audio_data = await self._invoke(text, reference, voice_config)
+
+            return {
+                "success": True,
+                "audio_data": audio_data,
+                "duration": len(audio_data) / (self.sample_rate * 2),  # 估算時長
+                "sample_rate": self.sample_rate,
+                "format": format,
+                "service": "fishspeech",
+                "text_length": len(text),
+                "language": language,
+                "reference_hash": reference["hash"] if reference else None,
+            }
+
+        except Exception as e:
+            logger.error(f"Fish Speech 語音生成失敗: {e}")
+            return {
+                "success": False,
+                "message": f"語音生成失敗: {str(e)}",
+                "service": "fishspeech"
+            }
+
+    def _resolve_reference_path(self, voice_config: Dict[str, Any]) -> Optional[str]:
+        """
+        將語音配置中的參考音頻轉換為 Gateway 本地路徑
+        參考音頻只能位於共享資料目錄內 (解析符號連結與 .. 後檢查)
+
+        Raises:
+            ValueError: 路徑在共享資料目錄之外
+        """
+        reference = voice_config.get("reference_audio")
+        if not reference:
+            training_files = voice_config.get("trainingFiles") or []
+            if training_files:
+                # 聲音模型的訓練文件存放於 data/models
+                reference = os.path.join("models", training_files[0])
+
+        if not reference:
+            return None
+
+        reference = str(reference)
+        if reference.startswith("/data/"):
+            reference = os.path.join(self.local_data_dir, reference[len("/data/"):])
+        elif not os.path.isabs(reference):
+            reference = os.path.join(self.local_data_dir, reference)
+
+        data_dir = os.path.realpath(self.local_data_dir)
+        resolved = os.path.realpath(reference)
+        if os.path.commonpath([resolved, data_dir]) != data_dir:
+            raise ValueError("參考音頻必須位於共享資料目錄內")
+        return resolved
+
+    def validate_voice_config(self, voice_config: Dict[str, Any]) -> Optional[str]:
+        """送出前檢查語音配置，返回錯誤訊息 (Gateway 以 400 回應)"""
+        try:
+            self._resolve_reference_path(voice_config or {})
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def _to_remote_path(self, local_path: str) -> str:
+        """將 Gateway 本地路徑轉換為 Fish Speech 容器內的路徑"""
+        data_dir = os.path.realpath(self.local_data_dir)
+        if local_path.startswith(data_dir):
+            return self.remote_data_dir + local_path[len(data_dir):]
+        return local_path
+
+    def _hash_file(self, path: str) -> str:
+        """計算文件內容雜湊，文件未變更時直接返回快取值"""
+        stat = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+
+        content_hash = sha256.hexdigest()
+        self._file_hashes[path] = (stat.st_mtime, stat.st_size, content_hash)
+        return content_hash
+
+    async def _get_reference(self, reference_path: str, reference_text: Optional[str], language: str) -> Dict[str, Any]:
+        """
+        取得預處理後的參考音頻
+        依內容雜湊快取，同一段參考音頻只送交服務端預處理一次
+        """
+        if not os.path.exists(reference_path):
+            raise Exception(f"參考音頻不存在: {os.path.relpath(reference_path, os.path.realpath(self.local_data_dir))}")
+
+        content_hash = await asyncio.to_thread(self._hash_file, reference_path)
+
+        reference = self.reference_cache.get(content_hash)
+        if reference is None:
+            pending = self._pending_references.get(content_hash)
+            if pending is None:
+                pending = asyncio.ensure_future(self._prepare_reference(content_hash, reference_path, language))
+                self._pending_references[content_hash] = pending
+                pending.add_done_callback(lambda _: self._pending_references.pop(content_hash, None))
+            reference = await asyncio.shield(pending)
+        else:
+            logger.info(f"♻️ 使用快取的參考音頻: {content_hash[:12]}")
+
+        if reference_text:
+            # 呼叫端提供的文字稿優先於 ASR 結果
+            reference = {**reference, "reference_text": reference_text}
+
+        return reference
+
+    async def _prepare_reference(self, content_hash: str, reference_path: str, language: str) -> Dict[str, Any]:
+        """送交服務端預處理參考音頻 (格式轉換與 ASR)，結果寫入快取"""
+        # 結果由所有等待者共用並寫入快取，不受發起請求的截止時間限制
+        deadline.set_deadline(None)
+        logger.info(f"📤 預處理參考音頻: {reference_path} ({content_hash[:12]})")
+
+        data = {
+            "format": os.path.splitext(reference_path)[1] or ".wav",
+            "reference_audio": self._to_remote_path(reference_path),
+            "lang": language,
+        }
+
+        async with self.semaphore:
+            async with self.session.post(f"{self.base_url}/v1/preprocess_and_tran", json=data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"參考音頻預處理失敗: {response.status} - {error_text}")
+                result = await response.json(content_type=None)
+
+        # 兼容回應包在 data 欄位內的格式
+        if isinstance(result.get("data"), dict):
+            result = result["data"]
+
+        reference = {
+            "hash": content_hash,
+            "speaker": str(uuid.UUID(content_hash[:32])),
+            "reference_audio": result.get("asr_format_audio_url") or data["reference_audio"],
+            "reference_text": result.get("reference_audio_text", ""),
+            "created_at": time.time(),
+        }
+
+        self.reference_cache[content_hash] = reference
+        await asyncio.to_thread(self._save_reference_cache)
+
+        logger.info(f"✅ 參考音頻預處理完成: {content_hash[:12]}")
+        return reference
+
+    async def _invoke(self, text: str, reference: Optional[Dict[str, Any]], voice_config: Dict[str, Any]) -> bytes:
+        """調用 Fish Speech 合成接口"""
+        data = {
+            "text": text,
+            "format": "wav",
+            "need_asr": False,
+            "streaming": False,
+            "is_fixed_seed": 0,
+            "is_norm": 0,
+        }
+        for key, default in self.default_params.items():
+            data[key] = voice_config.get(key, default)
+
+        if reference:
+            data["speaker"] = reference["speaker"]
+            data["reference_audio"] = reference["reference_audio"]
+            data["reference_text"] = reference["reference_text"]
+        else:
+            data["speaker"] = str(uuid.uuid4())
+
+        # 排隊等待 GPU 的時間同樣受請求截止時間限制
+        queue_timeout = deadline.timeout(None, "Fish Speech 排隊")
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), queue_timeout)
+        except asyncio.TimeoutError:
+            raise deadline.DeadlineExceeded("Fish Speech 排隊")
+
+        try:
+            timeout = aiohttp.ClientTimeout(total=deadline.timeout(300, "Fish Speech 合成"), sock_connect=10)
+            submitted = time.monotonic()
+            async with self.session.post(f"{self.base_url}/v1/invoke", json=data, timeout=timeout) as response:
+                timing.record("submit", time.monotonic() - submitted)
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"Fish Speech 合成失敗: {response.status} - {error_text}")
+
+                with timing.stage("download"):
+                    audio_data = await response.read()
+        finally:
+            self.semaphore.release()
+
+        if not audio_data:
+            raise Exception("Fish Speech 返回空音頻數據")
+
+        logger.info(f"✅ Fish Speech 合成完成，音頻大小: {len(audio_data)} bytes")
+        return audio_data
+
+    def _load_reference_cache(self):
+        """從磁碟載入參考音頻快取"""
+        try:
+            if os.path.exists(self.reference_cache_path):
+                with open(self.reference_cache_path, "r", encoding="utf-8") as f:
+                    self.reference_cache = json.load(f)
+        except Exception as e:
+            logger.warning(f"載入參考音頻快取失敗: {e}")
+            self.reference_cache = {}
+
+    def _save_reference_cache(self):
+        """將參考音頻快取寫回磁碟"""
+        try:
+            os.makedirs(os.path.dirname(self.reference_cache_path), exist_ok=True)
+            tmp_path = f"{self.reference_cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.reference_cache, f, ensure_ascii=False)
+            os.replace(tmp_path, self.reference_cache_path)
+        except Exception as e:
+            logger.warning(f"保存參考音頻快取失敗: {e}")
+
+# 為了與其他服務保持一致的命名
+TTSService5 = FishSpeechService
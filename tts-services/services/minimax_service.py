@@ -5,12 +5,16 @@ MiniMax 的語音合成服務接口
 """
 
 import asyncio
-import numpy as np
-import soundfile as sf
-import io
 import logging
+import time
+import json
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Tuple
+
+from services import deadline, timing
+from services.audio_decoder import decode_stream, decode_to_wav, get_transfer_format, pcm_to_wav
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+from services.simulation_audio import iter_simulation_pcm, pcm_blocks_to_wav
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +31,14 @@ class TTSService2:
         self.features = ["text_to_speech", "high_quality", "commercial"]
         self.sample_rate = 24000
         self.is_initialized = False
+        self.price_per_1k_chars = get_price_per_1k_chars("minimax", 0.05)  # 每 1K 字符價格 (USD)
         self.api_key = None  # 需要設定 API Key
         self.group_id = None  # 需要設定 Group ID
         self.base_url = None  # 從環境變數讀取
         self.model = None  # 從環境變數讀取
+        self.api_sample_rate = 16000  # 上游合成採樣率
+        self.transfer_format = "mp3"  # 上游傳輸格式，本地解碼為 WAV
+        self.response_mode = "hex"  # 回應模式: hex (內嵌音頻), stream (SSE 串流), url (下載地址)
         
         # MiniMax 支援的音色 (友好顯示名稱)
         self.voices = {
@@ -57,10 +65,17 @@ class TTSService2:
             self.group_id = os.getenv("MINIMAX_GROUP_ID")
             self.base_url = os.getenv("MINIMAX_BASE_URL", "https://api.minimaxi.chat/v1/t2a_v2")
             self.model = os.getenv("MINIMAX_MODEL", "speech-02-turbo")
+            self.transfer_format = get_transfer_format("minimax", "mp3", ["mp3", "flac", "pcm", "wav"])
+            self.response_mode = os.getenv("MINIMAX_RESPONSE_MODE", "hex").lower()
+            if self.response_mode not in ("hex", "stream", "url"):
+                logger.warning(f"⚠️ MINIMAX_RESPONSE_MODE={self.response_mode} 不受支援，改用 hex")
+                self.response_mode = "hex"
             
             logger.info(f"🔧 配置信息:")
             logger.info(f"   Base URL: {self.base_url}")
             logger.info(f"   Model: {self.model}")
+            logger.info(f"   Transfer Format: {self.transfer_format}")
+            logger.info(f"   Response Mode: {self.response_mode}")
             logger.info(f"   API Key: {'已設定' if self.api_key else '未設定'}")
             logger.info(f"   Group ID: {'已設定' if self.group_id else '未設定'}")
             
@@ -79,6 +94,16 @@ class TTSService2:
             # 即使失敗也標記為已初始化，使用模擬模式
             self.is_initialized = True
     
+    @property
+    def supports_streaming(self) -> bool:
+        """是否可使用 generate_speech_stream (模擬模式逐塊產生模擬音頻)"""
+        return self.is_initialized
+    
+    @property
+    def stream_sample_rate(self) -> int:
+        """串流輸出的 PCM 採樣率"""
+        return self.api_sample_rate
+    
     async def health_check(self) -> Dict[str, Any]:
         """健康檢查"""
         return {
@@ -90,6 +115,10 @@ class TTSService2:
             "mode": "real" if self.api_key else "simulation",
         }
     
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        """估算成本 (按字符計費)"""
+        return estimate_char_cost(text, self.price_per_1k_chars)
+    
     async def get_info(self) -> Dict[str, Any]:
         """獲取服務信息"""
         return {
@@ -137,26 +166,17 @@ class TTSService2:
             logger.info(f"MiniMax TTS 生成語音: {text[:50]}... (語言: {language})")
             
             # 解析語音配置
-            if voice_config is None:
-                voice_config = {}
-            
-            voice_id = voice_config.get("voice_id")
-            if not voice_id:
-                # 選擇默認音色
-                default_voices = self.voices.get(language, self.voices["zh"])
-                voice_id = default_voices[0]["id"]
-            
-            speed = voice_config.get("speed", 1.0)
-            pitch = voice_config.get("pitch", 0)
+            voice_id, speed, pitch = self._resolve_voice_config(voice_config, language)
             
             if self.api_key:
-                # 實際調用 MiniMax API
-                audio_data = await self._call_minimax_api(
+                # 實際調用 MiniMax API (失敗時回退到模擬音頻，mode 為 simulation)
+                audio_data, mode = await self._call_minimax_api(
                     text, voice_id, speed, pitch, language, emotion, volume
                 )
             else:
                 # 模擬模式
                 audio_data = await self._generate_simulation_audio(text, language, emotion, volume)
+                mode = "simulation"
             
             return {
                 "success": True,
@@ -172,7 +192,7 @@ class TTSService2:
                 "pitch": pitch,
                 "emotion": emotion,
                 "volume": volume,
-                "mode": "real" if self.api_key else "simulation"
+                "mode": mode
             }
             
         except Exception as e:
@@ -183,77 +203,128 @@ class TTSService2:
                 "service": "minimax"
             }
     
+    def _resolve_voice_config(self, voice_config: Dict[str, Any], language: str):
+        """解析語音配置，返回 (voice_id, speed, pitch)"""
+        if voice_config is None:
+            voice_config = {}
+        
+        voice_id = voice_config.get("voice_id")
+        if not voice_id:
+            # 選擇默認音色
+            default_voices = self.voices.get(language, self.voices["zh"])
+            voice_id = default_voices[0]["id"]
+        
+        speed = voice_config.get("speed", 1.0)
+        pitch = voice_config.get("pitch", 0)
+        
+        return voice_id, speed, pitch
+    
     async def _test_api_connection(self):
         """測試 API 連接"""
         # 這裡應該實現實際的 API 測試
         # 暫時跳過，因為這只是示例
         pass
     
-    async def _call_minimax_api(self, text: str, voice_id: str, speed: float, pitch: int, language: str, emotion: str, volume: float) -> bytes:
+    def _build_request_data(self, text: str, voice_id: str, speed: float, pitch: int, emotion: str, volume: float, stream: bool = False) -> Dict[str, Any]:
+        """構建 MiniMax API v2 (t2a_v2) 請求參數"""
+        # 串流模式不支援 wav，改用 pcm 直接透傳
+        audio_format = self.transfer_format
+        if stream and audio_format == "wav":
+            audio_format = "pcm"
+        
+        data = {
+            "model": self.model,
+            "text": text,
+            "voice_setting": {
+                "voice_id": voice_id,
+                "speed": speed,
+                "vol": volume,
+                "pitch": pitch,
+                "emotion": emotion
+            },
+            "audio_setting": {
+                "sample_rate": self.api_sample_rate,
+                "bitrate": 128000,
+                "format": audio_format,
+                "channel": 1
+            },
+            "stream": stream,
+            "group_id": self.group_id
+        }
+        
+        if stream:
+            # 結束事件不再重複回傳完整音頻
+            data["stream_options"] = {"exclude_aggregated_audio": True}
+        else:
+            # hex: 音頻直接內嵌在回應中；url: 回應音頻下載地址
+            data["output_format"] = "url" if self.response_mode == "url" else "hex"
+        
+        return data
+    
+    async def _call_minimax_api(self, text: str, voice_id: str, speed: float, pitch: int, language: str, emotion: str, volume: float) -> Tuple[bytes, str]:
         """
         調用 MiniMax API v2 (t2a_v2)
-        使用正確的 API 格式
+        依 response_mode 使用內嵌 hex、SSE 串流或下載 URL 取得音頻
+
+        Returns:
+            (WAV 音頻, 模式)，API 失敗回退到模擬音頻時模式為 simulation，否則為 real
         """
         try:
+            if self.response_mode == "stream":
+                # 串流模式：收集所有 PCM 片段後封裝為 WAV
+                pcm_chunks = []
+                async for chunk in self._stream_minimax_api(text, voice_id, speed, pitch, emotion, volume):
+                    pcm_chunks.append(chunk)
+                return pcm_to_wav(b"".join(pcm_chunks), self.api_sample_rate), "real"
+            
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
             
-            # 正確的 MiniMax API v2 格式
-            data = {
-                "model": self.model,
-                "text": text,
-                "voice_setting": {
-                    "voice_id": voice_id,
-                    "speed": speed,
-                    "vol": volume,
-                    "pitch": pitch,
-                    "emotion": emotion
-                },
-                "audio_setting": {
-                    "sample_rate": 16000,
-                    "bitrate": 128000,
-                    "format": "wav",
-                    "channel": 1
-                },
-                "stream": False,
-                "output_format": "url",
-                "group_id": self.group_id
-            }
+            data = self._build_request_data(text, voice_id, speed, pitch, emotion, volume)
             
-            logger.info(f"🚀 調用 MiniMax API v2: {self.base_url}")
+            logger.info(f"🚀 調用 MiniMax API v2: {self.base_url} (mode={self.response_mode})")
             logger.info(f"📝 請求參數: model={self.model}, voice={voice_id}, emotion={emotion}, speed={speed}, vol={volume}, pitch={pitch}")
             
             # 實際調用 API
             import aiohttp
             async with aiohttp.ClientSession() as session:
+                submitted = time.monotonic()
                 async with session.post(
                     self.base_url,
                     headers=headers,
                     json=data,
-                    timeout=aiohttp.ClientTimeout(total=30)
+                    timeout=aiohttp.ClientTimeout(total=deadline.timeout(30, "MiniMax API"))
                 ) as response:
                     if response.status == 200:
                         json_data = await response.json()
-                        logger.info(f"📄 收到 MiniMax 回應: {json_data}")
+                        timing.record("submit", time.monotonic() - submitted)
+                        logger.info(f"📄 收到 MiniMax 回應: trace_id={json_data.get('trace_id')}, extra_info={json_data.get('extra_info')}")
                         
                         # 檢查回應格式
                         if json_data.get("base_resp", {}).get("status_code") == 0:
                             # 成功回應
-                            audio_url = json_data.get("data", {}).get("audio")
-                            if audio_url:
+                            audio = json_data.get("data", {}).get("audio")
+                            if audio and self.response_mode == "url":
                                 # 下載音頻文件
-                                logger.info(f"📥 下載音頻文件: {audio_url}")
-                                async with session.get(audio_url) as audio_response:
+                                logger.info(f"📥 下載音頻文件: {audio}")
+                                downloading = time.monotonic()
+                                async with session.get(audio) as audio_response:
                                     if audio_response.status == 200:
                                         audio_data = await audio_response.read()
-                                        logger.info(f"✅ 音頻下載成功，大小: {len(audio_data)} bytes")
-                                        return audio_data
+                                        timing.record("download", time.monotonic() - downloading)
+                                        logger.info(f"✅ 音頻下載成功，大小: {len(audio_data)} bytes ({self.transfer_format})")
+                                        return await decode_to_wav(audio_data, self.transfer_format, self.api_sample_rate), "real"
                                     else:
                                         logger.error(f"❌ 音頻下載失敗: {audio_response.status}")
+                            elif audio:
+                                # 內嵌 hex 音頻，省去下載往返
+                                audio_data = bytes.fromhex(audio)
+                                logger.info(f"✅ 收到內嵌音頻，大小: {len(audio_data)} bytes ({self.transfer_format})")
+                                return await decode_to_wav(audio_data, self.transfer_format, self.api_sample_rate), "real"
                             else:
-                                logger.error("❌ 回應中沒有音頻 URL")
+                                logger.error("❌ 回應中沒有音頻數據")
                         else:
                             error_code = json_data.get("base_resp", {}).get("status_code")
                             error_msg = json_data.get("base_resp", {}).get("status_msg", "未知錯誤")
@@ -265,31 +336,121 @@ class TTSService2:
                         
                         # 如果沒有找到音頻，回退到模擬模式
                         logger.warning("⚠️ API 回應中未找到音頻數據，使用模擬模式")
-                        return await self._generate_simulation_audio(text, language, emotion, volume)
+                        return await self._generate_simulation_audio(text, language, emotion, volume), "simulation"
                     else:
                         error_text = await response.text()
                         logger.error(f"❌ API 調用失敗: {response.status} - {error_text}")
-                        return await self._generate_simulation_audio(text, language, emotion, volume)
+                        return await self._generate_simulation_audio(text, language, emotion, volume), "simulation"
             
         except Exception as e:
             logger.error(f"❌ MiniMax API 調用異常: {e}")
+            # 已超過截止時間則不再產生模擬音頻
+            deadline.check("MiniMax API")
             # 如果 API 調用失敗，回退到模擬模式
-            return await self._generate_simulation_audio(text, language, emotion, volume)
+            return await self._generate_simulation_audio(text, language, emotion, volume), "simulation"
     
-    async def _generate_simulation_audio(self, text: str, language: str, emotion: str = "neutral", volume: float = 1.0) -> bytes:
+    async def _stream_minimax_api(self, text: str, voice_id: str, speed: float, pitch: int, emotion: str, volume: float) -> AsyncIterator[bytes]:
         """
-        生成模擬音頻 (當沒有 API Key 或 API 調用失敗時使用)
-        支援情緒和音量調節
+        以 SSE 串流模式調用 MiniMax API
+        每個事件的 hex 音頻片段即時解碼，逐塊輸出 16-bit PCM
         """
-        # 模擬處理時間
-        await asyncio.sleep(1.0)
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
         
+        data = self._build_request_data(text, voice_id, speed, pitch, emotion, volume, stream=True)
+        audio_format = data["audio_setting"]["format"]
+        
+        logger.info(f"🚀 串流調用 MiniMax API v2: {self.base_url} (format={audio_format})")
+        
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                self.base_url,
+                headers=headers,
+                json=data,
+                timeout=aiohttp.ClientTimeout(
+                    total=deadline.timeout(None, "MiniMax 串流"),
+                    sock_connect=10,
+                    sock_read=30
+                )
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"MiniMax 串流請求失敗: {response.status} - {error_text}")
+                
+                async def audio_chunks() -> AsyncIterator[bytes]:
+                    async for event in self._iter_sse_events(response):
+                        base_resp = event.get("base_resp") or {}
+                        if base_resp.get("status_code", 0) != 0:
+                            raise Exception(f"MiniMax API 錯誤: {base_resp.get('status_msg', '未知錯誤')} (code: {base_resp.get('status_code')})")
+                        
+                        event_data = event.get("data") or {}
+                        # status 2 為結束事件，其音頻為完整音頻的彙總，不重複輸出
+                        if event_data.get("status") == 2:
+                            break
+                        if event_data.get("audio"):
+                            yield bytes.fromhex(event_data["audio"])
+                
+                total_bytes = 0
+                async for pcm in decode_stream(audio_chunks(), audio_format, self.api_sample_rate):
+                    total_bytes += len(pcm)
+                    yield pcm
+                
+                logger.info(f"✅ MiniMax 串流完成，PCM 大小: {total_bytes} bytes")
+    
+    async def _iter_sse_events(self, response) -> AsyncIterator[Dict[str, Any]]:
+        """逐行解析 SSE 回應，輸出每個 data 事件的 JSON"""
+        buffer = b""
+        async for chunk in response.content.iter_any():
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.strip()
+                if line.startswith(b"data:"):
+                    payload = line[5:].strip()
+                    if payload:
+                        yield json.loads(payload)
+        
+        line = buffer.strip()
+        if line.startswith(b"data:") and line[5:].strip():
+            yield json.loads(line[5:].strip())
+    
+    async def generate_speech_stream(
+        self,
+        text: str,
+        voice_config: Dict[str, Any] = None,
+        language: str = "zh",
+        emotion: str = "neutral",
+        volume: float = 1.0
+    ) -> AsyncIterator[bytes]:
+        """
+        串流生成語音，逐塊輸出採樣率為 stream_sample_rate 的 16-bit PCM
+        """
+        if not self.is_initialized:
+            raise Exception("服務尚未初始化")
+        
+        voice_id, speed, pitch = self._resolve_voice_config(voice_config, language)
+        
+        logger.info(f"MiniMax TTS 串流生成語音: {text[:50]}... (語言: {language})")
+        
+        if not self.api_key:
+            async for pcm in self._stream_simulation_audio(text, language, emotion, volume):
+                yield pcm
+            return
+        
+        async for pcm in self._stream_minimax_api(text, voice_id, speed, pitch, emotion, volume):
+            yield pcm
+    
+    def _simulation_blocks(self, text: str, language: str, emotion: str, volume: float, sample_rate: int):
+        """
+        模擬音頻的逐塊 PCM 產生器 (當沒有 API Key 或 API 調用失敗時使用)
+        支援情緒和音量調節，記憶體用量與文字長度無關
+        """
         # 根據文本長度生成對應長度的音頻
         duration = max(len(text) * 0.15, 2.0)  # 每個字符 0.15 秒，最少 2 秒
-        num_samples = int(duration * self.sample_rate)
-        
-        # 生成更自然的音頻波形 (模擬 MiniMax 的高品質)
-        t = np.linspace(0, duration, num_samples)
         
         # 根據語言選擇不同的基頻
         base_freq = 220 if language == "zh" else 200
@@ -307,43 +468,62 @@ class TTSService2:
         config = emotion_config.get(emotion, emotion_config["neutral"])
         adjusted_freq = base_freq * config["freq_mod"]
         
-        # 生成複雜的波形模擬高品質語音
-        audio = np.zeros(num_samples)
-        
-        # 基頻和諧波 (根據情緒調整)
-        audio += np.sin(2 * np.pi * adjusted_freq * t) * 0.3 * config["amp_mod"]
-        audio += np.sin(2 * np.pi * adjusted_freq * 2 * t) * 0.15 * config["amp_mod"]
-        audio += np.sin(2 * np.pi * adjusted_freq * 3 * t) * 0.08 * config["amp_mod"]
-        
-        # 添加語音特徵的調製 (根據情緒調整)
-        modulation_freq = 3 if emotion != "sad" else 2
-        modulation = 1 + np.sin(2 * np.pi * modulation_freq * t) * 0.2
-        audio *= modulation
-        
-        # 添加一些隨機變化模擬自然語音 (根據情緒調整噪音)
-        noise = np.random.normal(0, config["noise_level"], num_samples)
-        audio += noise
-        
-        # 應用音量調節 (限制在合理範圍)
-        volume = max(0.1, min(2.0, volume))
-        audio *= volume
-        
-        # 防止音頻削波
-        max_val = np.max(np.abs(audio))
-        if max_val > 0.95:
-            audio = audio * 0.95 / max_val
+        return iter_simulation_pcm(
+            duration,
+            sample_rate,
+            # 基頻和諧波 (根據情緒調整)
+            partials=[
+                (adjusted_freq, 0.3 * config["amp_mod"]),
+                (adjusted_freq * 2, 0.15 * config["amp_mod"]),
+                (adjusted_freq * 3, 0.08 * config["amp_mod"]),
+            ],
+            # 語音特徵的調製 (根據情緒調整)
+            modulations=[(3 if emotion != "sad" else 2, 0.2)],
+            noise_level=config["noise_level"],
+            # 音量調節 (限制在合理範圍)，並防止音頻削波
+            gain=max(0.1, min(2.0, volume)),
+            peak=0.95,
+            fade_seconds=0.1
+        )
+    
+    async def _generate_simulation_audio(self, text: str, language: str, emotion: str = "neutral", volume: float = 1.0) -> bytes:
+        """
+        生成模擬音頻的完整 WAV (16-bit PCM)
+        """
+        # 模擬處理時間
+        await asyncio.sleep(1.0)
         
-        # 平滑的淡入淡出
-        fade_samples = int(0.1 * self.sample_rate)
-        audio[:fade_samples] *= np.linspace(0, 1, fade_samples)
-        audio[-fade_samples:] *= np.linspace(1, 0, fade_samples)
+        blocks = self._simulation_blocks(text, language, emotion, volume, self.sample_rate)
+        return await asyncio.to_thread(pcm_blocks_to_wav, blocks, self.sample_rate)
+    
+    async def _stream_simulation_audio(self, text: str, language: str, emotion: str, volume: float) -> AsyncIterator[bytes]:
+        """模擬模式的串流輸出，逐塊產生 stream_sample_rate 的 PCM"""
+        # 模擬處理時間 (首包延遲)
+        await asyncio.sleep(1.0)
         
-        # 轉換為 WAV 格式
-        buffer = io.BytesIO()
-        sf.write(buffer, audio.astype(np.float32), self.sample_rate, format='WAV')
-        buffer.seek(0)
+        for block in self._simulation_blocks(text, language, emotion, volume, self.stream_sample_rate):
+            yield block
+            # 讓出事件循環，長文本不會長時間佔用
+            await asyncio.sleep(0)
+    
+    async def list_voices(self) -> Dict[str, Any]:
+        """
+        音色目錄 (供統一音色索引使用)
+        帳號可另有克隆音色，內建列表不完整，不據此拒絕請求
+        """
+        entries = {}
+        for language, voices in self.voices.items():
+            for voice in voices:
+                entry = entries.setdefault(voice["id"], {
+                    "id": voice["id"],
+                    "name": voice["name"],
+                    "gender": voice.get("gender"),
+                    "languages": [],
+                    "description": voice.get("description", ""),
+                })
+                entry["languages"].append(language)
         
-        return buffer.read()
+        return {"voices": list(entries.values()), "authoritative": False, "voice_key": "voice_id"}
     
     async def get_available_voices(self, language: str = None) -> Dict[str, Any]:
         """
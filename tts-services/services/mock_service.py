@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+模擬 TTS 服務 (容量規劃與故障演練用)
+
+不呼叫任何上游 API，依設定的延遲分布 (含重尾)、錯誤率、逾時率與串流中斷率回應；
+音頻由文字與音色決定 (相同輸入永遠得到相同位元組)，可被快取並驗證。
+可作為獨立服務 ("mock")，也可在執行期間替換指定的真實服務 (例如模擬 service2 故障)。
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import random
+from typing import Dict, Any, AsyncIterator, Optional
+
+import numpy as np
+
+from services import deadline, timing
+from services.audio_decoder import pcm_to_wav
+from services.pricing import estimate_char_cost
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyModel:
+    """
+    延遲分布，格式為 "<種類>:<參數>=<值>,..."
+        fixed:value=0.3
+        uniform:low=0.1,high=0.5
+        lognormal:median=0.3,sigma=0.5
+        pareto:scale=0.2,alpha=1.5,cap=30      (重尾)
+    """
+
+    KINDS = ("fixed", "uniform", "lognormal", "pareto")
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip()
+        if self.kind not in self.KINDS:
+            raise ValueError(f"未知的延遲分布: {spec} (可用: {', '.join(self.KINDS)})")
+        try:
+            self.params = {
+                key.strip(): float(value)
+                for key, value in (item.split("=", 1) for item in params.split(",") if item.strip())
+            }
+        except ValueError:
+            raise ValueError(f"延遲分布參數格式錯誤: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p.get("value", 0.0)
+        elif self.kind == "uniform":
+            value = rng.uniform(p.get("low", 0.0), p.get("high", 1.0))
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(p.get("median", 0.3)), p.get("sigma", 0.5))
+        else:
+            value = p.get("scale", 0.2) * rng.paretovariate(p.get("alpha", 1.5))
+        return max(0.0, min(value, p.get("cap", 300.0)))
+
+
+class MockBehavior:
+    """模擬服務的行為設定 (可在執行期間部分更新)"""
+
+    DEFAULTS: Dict[str, Any] = {
+        "latency": "lognormal:median=0.5,sigma=0.6,cap=30",  # 首個音頻前的延遲
+        "error_rate": 0.0,          # 返回錯誤的比例
+        "timeout_rate": 0.0,        # 卡住直到 hang_seconds (或請求截止時間) 的比例
+        "hang_seconds": 120.0,
+        "partial_rate": 0.0,        # 串流途中中斷的比例
+        "seconds_per_char": 0.2,    # 每個字的音頻長度
+        "stream_speed": 20.0,       # 合成速度 (音頻秒數 / 實際秒數)，0 表示立即完成
+        "sample_rate": 24000,
+        "healthy": True,            # 健康檢查結果
+        "seed": None,               # 故障序列的隨機種子 (音頻本身不受影響)
+    }
+
+    def __init__(self, **overrides):
+        self.values: Dict[str, Any] = dict(self.DEFAULTS)
+        self.latency = LatencyModel(self.values["latency"])
+        self.update(overrides)
+
+    @classmethod
+    def from_env(cls) -> "MockBehavior":
+        overrides: Dict[str, Any] = {}
+        for key in cls.DEFAULTS:
+            value = os.getenv(f"MOCK_TTS_{key.upper()}")
+            if value is not None and value != "":
+                overrides[key] = value
+        return cls(**overrides)
+
+    def update(self, changes: Dict[str, Any]):
+        """
+        驗證並套用設定
+
+        Raises:
+            ValueError: 欄位不存在或數值不合法
+        """
+        values = dict(self.values)
+        for key, value in changes.items():
+            if key not in self.DEFAULTS:
+                raise ValueError(f"未知的模擬設定: {key}")
+            try:
+                if key == "latency":
+                    value = str(value)
+                elif key == "healthy":
+                    value = value if isinstance(value, bool) else str(value).lower() == "true"
+                elif key == "seed":
+                    value = None if value is None or value == "" else int(value)
+                elif key == "sample_rate":
+                    value = int(value)
+                else:
+                    value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} 數值格式錯誤: {value!r}")
+            if key == "sample_rate" and not 8000 <= value <= 48000:
+                raise ValueError("sample_rate 必須介於 8000-48000")
+            if isinstance(value, float) and (value < 0 or (key.endswith("_rate") and value > 1)):
+                raise ValueError(f"{key} 數值不合法: {value}")
+            values[key] = value
+
+        latency = LatencyModel(values["latency"])
+        if values["error_rate"] + values["timeout_rate"] > 1:
+            raise ValueError("error_rate + timeout_rate 不可超過 1")
+        self.values = values
+        self.latency = latency
+
+    def __getattr__(self, name: str) -> Any:
+        values = self.__dict__.get("values")
+        if values is not None and name in values:
+            return values[name]
+        raise AttributeError(name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.values)
+
+
+def audio_seed(text: str, voice: str) -> int:
+    """音頻種子只取決於文字與音色"""
+    return int.from_bytes(hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).digest()[:8], "big")
+
+
+def iter_mock_pcm(text: str, voice: str, seconds: float, sample_rate: int, block_seconds: float = 0.5):
+    """
+    逐塊產生可重現的 16-bit PCM：依種子決定基頻與音節速率，
+    以絕對樣本位置計算相位，分塊結果與一次產生完全相同
+    """
+    rng = np.random.default_rng(audio_seed(text, voice))
+    frequency = float(rng.uniform(120, 260))
+    syllable_rate = float(rng.uniform(3, 6))
+    total = int(seconds * sample_rate)
+    block = max(1, int(block_seconds * sample_rate))
+    for start in range(0, total, block):
+        t = np.arange(start, min(start + block, total)) / sample_rate
+        envelope = 0.5 + 0.5 * np.abs(np.sin(np.pi * syllable_rate * t))
+        wave = np.sin(2 * np.pi * frequency * t) + 0.3 * np.sin(4 * np.pi * frequency * t)
+        yield (wave * envelope * 8000).astype("<i2").tobytes()
+
+
+class MockTTSService:
+    """
+    模擬 TTS 服務
+
+    Args:
+        behavior: 行為設定 (多個實例可共用，更新後立即生效)
+        impersonate: 被替換的真實服務；音色列表與語言沿用該服務，讓路由與音色驗證照常運作
+    """
+
+    def __init__(self, behavior: MockBehavior, impersonate: Optional[Any] = None, service_id: str = "mock"):
+        self.behavior = behavior
+        self.impersonated = impersonate
+        self.service_id = service_id
+        self.name = f"{impersonate.name} (模擬)" if impersonate is not None else "Mock TTS"
+        self.description = "模擬 TTS 服務，用於容量規劃與故障演練"
+        self.languages = getattr(impersonate, "languages", None) or ["zh", "en"]
+        self.features = ["text_to_speech", "streaming", "deterministic"]
+        self.is_initialized = True
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.partials = 0
+        self._rng = random.Random(behavior.seed)
+        self._seed = behavior.seed
+
+    @property
+    def sample_rate(self) -> int:
+        return self.behavior.sample_rate
+
+    @property
+    def supports_streaming(self) -> bool:
+        return True
+
+    @property
+    def stream_sample_rate(self) -> int:
+        return self.behavior.sample_rate
+
+    async def initialize(self):
+        return True
+
+    async def health_check(self) -> Dict[str, Any]:
+        return {
+            "status": "healthy" if self.behavior.healthy else "unhealthy",
+            "name": self.name,
+            "initialized": True,
+            "mode": "mock",
+        }
+
+    async def get_info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "languages": self.languages,
+            "features": self.features,
+            "sample_rate": self.sample_rate,
+            "version": "1.0.0",
+            "model_type": "Mock",
+            "behavior": self.behavior.to_dict(),
+        }
+
+    async def list_voices(self) -> Dict[str, Any]:
+        if self.impersonated is not None and hasattr(self.impersonated, "list_voices"):
+            return await self.impersonated.list_voices()
+        return {
+            "voices": [
+                {"id": "mock-female", "name": "Mock Female", "languages": self.languages, "gender": "female"},
+                {"id": "mock-male", "name": "Mock Male", "languages": self.languages, "gender": "male"},
+            ],
+            "authoritative": False,
+            "voice_key": "voice",
+        }
+
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        if self.impersonated is not None and hasattr(self.impersonated, "estimate_cost"):
+            return await self.impersonated.estimate_cost(text, model)
+        return estimate_char_cost(text, 0.0, model="mock")
+
+    def _voice(self, voice_config: Optional[Dict[str, Any]]) -> str:
+        voice_config = voice_config or {}
+        for key in ("voice", "voice_id", "voice_name", "speaker"):
+            if voice_config.get(key):
+                return str(voice_config[key])
+        return ""
+
+    async def _begin(self) -> float:
+        """抽出本次請求的結果並等待首個音頻前的延遲；返回時已通過錯誤與逾時注入"""
+        if self.behavior.seed != self._seed:
+            self._seed = self.behavior.seed
+            self._rng = random.Random(self._seed)
+        self.requests += 1
+        roll = self._rng.random()
+        latency = self.behavior.latency.sample(self._rng)
+
+        if roll < self.behavior.timeout_rate:
+            self.timeouts += 1
+            await asyncio.sleep(deadline.timeout(self.behavior.hang_seconds, "模擬服務"))
+            deadline.check("模擬服務")
+            raise Exception("模擬服務逾時")
+
+        with timing.stage("submit"):
+            await asyncio.sleep(deadline.timeout(latency, "模擬服務"))
+        if roll < self.behavior.timeout_rate + self.behavior.error_rate:
+            self.errors += 1
+            raise Exception("模擬服務錯誤")
+        return roll
+
+    async def generate_speech(
+        self,
+        text: str,
+        voice_config: Dict[str, Any] = None,
+        format: str = "wav",
+        language: str = "zh"
+    ) -> Dict[str, Any]:
+        try:
+            await self._begin()
+            seconds = max(0.2, len(text) * self.behavior.seconds_per_char)
+            if self.behavior.stream_speed > 0:
+                with timing.stage("download"):
+                    await asyncio.sleep(deadline.timeout(seconds / self.behavior.stream_speed, "模擬服務"))
+            voice = self._voice(voice_config)
+            pcm = b"".join(iter_mock_pcm(text, voice, seconds, self.sample_rate))
+            return {
+                "success": True,
+                "audio_data": pcm_to_wav(pcm, self.sample_rate),
+                "duration": seconds,
+                "sample_rate": self.sample_rate,
+                "format": "wav",
+                "service": "mock",
+                "text_length": len(text),
+                "language": language,
+                "voice": voice,
+                "mode": "mock",
+            }
+        except Exception as e:
+            logger.warning(f"🧪 模擬服務 {self.service_id} 返回錯誤: {e}")
+            return {"success": False, "message": f"語音生成失敗: {str(e)}", "service": "mock"}
+
+    async def generate_speech_stream(
+        self,
+        text: str,
+        voice_config: Dict[str, Any] = None,
+        language: str = "zh"
+    ) -> AsyncIterator[bytes]:
+        """逐塊輸出 PCM；partial_rate 命中時在途中拋出錯誤，模擬上游中斷"""
+        roll = await self._begin()
+        seconds = max(0.2, len(text) * self.behavior.seconds_per_char)
+        block_seconds = 0.5
+        cut_at = None
+        partial_threshold = self.behavior.timeout_rate + self.behavior.error_rate + self.behavior.partial_rate
+        if roll < partial_threshold:
+            cut_at = self._rng.uniform(0.1, 0.9) * seconds
+        emitted = 0.0
+        for chunk in iter_mock_pcm(text, self._voice(voice_config), seconds, self.sample_rate, block_seconds):
+            if cut_at is not None and emitted >= cut_at:
+                self.partials += 1
+                raise Exception("模擬串流中斷")
+            if self.behavior.stream_speed > 0:
+                await asyncio.sleep(block_seconds / self.behavior.stream_speed)
+            emitted += block_seconds
+            yield chunk
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "service_id": self.service_id,
+            "impersonating": self.impersonated is not None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "partials": self.partials,
+        }
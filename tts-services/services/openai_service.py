@@ -5,14 +5,18 @@ OpenAI 的語音合成服務接口
 """
 
 import asyncio
-import numpy as np
-import soundfile as sf
-import io
+import httpx
 import logging
+import time
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator
 from openai import AsyncOpenAI
 
+from services import deadline, timing
+from services.audio_decoder import pcm_to_wav
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+from services.simulation_audio import iter_simulation_pcm, pcm_blocks_to_wav
+
 logger = logging.getLogger(__name__)
 
 class TTSService4:
@@ -29,6 +33,8 @@ class TTSService4:
         self.sample_rate = 24000
         self.is_initialized = False
         self.api_key = None  # 需要設定 API Key
+        self.base_url = None  # 可指向相容 API 或本地測試服務
+        self.default_model = "tts-1"
         self.client = None
         
         # OpenAI TTS 支援的音色
@@ -47,6 +53,12 @@ class TTSService4:
             "tts-1-hd": {"name": "TTS-1 HD", "description": "高品質，音質更佳", "max_chars": 4096}
         }
         
+        # 每 1K 字符價格 (USD，實際價格請參考 OpenAI 官網)
+        self.pricing = {
+            "tts-1": get_price_per_1k_chars("openai", 0.015),
+            "tts-1-hd": get_price_per_1k_chars("openai_hd", 0.030)
+        }
+        
     async def initialize(self):
         """初始化 OpenAI TTS 服務"""
         try:
@@ -55,14 +67,28 @@ class TTSService4:
             # 檢查 API Key (從環境變數或配置文件讀取)
             import os
             self.api_key = os.getenv("OPENAI_API_KEY")
+            self.base_url = os.getenv("OPENAI_BASE_URL") or None
+            
+            default_model = os.getenv("OPENAI_TTS_MODEL", "tts-1")
+            if default_model in self.models:
+                self.default_model = default_model
+            else:
+                logger.warning(f"⚠️ OPENAI_TTS_MODEL={default_model} 不受支援，改用 {self.default_model}")
             
             if not self.api_key:
                 logger.warning("⚠️ OpenAI API Key 未設定，將使用模擬模式")
                 # 模擬模式，不實際調用 API
                 self.is_initialized = True
             else:
-                # 初始化 OpenAI 客戶端
-                self.client = AsyncOpenAI(api_key=self.api_key)
+                # 初始化 OpenAI 客戶端 (共用連線池)
+                self.client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                    max_retries=1
+                )
+                logger.info(f"   Base URL: {self.client.base_url}")
+                logger.info(f"   Default Model: {self.default_model}")
                 # 測試 API 連接
                 await self._test_api_connection()
                 self.is_initialized = True
@@ -74,6 +100,16 @@ class TTSService4:
             # 即使失敗也標記為已初始化，使用模擬模式
             self.is_initialized = True
     
+    @property
+    def supports_streaming(self) -> bool:
+        """是否可使用 generate_speech_stream (模擬模式逐塊產生模擬音頻)"""
+        return self.is_initialized
+    
+    @property
+    def stream_sample_rate(self) -> int:
+        """串流輸出的 PCM 採樣率 (OpenAI pcm 固定為 24kHz)"""
+        return self.sample_rate
+    
     async def health_check(self) -> Dict[str, Any]:
         """健康檢查"""
         return {
@@ -82,7 +118,7 @@ class TTSService4:
             "initialized": self.is_initialized,
             "memory_usage": "約 80MB",
             "api_key_configured": bool(self.api_key),
-            "mode": "real" if self.api_key else "simulation",
+            "mode": "real" if self.client else "simulation",
             "models": list(self.models.keys()),
         }
     
@@ -133,17 +169,7 @@ class TTSService4:
             if voice_config is None:
                 voice_config = {}
             
-            voice = voice_config.get("voice", "alloy")
-            model = voice_config.get("model", "tts-1")
-            speed = voice_config.get("speed", 1.0)
-            
-            # 檢查文本長度
-            max_chars = self.models.get(model, {}).get("max_chars", 4096)
-            if len(text) > max_chars:
-                raise Exception(f"文本長度超過限制 ({max_chars} 字符)")
-            
-            # 檢查語速範圍
-            speed = max(0.25, min(4.0, speed))
+            voice, model, speed = self._resolve_voice_config(text, voice_config)
             
             if self.api_key and self.client:
                 # 實際調用 OpenAI API
@@ -164,7 +190,7 @@ class TTSService4:
                 "voice": voice,
                 "model": model,
                 "speed": speed,
-                "mode": "real" if self.api_key else "simulation"
+                "mode": "real" if self.client else "simulation"
             }
             
         except Exception as e:
@@ -175,6 +201,29 @@ class TTSService4:
                 "service": "openai"
             }
     
+    def _resolve_voice_config(self, text: str, voice_config: Dict[str, Any]):
+        """解析並檢查語音配置，返回 (voice, model, speed)"""
+        if voice_config is None:
+            voice_config = {}
+        
+        voice = voice_config.get("voice", "alloy")
+        if voice not in self.voices:
+            raise Exception(f"不支援的音色: {voice}，可用音色: {list(self.voices.keys())}")
+        
+        model = voice_config.get("model") or self.default_model
+        if model not in self.models:
+            raise Exception(f"不支援的模型: {model}，可用模型: {list(self.models.keys())}")
+        
+        # 檢查文本長度
+        max_chars = self.models[model]["max_chars"]
+        if len(text) > max_chars:
+            raise Exception(f"文本長度超過限制 ({max_chars} 字符)")
+        
+        # 檢查語速範圍
+        speed = max(0.25, min(4.0, voice_config.get("speed", 1.0)))
+        
+        return voice, model, speed
+    
     async def _test_api_connection(self):
         """測試 API 連接"""
         try:
@@ -188,44 +237,73 @@ class TTSService4:
     
     async def _call_openai_api(self, text: str, voice: str, model: str, speed: float, format: str) -> bytes:
         """
-        調用 OpenAI API (示例實現)
-        實際使用時需要根據 OpenAI 的真實 API 文檔來實現
+        調用 OpenAI Speech API
+        以 pcm 格式取得原始音頻，直接封裝為 WAV，不需解碼
         """
-        try:
-            logger.info(f"調用 OpenAI TTS API: model={model}, voice={voice}, speed={speed}")
-            
-            # 這是示例代碼，實際的 OpenAI API 調用
-            # response = await self.client.audio.speech.create(
-            #     model=model,
-            #     voice=voice,
-            #     input=text,
-            #     response_format=format,
-            #     speed=speed
-            # )
-            # return response.content
-            
-            # 由於這是示例，我們返回模擬音頻
-            return await self._generate_simulation_audio(text, voice, "auto")
-            
-        except Exception as e:
-            logger.error(f"OpenAI API 調用失敗: {e}")
-            # 如果 API 調用失敗，回退到模擬模式
-            return await self._generate_simulation_audio(text, voice, "auto")
+        logger.info(f"調用 OpenAI TTS API: model={model}, voice={voice}, speed={speed}")
+        
+        pcm_chunks = []
+        async for chunk in self._stream_openai_api(text, voice, model, speed):
+            pcm_chunks.append(chunk)
+        
+        pcm_data = b"".join(pcm_chunks)
+        if not pcm_data:
+            raise Exception("OpenAI API 返回空音頻數據")
+        
+        logger.info(f"✅ OpenAI TTS 完成，PCM 大小: {len(pcm_data)} bytes")
+        return pcm_to_wav(pcm_data, self.sample_rate)
     
-    async def _generate_simulation_audio(self, text: str, voice: str, language: str) -> bytes:
+    async def _stream_openai_api(self, text: str, voice: str, model: str, speed: float) -> AsyncIterator[bytes]:
         """
-        生成模擬音頻 (當沒有 API Key 或 API 調用失敗時使用)
-        模擬 OpenAI TTS 的高品質音頻
+        串流讀取 OpenAI Speech API 回應
+        回應為 24kHz 16-bit 單聲道 PCM，收到即輸出
         """
-        # 模擬處理時間
-        await asyncio.sleep(0.8)
+        submitted = time.monotonic()
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            input=text,
+            response_format="pcm",
+            speed=speed,
+            timeout=deadline.timeout(60, "OpenAI API")
+        ) as response:
+            timing.record("submit", time.monotonic() - submitted)
+            with timing.stage("download"):
+                async for chunk in response.iter_bytes(8192):
+                    if chunk:
+                        yield chunk
+    
+    async def generate_speech_stream(
+        self,
+        text: str,
+        voice_config: Dict[str, Any] = None,
+        language: str = "zh"
+    ) -> AsyncIterator[bytes]:
+        """
+        串流生成語音，逐塊輸出採樣率為 stream_sample_rate 的 16-bit PCM
+        """
+        if not self.supports_streaming:
+            raise Exception("服務尚未初始化")
+        
+        voice, model, speed = self._resolve_voice_config(text, voice_config)
+        
+        logger.info(f"OpenAI TTS 串流生成語音: {text[:50]}... (model={model}, voice={voice})")
+        
+        if not (self.api_key and self.client):
+            async for chunk in self._stream_simulation_audio(text, voice):
+                yield chunk
+            return
         
+        async for chunk in self._stream_openai_api(text, voice, model, speed):
+            yield chunk
+    
+    def _simulation_blocks(self, text: str, voice: str, sample_rate: int):
+        """
+        模擬音頻的逐塊 PCM 產生器 (當沒有 API Key 或 API 調用失敗時使用)
+        模擬 OpenAI TTS 的高品質音頻，記憶體用量與文字長度無關
+        """
         # 根據文本長度生成對應長度的音頻
         duration = max(len(text) * 0.12, 1.8)  # OpenAI TTS 速度較快
-        num_samples = int(duration * self.sample_rate)
-        
-        # 生成高品質音頻波形 (模擬 OpenAI 的自然語音)
-        t = np.linspace(0, duration, num_samples)
         
         # 根據音色選擇不同的基頻和特徵
         voice_characteristics = {
@@ -239,47 +317,69 @@ class TTSService4:
         
         char = voice_characteristics.get(voice, voice_characteristics["alloy"])
         base_freq = char["base_freq"]
-        modulation_depth = char["modulation"]
-        warmth = char["warmth"]
-        
-        # 生成複雜的波形模擬 OpenAI 的自然語音
-        audio = np.zeros(num_samples)
-        
-        # 基頻和諧波 (OpenAI 特色：非常自然的諧波結構)
-        audio += np.sin(2 * np.pi * base_freq * t) * 0.35
-        audio += np.sin(2 * np.pi * base_freq * 1.618 * t) * 0.2  # 黃金比例諧波
-        audio += np.sin(2 * np.pi * base_freq * 2 * t) * 0.15
-        audio += np.sin(2 * np.pi * base_freq * 2.618 * t) * 0.1
-        audio += np.sin(2 * np.pi * base_freq * 3 * t) * 0.08
-        
-        # OpenAI 特色：自然的語音調製
-        natural_modulation = np.sin(2 * np.pi * 3.5 * t) * modulation_depth + 1
-        audio *= natural_modulation
-        
-        # 添加溫暖感 (根據音色調整)
-        warmth_modulation = np.sin(2 * np.pi * 1.2 * t) * (warmth * 0.1) + 1
-        audio *= warmth_modulation
-        
-        # 添加微妙的隨機變化模擬人聲自然性
-        noise = np.random.normal(0, 0.01, num_samples)
-        audio += noise
         
-        # 非常平滑的淡入淡出 (OpenAI 特色)
-        fade_samples = int(0.2 * self.sample_rate)
-        fade_in = np.linspace(0, 1, fade_samples) ** 2.5
-        fade_out = np.linspace(1, 0, fade_samples) ** 2.5
-        audio[:fade_samples] *= fade_in
-        audio[-fade_samples:] *= fade_out
-        
-        # 輕微的壓縮效果模擬專業音頻處理
-        audio = np.tanh(audio * 1.2) * 0.8
+        return iter_simulation_pcm(
+            duration,
+            sample_rate,
+            # 基頻和諧波 (OpenAI 特色：非常自然的諧波結構，含黃金比例諧波)
+            partials=[
+                (base_freq, 0.35),
+                (base_freq * 1.618, 0.2),
+                (base_freq * 2, 0.15),
+                (base_freq * 2.618, 0.1),
+                (base_freq * 3, 0.08),
+            ],
+            # 自然的語音調製與溫暖感 (根據音色調整)
+            modulations=[(3.5, char["modulation"]), (1.2, char["warmth"] * 0.1)],
+            # 微妙的隨機變化模擬人聲自然性
+            noise_level=0.01,
+            # 非常平滑的淡入淡出 (OpenAI 特色)
+            fade_seconds=0.2,
+            fade_power=2.5,
+            # 輕微的壓縮效果模擬專業音頻處理
+            saturation=(1.2, 0.8)
+        )
+    
+    async def _generate_simulation_audio(self, text: str, voice: str, language: str) -> bytes:
+        """
+        生成模擬音頻的完整 WAV (16-bit PCM)
+        """
+        # 模擬處理時間
+        await asyncio.sleep(0.8)
         
-        # 轉換為 WAV 格式
-        buffer = io.BytesIO()
-        sf.write(buffer, audio.astype(np.float32), self.sample_rate, format='WAV')
-        buffer.seek(0)
+        blocks = self._simulation_blocks(text, voice, self.sample_rate)
+        return await asyncio.to_thread(pcm_blocks_to_wav, blocks, self.sample_rate)
+    
+    async def _stream_simulation_audio(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        """模擬模式的串流輸出，逐塊產生 stream_sample_rate 的 PCM"""
+        # 模擬處理時間 (首包延遲)
+        await asyncio.sleep(0.8)
         
-        return buffer.read()
+        for block in self._simulation_blocks(text, voice, self.stream_sample_rate):
+            yield block
+            # 讓出事件循環，長文本不會長時間佔用
+            await asyncio.sleep(0)
+    
+    async def list_voices(self) -> Dict[str, Any]:
+        """音色目錄 (供統一音色索引使用)"""
+        genders = {"alloy": "neutral", "echo": "male", "fable": "male", "onyx": "male", "nova": "female", "shimmer": "female"}
+        entries = [
+            {
+                "id": voice_id,
+                "name": voice["name"],
+                "description": voice["description"],
+                "languages": self.languages,
+                "gender": genders.get(voice_id),
+                "models": list(self.models.keys()),
+            }
+            for voice_id, voice in self.voices.items()
+        ]
+        return {
+            "voices": entries,
+            "authoritative": True,
+            "voice_key": "voice",
+            "constraints": {"model": "models"},
+        }
     
     async def get_available_voices(self) -> Dict[str, Any]:
         """
@@ -316,31 +416,10 @@ class TTSService4:
             logger.error(f"獲取使用情況失敗: {e}")
             return {"error": str(e)}
     
-    async def estimate_cost(self, text: str, model: str = "tts-1") -> Dict[str, Any]:
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
         """
-        估算成本 (OpenAI 特色功能)
+        估算成本 (OpenAI TTS 按字符計費)
         """
-        try:
-            # OpenAI TTS 按字符計費
-            char_count = len(text)
-            
-            # 模擬價格 (實際價格請參考 OpenAI 官網)
-            pricing = {
-                "tts-1": 0.015,      # 每 1K 字符 $0.015
-                "tts-1-hd": 0.030    # 每 1K 字符 $0.030
-            }
-            
-            price_per_1k = pricing.get(model, 0.015)
-            estimated_cost = (char_count / 1000) * price_per_1k
-            
-            return {
-                "character_count": char_count,
-                "model": model,
-                "price_per_1k_chars": price_per_1k,
-                "estimated_cost_usd": round(estimated_cost, 4),
-                "currency": "USD"
-            }
-            
-        except Exception as e:
-            logger.error(f"成本估算失敗: {e}")
-            return {"error": str(e)}
+        model = model or self.default_model
+        price_per_1k = self.pricing.get(model, self.pricing["tts-1"])
+        return estimate_char_cost(text, price_per_1k, model=model)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+字符計費估算
+各 TTS 服務均按字符計費 (免費或自建服務價格為 0)，
+價格可由環境變數 {PROVIDER}_PRICE_PER_1K_CHARS 覆寫
+"""
+
+import logging
+import os
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+def get_price_per_1k_chars(provider: str, default: float) -> float:
+    """讀取服務每 1K 字符的價格 (USD)"""
+    env_name = f"{provider.upper()}_PRICE_PER_1K_CHARS"
+    value = os.getenv(env_name)
+    if not value:
+        return default
+
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"⚠️ {env_name}={value} 不是有效數字，改用 {default}")
+        return default
+
+
+def estimate_char_cost(text: str, price_per_1k: float, **extra: Any) -> Dict[str, Any]:
+    """依字符數估算成本"""
+    char_count = len(text or "")
+    return {
+        "character_count": char_count,
+        **extra,
+        "price_per_1k_chars": price_per_1k,
+        "estimated_cost_usd": round(char_count / 1000 * price_per_1k, 4),
+        "currency": "USD"
+    }
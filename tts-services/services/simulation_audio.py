@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+模擬模式的音頻產生器
+
+逐塊 (固定樣本數) 產生 16-bit PCM，記憶體用量只取決於區塊大小，與文字長度無關：
+- 每個正弦分量預先計算一個區塊長度的相量表 e^(iωn)，每塊乘上區塊起點的相位 e^(iω·start)
+  (由絕對樣本位置計算，不累積誤差)，分塊結果相位連續，且不需逐樣本計算 sin
+- 峰值以波形的理論上限預先縮放，不需要先產生完整波形再正規化
+- 所有中間緩衝在產生器建立時配置一次，逐塊重複使用；相量表依頻率快取，跨請求共用
+"""
+
+import cmath
+import io
+import math
+import wave
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+BLOCK_SAMPLES = 8192
+
+
+@lru_cache(maxsize=128)
+def _phasor_table(cycles_per_sample: float, block_size: int) -> np.ndarray:
+    # 音色與情緒組合有限，每張表 block_size × 8 bytes
+    table = np.exp(2j * math.pi * cycles_per_sample * np.arange(block_size)).astype(np.complex64)
+    table.flags.writeable = False
+    return table
+
+
+class _Oscillator:
+    """以預先計算的相量表產生相位連續的正弦波"""
+
+    def __init__(self, frequency: float, sample_rate: int, block_size: int):
+        self.cycles_per_sample = frequency / sample_rate
+        self.table = _phasor_table(self.cycles_per_sample, block_size)
+
+    def render(self, start: int, count: int, scratch: np.ndarray) -> np.ndarray:
+        """返回樣本 [start, start + count) 的 sin 值 (scratch 的虛部視圖)"""
+        # 只保留相位的小數部分，長音頻的起點相位仍保有完整精度
+        phase = 2 * math.pi * ((self.cycles_per_sample * start) % 1.0)
+        np.multiply(self.table[:count], np.complex64(cmath.exp(1j * phase)), out=scratch[:count])
+        return scratch[:count].imag
+
+
+def iter_simulation_pcm(
+    duration: float,
+    sample_rate: int,
+    partials: Sequence[Tuple[float, float]],
+    modulations: Sequence[Tuple[float, float]] = (),
+    noise_level: float = 0.0,
+    gain: float = 1.0,
+    peak: Optional[float] = None,
+    fade_seconds: float = 0.1,
+    fade_power: float = 1.0,
+    saturation: Optional[Tuple[float, float]] = None,
+    block_size: int = BLOCK_SAMPLES,
+    seed: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    逐塊產生模擬語音的 16-bit PCM
+
+    波形 = (Σ 分量) × Π (1 + 調製) + 噪音，乘上 gain 後依序套用峰值限制、淡入淡出與飽和
+
+    Args:
+        partials: 正弦分量 [(頻率, 振幅)]
+        modulations: 振幅調製 [(頻率, 深度)]，每項為 1 + 深度 × sin
+        noise_level: 高斯噪音標準差
+        peak: 峰值上限；理論最大值超過時整體縮放 (None 表示不限制)
+        fade_power: 淡入淡出曲線的次方 (1 為線性)
+        saturation: (drive, level)，套用 tanh(x × drive) × level 的軟削波
+        seed: 噪音的隨機種子 (None 表示每次不同)
+    """
+    total = int(duration * sample_rate)
+    if total <= 0:
+        return
+
+    block_size = max(1, block_size)
+    oscillators = [(_Oscillator(frequency, sample_rate, block_size), amplitude) for frequency, amplitude in partials]
+    modulators = [(_Oscillator(frequency, sample_rate, block_size), depth) for frequency, depth in modulations]
+    rng = np.random.default_rng(seed) if noise_level > 0 else None
+
+    scale = gain
+    if peak is not None:
+        # 理論上限: 分量振幅總和 × 調製最大值 + 4σ 噪音
+        bound = sum(abs(amplitude) for _, amplitude in partials)
+        for _, depth in modulations:
+            bound *= 1 + abs(depth)
+        bound = (bound + 4 * noise_level) * gain
+        if bound > peak:
+            scale = gain * peak / bound
+
+    fade_samples = min(int(fade_seconds * sample_rate), total)
+    fade_in = (np.linspace(0, 1, fade_samples) ** fade_power).astype(np.float32) if fade_samples > 0 else None
+    fade_out = fade_in[::-1] if fade_in is not None else None
+
+    audio = np.empty(block_size, dtype=np.float32)
+    work = np.empty(block_size, dtype=np.float32)
+    scratch = np.empty(block_size, dtype=np.complex64)
+    pcm = np.empty(block_size, dtype="<i2")
+
+    for start in range(0, total, block_size):
+        count = min(block_size, total - start)
+        block = audio[:count]
+        temp = work[:count]
+
+        block.fill(0)
+        for oscillator, amplitude in oscillators:
+            np.multiply(oscillator.render(start, count, scratch), amplitude, out=temp)
+            block += temp
+        for modulator, depth in modulators:
+            np.multiply(modulator.render(start, count, scratch), depth, out=temp)
+            temp += 1
+            block *= temp
+        if rng is not None:
+            rng.standard_normal(out=temp, dtype=np.float32)
+            temp *= noise_level
+            block += temp
+        block *= scale
+
+        if fade_in is not None:
+            if start < fade_samples:
+                end = min(fade_samples, start + count)
+                block[:end - start] *= fade_in[start:end]
+            fade_start = total - fade_samples
+            if start + count > fade_start:
+                begin = max(start, fade_start)
+                block[begin - start:] *= fade_out[begin - fade_start:start + count - fade_start]
+
+        if saturation is not None:
+            drive, level = saturation
+            block *= drive
+            np.tanh(block, out=block)
+            block *= level
+
+        np.clip(block, -1.0, 1.0, out=block)
+        block *= 32767
+        np.copyto(pcm[:count], block, casting="unsafe")
+        yield pcm[:count].tobytes()
+
+
+def pcm_blocks_to_wav(blocks: Iterable[bytes], sample_rate: int) -> bytes:
+    """將逐塊 PCM 直接寫入 WAV，不保留中間區塊"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        for block in blocks:
+            wav_file.writeframesraw(block)
+    return buffer.getvalue()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+請求階段計時
+Gateway 在收到請求時建立計時器 (contextvar)，各服務在送出請求、輪詢、下載與轉碼時記錄耗時，
+回應時輸出 Server-Timing 標頭；同時保存 X-Request-ID，讓日誌可以對應到單一請求
+"""
+
+import contextvars
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Mapping, Optional
+
+# 階段名稱: parse (請求解析)、queue (排隊等待)、submit (上游送出)、poll (上游輪詢)、
+# download (音頻下載)、transcode (音頻轉碼)、write (文件寫入)
+
+
+class StageTimer:
+    """單一請求的各階段累計耗時 (秒)"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.monotonic()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing 標頭值，例如 parse;dur=1.2, queue;dur=0.4, total;dur=812.5"""
+        entries = [
+            f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.stages.items()
+        ]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self) -> str:
+        """日誌用的單行摘要"""
+        parts = [f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items()]
+        parts.append(f"total={self.elapsed() * 1000:.1f}ms")
+        return " ".join(parts)
+
+
+_timer: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar("stage_timer", default=None)
+
+
+def request_id_from(headers: Mapping[str, str]) -> str:
+    """沿用呼叫端的 X-Request-ID，沒有時產生新的"""
+    request_id = (headers.get("x-request-id") or "").strip()
+    if request_id and len(request_id) <= 128 and request_id.isprintable():
+        return request_id
+    return uuid.uuid4().hex
+
+
+def start(request_id: str) -> StageTimer:
+    """為目前請求建立計時器"""
+    timer = StageTimer(request_id)
+    _timer.set(timer)
+    return timer
+
+
+def current() -> Optional[StageTimer]:
+    return _timer.get()
+
+
+def current_request_id() -> Optional[str]:
+    timer = _timer.get()
+    return timer.request_id if timer else None
+
+
+def record(name: str, seconds: float):
+    """記錄階段耗時，沒有計時器時忽略"""
+    timer = _timer.get()
+    if timer is not None:
+        timer.record(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """計時一個階段 (同名階段累加，例如多次輪詢)"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, time.monotonic() - started)
+
+
+class RequestIdFilter(logging.Filter):
+    """在日誌記錄加上 request_id 欄位 (請求外為 -)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id() or "-"
+        return True
@@ -4,13 +4,18 @@ VoAI TTS Service - 網際智慧語音合成服務
 使用 voai.ai 的高品質中文 TTS 服務
 """
 
-import requests
+import aiohttp
 import io
+import json
 import logging
+import time
 from typing import Dict, Any, List
-import tempfile
 import os
 
+from services import deadline, timing
+from services.audio_decoder import decode_to_wav, get_transfer_format
+from services.pricing import estimate_char_cost, get_price_per_1k_chars
+
 logger = logging.getLogger(__name__)
 
 class VoAIService:
@@ -25,8 +30,10 @@ class VoAIService:
         self.languages = ["zh-TW", "zh-CN"]
         self.features = ["text_to_speech", "chinese_focused", "multiple_speakers", "style_control"]
         self.is_initialized = False
+        self.price_per_1k_chars = get_price_per_1k_chars("voai", 0.02)  # 每 1K 字符價格 (USD)
         self.api_key = None
         self.base_url = "https://connect.voai.ai"
+        self.transfer_format = "mp3"  # 上游傳輸格式，本地解碼為 WAV
         
         # 預設的發音人和風格配置
         self.speakers = [
@@ -36,6 +43,8 @@ class VoAIService:
         ]
         
         self.models = ["Classic", "Neo"]
+        self.speakers_source = "default"  # default / file / api
+        self._speakers_mtime = None
         
     async def initialize(self, config: Dict[str, Any] = None):
         """
@@ -48,6 +57,10 @@ class VoAIService:
             # 從環境變數獲取 API Key
             if not self.api_key:
                 self.api_key = os.getenv('VOAI_API_KEY')
+            
+            self.base_url = os.getenv('VOAI_BASE_URL', self.base_url).rstrip('/')
+            
+            self.transfer_format = get_transfer_format("voai", "mp3", ["mp3", "wav"])
                 
             if not self.api_key:
                 logger.warning("VoAI API Key 未設置（環境變數 VOAI_API_KEY），將無法使用 VoAI TTS 服務")
@@ -62,19 +75,23 @@ class VoAIService:
             
         except Exception as e:
             logger.error(f"VoAI TTS 服務初始化失敗: {e}")
-            # 即使出錯也標記為已初始化，讓服務能正常啟動
-            self.is_initialized = True
-            return True
+            # 標記為未初始化，健康檢查如實回報；服務啟動不受影響
+            self.is_initialized = False
+            return False
     
     async def _fetch_speakers(self) -> List[Dict]:
         """
         從 VoAI API 或本地文件獲取最新的 speaker 列表
+        本地文件未變更時直接使用已載入的列表
         """
         # 首先嘗試加載本地的 speakers 文件
         try:
-            import json
             speakers_file_path = os.path.join(os.path.dirname(__file__), '..', 'voai_speakers.json')
             if os.path.exists(speakers_file_path):
+                mtime = os.path.getmtime(speakers_file_path)
+                if self.speakers_source == "file" and mtime == self._speakers_mtime:
+                    return self.speakers
+                
                 with open(speakers_file_path, 'r', encoding='utf-8') as f:
                     speakers_data = json.load(f)
                     
@@ -82,11 +99,14 @@ class VoAIService:
                 if 'data' in speakers_data and 'models' in speakers_data['data']:
                     all_speakers = []
                     for model in speakers_data['data']['models']:
+                        version = model.get('info', {}).get('version')
                         for speaker in model.get('speakers', []):
-                            all_speakers.append(speaker)
+                            all_speakers.append({**speaker, 'model': version})
                     
                     if all_speakers:
                         self.speakers = all_speakers
+                        self.speakers_source = "file"
+                        self._speakers_mtime = mtime
                         logger.info(f"✅ 從本地文件加載 {len(self.speakers)} 個 VoAI 發音人")
                         return self.speakers
         except Exception as e:
@@ -98,16 +118,17 @@ class VoAIService:
                 'x-api-key': self.api_key
             }
             
-            response = requests.get(f"{self.base_url}/TTS/GetSpeaker", headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    self.speakers = data.get('speakers', self.speakers)
-                    logger.info(f"✅ 從 API 獲取 {len(self.speakers)} 個 VoAI 發音人")
-                    return self.speakers
-            else:
-                logger.warning(f"獲取 VoAI speakers 失敗: {response.status_code}")
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+                async with session.get(f"{self.base_url}/TTS/GetSpeaker", headers=headers) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        if data.get('success'):
+                            self.speakers = data.get('speakers', self.speakers)
+                            self.speakers_source = "api"
+                            logger.info(f"✅ 從 API 獲取 {len(self.speakers)} 個 VoAI 發音人")
+                            return self.speakers
+                    else:
+                        logger.warning(f"獲取 VoAI speakers 失敗: {response.status}")
                 
         except Exception as e:
             logger.error(f"獲取 VoAI speakers 失敗: {e}")
@@ -115,6 +136,48 @@ class VoAIService:
         logger.info(f"使用預設的 {len(self.speakers)} 個 VoAI 發音人")
         return self.speakers
     
+    async def list_voices(self) -> Dict[str, Any]:
+        """
+        音色目錄 (供統一音色索引使用)
+        同一發音人在不同模型版本合併為一筆，風格另依模型版本保存 (model_styles)，
+        驗證時只接受請求模型版本支援的風格
+        """
+        speakers = await self._fetch_speakers()
+        
+        entries = {}
+        for speaker in speakers:
+            entry = entries.setdefault(speaker['name'], {
+                "id": speaker['name'],
+                "name": speaker['name'],
+                "languages": [speaker.get('language', 'zh-TW')],
+                "gender": speaker.get('gender'),
+                "styles": [],
+                "tags": [],
+                "models": [],
+                "model_styles": {},
+                "age": speaker.get('age'),
+                "category": speaker.get('category'),
+            })
+            for style in speaker.get('styles', []):
+                if style not in entry["styles"]:
+                    entry["styles"].append(style)
+            for tag in speaker.get('tags', []):
+                if tag not in entry["tags"] and tag != "未知":
+                    entry["tags"].append(tag)
+            if speaker.get('model'):
+                if speaker['model'] not in entry["models"]:
+                    entry["models"].append(speaker['model'])
+                model_styles = entry["model_styles"].setdefault(speaker['model'], [])
+                model_styles.extend(style for style in speaker.get('styles', []) if style not in model_styles)
+        
+        return {
+            "voices": list(entries.values()),
+            "authoritative": self.speakers_source in ("file", "api"),
+            "voice_key": "voice",
+            "constraints": {"model": "models"},
+            "scoped_constraints": {"style": {"by": "model", "field": "model_styles", "default": "Neo"}},
+        }
+    
     async def health_check(self) -> Dict[str, Any]:
         """健康檢查"""
         return {
@@ -125,6 +188,10 @@ class VoAIService:
             "speakers_count": len(self.speakers),
         }
     
+    async def estimate_cost(self, text: str, model: str = None) -> Dict[str, Any]:
+        """估算成本 (按字符計費)"""
+        return estimate_char_cost(text, self.price_per_1k_chars)
+    
     async def get_info(self) -> Dict[str, Any]:
         """獲取服務資訊"""
         return {
@@ -284,35 +351,43 @@ class VoAIService:
                 }
             
             headers = {
-                'x-output-format': 'wav',
+                'x-output-format': self.transfer_format,
                 'x-api-key': self.api_key,
                 'Content-Type': 'application/json'
             }
             
             logger.info(f"正在生成語音: {text[:50]}...")
             
-            response = requests.post(url, json=data, headers=headers)
+            # 使用非阻塞請求，客戶端斷線時可隨時取消
+            timeout = aiohttp.ClientTimeout(total=deadline.timeout(60, "VoAI API"))
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                submitted = time.monotonic()
+                async with session.post(url, json=data, headers=headers) as response:
+                    timing.record("submit", time.monotonic() - submitted)
+                    status = response.status
+                    content_type = response.headers.get('content-type', '')
+                    with timing.stage("download"):
+                        content = await response.read()
             
-            if response.status_code == 200:
+            if status == 200:
                 # 檢查回應是否為音頻文件
-                content_type = response.headers.get('content-type', '')
                 if 'audio' in content_type or 'wav' in content_type:
-                    logger.info(f"VoAI 語音生成成功，音頻大小: {len(response.content)} bytes")
-                    return response.content
+                    logger.info(f"VoAI 語音生成成功，音頻大小: {len(content)} bytes ({self.transfer_format})")
+                    return await decode_to_wav(content, self.transfer_format)
                 else:
                     # 可能是 JSON 錯誤回應
                     try:
-                        error_data = response.json()
+                        error_data = json.loads(content)
                         error_msg = error_data.get('message', '未知錯誤')
-                        raise Exception(f"VoAI API 錯誤: {error_msg}")
-                    except:
+                    except Exception:
                         raise Exception(f"VoAI API 回應格式錯誤")
+                    raise Exception(f"VoAI API 錯誤: {error_msg}")
             else:
                 try:
-                    error_data = response.json()
-                    error_msg = error_data.get('message', f"HTTP {response.status_code}")
-                except:
-                    error_msg = f"HTTP {response.status_code}"
+                    error_data = json.loads(content)
+                    error_msg = error_data.get('message', f"HTTP {status}")
+                except Exception:
+                    error_msg = f"HTTP {status}"
                     
                 raise Exception(f"VoAI API 請求失敗: {error_msg}")
                 
@@ -350,12 +425,12 @@ class VoAIService:
                 'x-api-key': self.api_key
             }
             
-            response = requests.get(f"{self.base_url}/Key/Usage", headers=headers)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"error": f"HTTP {response.status_code}"}
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+                async with session.get(f"{self.base_url}/Key/Usage", headers=headers) as response:
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    else:
+                        return {"error": f"HTTP {response.status}"}
                 
         except Exception as e:
             logger.error(f"檢查 VoAI 配額失敗: {e}")